@@ -1,8 +1,40 @@
 import streamlit as st
-from streamlit import switch_page
 from frontend.page_names import PageNames
+from frontend.components.rerun_profiler import rerun_profile_report
+from backend.database import init_database, request_scope
+from utils.metrics import is_metrics_server_enabled, get_metrics_server
+from utils.rerun_profiler import is_rerun_profiler_enabled, profile_rerun
+from utils.rerun_timing import time_page_run
+from utils.session_memory import track_session
 
-switch_page(PageNames.MAIN_DASHBOARD())
+init_database()
 
-# if st.button("Go to my vms", type="primary"):
-# 	switch_page(PageNames.MAIN_DASHBOARD())
\ No newline at end of file
+if is_metrics_server_enabled():
+	get_metrics_server()
+
+# Every page is registered here, the navigation menu is the custom one in the sidebar
+pages = {
+	page_entry.file_name: st.Page(
+		page_entry.file_name,
+		title=page_entry.label,
+		default=page_entry is PageNames.MAIN_DASHBOARD,
+	)
+	for page_entry in PageNames.all()
+}
+
+current_page = st.navigation(list(pages.values()), position="hidden")
+current_page_file = next(file_name for file_name, page in pages.items() if page is current_page)
+
+track_session()
+
+# A single database session for the whole run of the page
+with request_scope(current_page_file), time_page_run(current_page.title, current_page_file):
+	if is_rerun_profiler_enabled():
+		# Turned on by an admin for this session only, the other sessions run as usual
+		with profile_rerun(current_page_file) as rerun_profile:
+			current_page.run()
+
+		with st.expander(":material/speed: Profile of this rerun"):
+			rerun_profile_report(rerun_profile, key="rerun_profile_of_this_rerun")
+	else:
+		current_page.run()
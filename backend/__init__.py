@@ -1,2 +1,2 @@
 from .role import Role
-from .database import get_db, add_to_db, delete_from_db
\ No newline at end of file
+from .database import get_db, add_to_db, delete_from_db, database_action
@@ -1,9 +1,10 @@
 from typing import Optional, List
+from sqlalchemy import delete, update
 from sqlalchemy.exc import IntegrityError
 from streamlit_authenticator import RegisterError, UpdateError
 from streamlit_authenticator.utilities import Validator, Helpers
 
-from backend import Role, get_db, add_to_db, delete_from_db
+from backend import Role, get_db, add_to_db
 from backend.models import User, VirtualMachine, Bookmark
 from backend.authentication.authenticator_creation import get_or_create_authenticator_object
 from backend.authentication.authenticator_manipulation import add_new_user_to_authenticator_object, \
@@ -336,6 +337,20 @@ def disable_user(username: str, revert: bool = False):
 		remove_user_in_authenticator_object(username)
 
 
+def share_all_vms_of_user(user_id: int):
+	"""
+	Makes all the VMs of a user shared, with a single statement.
+	:param user_id: The id of the owner of the VMs
+	"""
+	with get_db() as db:
+		db.execute(
+			update(VirtualMachine)
+			.where(VirtualMachine.user_id == user_id, VirtualMachine.shared.is_(False))
+			.values(shared=True)
+		)
+		db.commit()
+
+
 def delete_user(username: str):
 	"""
 	Deletes a user from the database.
@@ -348,17 +363,10 @@ def delete_user(username: str):
 		if user is None:
 			raise UpdateError(f'User with username {username} does not exist')
 
-		# Delete VMs
-		user_vms = VirtualMachine.find_by_user_name(db, user.username)
-		for vm in user_vms:
-			delete_from_db(db, vm)
-
-		# Delete Bookmarks
-		user_bookmarks = Bookmark.find_by_user_name(db, user.username)
-		for bookmark in user_bookmarks:
-			delete_from_db(db, bookmark)
-
-		# Delete User
-		delete_from_db(db, user)
+		# Delete the VMs, the bookmarks and the user with a statement each, in a single transaction
+		db.execute(delete(VirtualMachine).where(VirtualMachine.user_id == user.id))
+		db.execute(delete(Bookmark).where(Bookmark.user_id == user.id))
+		db.execute(delete(User).where(User.id == user.id))
+		db.commit()
 
 		remove_user_in_authenticator_object(username)
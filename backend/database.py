@@ -1,36 +1,205 @@
+import threading
+import time
 import yaml
 import streamlit as st
 
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from contextvars import ContextVar
+from typing import Iterator
+from sqlalchemy import create_engine, event, Engine
 from sqlalchemy.orm import sessionmaker, Session
 from yaml import SafeLoader
 
 from backend.models import User, VirtualMachine, Bookmark
+from utils.metrics import current_finder_metrics
+from utils.query_log import BACKGROUND_PAGE, current_page_and_user, observe_statement, report_repeated_statements
 
 #################################
 #     DATABASE CREDENTIALS      #
 #################################
 
-db_username = st.secrets['db_username']
-db_password = st.secrets['db_password']
-db_address = st.secrets['db_address']
-db_port = st.secrets["db_port"]
-db_name = st.secrets['db_name']
-DATABASE_URL = f"postgresql+psycopg2://{db_username}:{db_password}@{db_address}:{db_port}/{db_name}"
+def get_database_url() -> str:
+	"""The URL of the database, from the secrets."""
+	db_username = st.secrets['db_username']
+	db_password = st.secrets['db_password']
+	db_address = st.secrets['db_address']
+	db_port = st.secrets["db_port"]
+	db_name = st.secrets['db_name']
+	return f"postgresql+psycopg2://{db_username}:{db_password}@{db_address}:{db_port}/{db_name}"
 
 ################################
 #       DATABASE SESSION       #
 ################################
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Created on the first use, not on import: importing `backend` must not need the secrets or the database.
+# They are not `st.cache_resource`, since the worker threads of the imports and the CLI use them too.
+_engine: Engine | None = None
+_session_factory: sessionmaker | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+	"""Returns the engine of the database, created on the first call."""
+	global _engine, _session_factory
+	if _engine is None:
+		with _engine_lock:
+			if _engine is None:
+				engine = create_engine(get_database_url())
+				event.listen(engine, "before_cursor_execute", _count_request_query)
+				event.listen(engine, "before_cursor_execute", _start_query_timer)
+				event.listen(engine, "after_cursor_execute", _observe_query)
+				_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+				_engine = engine
+	return _engine
+
+
+def new_session() -> Session:
+	"""Opens a new session of the database."""
+	get_engine()
+	return _session_factory()
+
+
+class RequestScope:
+	def __init__(self, page: str = None):
+		"""
+		The database state of a single script run: a session shared by everything that runs in it,
+		opened on the first use, and the queries sent to the database.
+		:param page: The page file the queries are attributed to, the one in the session state if `None`
+		"""
+		self.session: Session | None = None
+		self.queries = 0
+		self._loaded_objects = []
+
+		session_page, self.user = current_page_and_user()
+		self.page = page or session_page
+		self.action: str | None = None  # Set by `database_action`
+		self.statement_counts: dict[tuple[str | None, str], int] = {}  # By action and fingerprint
+
+	def get_session(self) -> Session:
+		if self.session is None:
+			self.session = new_session()
+			# The identity map only keeps weak references, the loaded objects must outlive the blocks that found them
+			event.listen(self.session, "loaded_as_persistent", self._keep_loaded_object)
+		return self.session
+
+	def _keep_loaded_object(self, session: Session, instance):
+		self._loaded_objects.append(instance)
+
+	def close(self):
+		if self.session is not None:
+			self.session.close()
+			self.session = None
+			self._loaded_objects.clear()
+		report_repeated_statements(self.page, self.user, self.statement_counts)
+		self.statement_counts.clear()
+
+
+_request_scope: ContextVar[RequestScope | None] = ContextVar("request_scope", default=None)
+
+
+def _count_request_query(conn, cursor, statement, parameters, context, executemany):
+	scope = _request_scope.get()
+	if scope is not None:
+		scope.queries += 1
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+	context.metrics_start = time.perf_counter()
+
+
+def _observe_query(conn, cursor, statement, parameters, context, executemany):
+	seconds = time.perf_counter() - context.metrics_start
+
+	# Labelled with the finder method that sent the query, if any
+	finder_metrics = current_finder_metrics()
+	finder_metrics.queries.inc()
+	finder_metrics.query_seconds.observe(seconds)
+
+	scope = _request_scope.get()
+	if scope is None:
+		observe_statement(statement, parameters, seconds, BACKGROUND_PAGE, None, None)
+		return
+
+	fingerprint = observe_statement(statement, parameters, seconds, scope.page, scope.action, scope.user)
+	key = (scope.action, fingerprint)
+	scope.statement_counts[key] = scope.statement_counts.get(key, 0) + 1
+
+
+@contextmanager
+def request_scope(page: str = None) -> Iterator[RequestScope]:
+	"""
+	Context manager to share a single database session in a script run, closed at its end.
+	Inside it, `get_db()` always provides the same session, so the objects already loaded in the run
+	are served by its identity map instead of new queries. Nested scopes reuse the outer one.
+	:param page: The page file the queries are attributed to, the one in the session state if `None`
+	"""
+	scope = _request_scope.get()
+	if scope is not None:
+		yield scope
+		return
+
+	scope = RequestScope(page)
+	token = _request_scope.set(scope)
+	try:
+		yield scope
+	finally:
+		_request_scope.reset(token)
+		scope.close()
+
+
+@contextmanager
+def database_action(name: str) -> Iterator[RequestScope]:
+	"""
+	Attributes the queries of a block to a user action (e.g. a button) in the query log, also as a decorator.
+	The widget callbacks run before the page, outside the scope of `app.py`: they get their own here.
+	"""
+	with request_scope() as scope:
+		previous_action = scope.action
+		scope.action = name
+		try:
+			yield scope
+		finally:
+			scope.action = previous_action
+
+
+def get_request_scope() -> RequestScope | None:
+	"""The scope of the current script run, or `None` outside a `request_scope`."""
+	return _request_scope.get()
+
+
+def get_request_db() -> Session:
+	"""
+	The session of the current script run, opened on the first call.
+	:raises RuntimeError: If called outside a `request_scope`.
+	"""
+	scope = _request_scope.get()
+	if scope is None:
+		raise RuntimeError("No database session outside a request scope.")
+	return scope.get_session()
 
 
 @contextmanager
 def get_db() -> Session:
-	"""Context manager to provide a database session."""
-	db = SessionLocal()
+	"""
+	Context manager to provide a database session.
+	In a `request_scope` it is the session of the script run, which is left open for the next users.
+	"""
+	scope = _request_scope.get()
+	if scope is not None:
+		db = scope.get_session()
+		try:
+			yield db
+		except Exception:
+			# The changes of a failed block must not be committed by the next one
+			db.rollback()
+			raise
+		finally:
+			# A failed flush would break the session for the rest of the run
+			if not db.is_active:
+				db.rollback()
+		return
+
+	db = new_session()
 	try:
 		yield db
 	finally:
@@ -62,6 +231,20 @@ def delete_from_db(db: Session, object_to_delete: VirtualMachine | Bookmark | Us
 #       Load Initial Users       #
 ##################################
 
+_database_initialized = False
+_init_lock = threading.Lock()
+
+
+def init_database():
+	"""Prepares the database for the app, only the first time it is called in the process (from `app.py`)."""
+	global _database_initialized
+	with _init_lock:
+		if _database_initialized:
+			return
+		load_initial_users()
+		_database_initialized = True
+
+
 def load_initial_users():
 	"""
     Loads initial users into the database from a YAML file if the users table is empty.
@@ -82,6 +265,3 @@ def load_initial_users():
 					db.add(new_user)
 					db.commit()
 					print("Added initial user:", new_user)
-
-
-load_initial_users()
@@ -1,6 +1,20 @@
+import threading
+
 import streamlit as st
 
 from cryptography.fernet import Fernet
 
-cipher_key = st.secrets["cipher_key"]
-cipher = Fernet(cipher_key)
\ No newline at end of file
+# Created on the first use, not on import: importing `backend` must not need the secrets.
+# It is not an `st.cache_resource`, since the worker threads of the imports use it too.
+_cipher: Fernet | None = None
+_cipher_lock = threading.Lock()
+
+
+def get_cipher() -> Fernet:
+	"""Returns the cipher of the VM credentials, created on the first call from `cipher_key` of the secrets."""
+	global _cipher
+	if _cipher is None:
+		with _cipher_lock:
+			if _cipher is None:
+				_cipher = Fernet(st.secrets["cipher_key"])
+	return _cipher
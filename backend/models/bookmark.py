@@ -3,10 +3,11 @@ from __future__ import annotations
 
 from typing import Type, cast, List
 from sqlalchemy import Column, Integer, String, ForeignKey
-from sqlalchemy.orm import relationship, Session
+from sqlalchemy.orm import relationship, Session, contains_eager, lazyload
 
 from .base_model import Base
 from backend.models import User
+from utils.metrics import observe_finder
 
 
 class Bookmark(Base):
@@ -38,6 +39,7 @@ class Bookmark(Base):
 	##############################
 
 	@staticmethod
+	@observe_finder
 	def find_all(db: Session,
 				 exclude_user_id: int = None,
 				 exclude_user_name: str = None,
@@ -61,6 +63,7 @@ class Bookmark(Base):
 
 
 	@staticmethod
+	@observe_finder
 	def find_by_id(db: Session, bookmark_id: int) -> Bookmark | None:
 		"""
 		Find a bookmark by its id.
@@ -68,12 +71,12 @@ class Bookmark(Base):
 		:param bookmark_id: The id of the bookmark
 		:return A bookmark if it has been found, otherwise `None`
 		"""
-		return (db.query(Bookmark)
-				.filter(Bookmark.id == bookmark_id)
-				.first())
+		# Served by the identity map of the session, if already loaded
+		return db.get(Bookmark, bookmark_id)
 
 
 	@staticmethod
+	@observe_finder
 	def find_by_user_id(db: Session, user_id: int) -> list[Bookmark]:
 		"""
 		Find all bookmarks in the database owned by a user with a specific id.
@@ -89,6 +92,7 @@ class Bookmark(Base):
 
 
 	@staticmethod
+	@observe_finder
 	def find_by_user_name(db: Session, user_name: str) -> list[Bookmark]:
 		"""
 		Find all bookmarks in the database owned by a user with a specific name.
@@ -96,8 +100,13 @@ class Bookmark(Base):
 		:param user_name: The username of the user
 		:return: A list of bookmarks owned by a user
 		"""
+		# The owner is loaded by the same join used to filter it, without its own VMs and bookmarks
 		query_result: list[Type[Bookmark]] = (db.query(Bookmark)
 				.join(Bookmark.user)
+				.options(contains_eager(Bookmark.user).options(
+					lazyload(User.virtual_machines),
+					lazyload(User.bookmarks)
+				))
 				.filter(User.username == user_name)
 				.all())
 
@@ -2,12 +2,30 @@ from __future__ import annotations
 # https://stackoverflow.com/a/55344418
 
 import bcrypt
-from typing import Type, List, cast
+from typing import Type, List, cast, NamedTuple
 from sqlalchemy import Column, Integer, String, Boolean
-from sqlalchemy.orm import relationship, Session
+from sqlalchemy.orm import relationship, Session, lazyload
 
 from .base_model import Base
 from backend.role import Role
+from utils.metrics import observe_finder, BCRYPT_IN_PROGRESS, BCRYPT_SECONDS
+
+# Where `find_by_user_name` remembers the id of each username, in the `info` of a session
+USER_IDS_BY_NAME_KEY = "user_ids_by_name"
+
+BCRYPT_HASH_SECONDS = BCRYPT_SECONDS.labels("hash")
+BCRYPT_CHECK_SECONDS = BCRYPT_SECONDS.labels("check")
+
+
+class UserSnapshot(NamedTuple):
+	"""The id and the displayed fields of a User, without the password hash, to keep in the session state."""
+	id: int
+	username: str
+	email: str
+	role: str
+	first_name: str
+	last_name: str
+	disabled: bool
 
 
 class User(Base):
@@ -45,9 +63,10 @@ class User(Base):
 
 		:return: The hashed password as a string.
 		"""
-		return bcrypt \
-			.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt()) \
-			.decode('utf-8')
+		with BCRYPT_IN_PROGRESS.track_in_progress(), BCRYPT_HASH_SECONDS.time():
+			return bcrypt \
+				.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt()) \
+				.decode('utf-8')
 
 
 	def verify_password(self, plain_password) -> bool:
@@ -56,13 +75,15 @@ class User(Base):
 
 		:return: True if the password matches, False otherwise.
 		"""
-		return bcrypt.checkpw(plain_password.encode('utf-8'), self.password.encode('utf-8'))
+		with BCRYPT_IN_PROGRESS.track_in_progress(), BCRYPT_CHECK_SECONDS.time():
+			return bcrypt.checkpw(plain_password.encode('utf-8'), self.password.encode('utf-8'))
 
 	##############################
 	#        FIND METHODS        #
 	##############################
 
 	@staticmethod
+	@observe_finder
 	def find_all(db: Session,
 				 disabled: bool = None,
 				 exclude_user_id: int = None,
@@ -97,19 +118,21 @@ class User(Base):
 
 
 	@staticmethod
-	def find_by_id(db: Session, user_id: int) -> User | None:
+	@observe_finder
+	def find_by_id(db: Session, user_id: int, load_relationships: bool = True) -> User | None:
 		"""
 		Find a user by its id.
 		:param db: The database session obtained with get_db()
 		:param user_id: The id of the user
+		:param load_relationships: Whether to load the VMs and the bookmarks of the user too, or only the user
 		:return A user if it has been found, otherwise `None`
 		"""
-		return (db.query(User)
-				.filter(User.id == user_id)
-				.first())
+		# Served by the identity map of the session, if already loaded
+		return db.get(User, user_id, options=[] if load_relationships else [lazyload("*")])
 
 
 	@staticmethod
+	@observe_finder
 	def find_by_user_name(db: Session, user_name: str) -> User | None:
 		"""
 		Find a user by its username.
@@ -117,12 +140,24 @@ class User(Base):
 		:param user_name: Username of the user
 		:return: A user if it has been found, otherwise `None`
 		"""
-		return (db.query(User)
+		# The usernames already found in this session are resolved by the identity map
+		user_ids = db.info.setdefault(USER_IDS_BY_NAME_KEY, {})
+		if user_name in user_ids:
+			user = db.get(User, user_ids[user_name])
+			if user is not None and user.username == user_name:
+				return user
+
+		user = (db.query(User)
 				.filter(User.username == user_name)
 				.first())
 
+		if user is not None:
+			user_ids[user_name] = user.id
+		return user
+
 
 	@staticmethod
+	@observe_finder
 	def find_by_email(db: Session, email: str) -> User | None:
 		"""
 		Find a user by its email.
@@ -136,6 +171,7 @@ class User(Base):
 
 
 	@staticmethod
+	@observe_finder
 	def find_by_role(db: Session, role: Role,
 					 exclude_user_id: int = None,
 					 exclude_user_name: str = None,
@@ -175,6 +211,18 @@ class User(Base):
 			'roles': self.role,
 		}
 
+	def to_snapshot(self) -> UserSnapshot:
+		"""Creates an immutable copy of the fields of this User, without the password hash."""
+		return UserSnapshot(
+			id=self.id,
+			username=self.username,
+			email=self.email,
+			role=self.role,
+			first_name=self.first_name,
+			last_name=self.last_name,
+			disabled=self.disabled,
+		)
+
 	def __str__(self):
 		return (f"User("
 				f"id={self.id}, "
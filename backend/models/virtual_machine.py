@@ -1,13 +1,30 @@
 from __future__ import annotations
 # https://stackoverflow.com/a/55344418
 
-from typing import Type, cast, List
-from sqlalchemy import Column, String, Integer, LargeBinary, ForeignKey, Boolean
-from sqlalchemy.orm import relationship, Session
+from typing import Type, cast, List, Literal, NamedTuple
+from sqlalchemy import Column, String, Integer, LargeBinary, ForeignKey, Boolean, and_, or_
+from sqlalchemy.orm import relationship, Session, contains_eager, lazyload
 
 from .base_model import Base
-from backend.fernet_encryption import cipher
+from backend.fernet_encryption import get_cipher
 from backend.models import User
+from utils.metrics import observe_finder
+
+VmScope = Literal["my_owned_vms", "my_assigned_vms", "all_owned_vms", "all_assigned_vms"]
+
+
+class VirtualMachineSnapshot(NamedTuple):
+	"""The id and the displayed fields of a Virtual Machine, without its credentials, to keep in the session state."""
+	id: int
+	name: str
+	host: str
+	port: int
+	username: str
+	shared: bool
+	assigned_to: str | None
+	user_id: int
+	has_password: bool
+	has_ssh_key: bool
 
 
 class VirtualMachine(Base):
@@ -47,11 +64,11 @@ class VirtualMachine(Base):
 	@staticmethod
 	def encrypt_key(key: bytes):
 		"""Encrypts an SSH Key."""
-		return cipher.encrypt(key)
+		return get_cipher().encrypt(key)
 
 	def decrypt_key(self):
 		"""Decrypts the SSH Key of this Virtual Machine."""
-		return cipher.decrypt(self.ssh_key)
+		return get_cipher().decrypt(self.ssh_key)
 
 	################################
 	# PASSWORD ENCRYPTION METHODS  #
@@ -60,13 +77,13 @@ class VirtualMachine(Base):
 	@staticmethod
 	def encrypt_password(password: str):
 		"""Encrypts a plain password."""
-		return cipher \
+		return get_cipher() \
 			.encrypt(password.encode('utf-8')) \
 			.decode('utf-8')
 
 	def decrypt_password(self):
 		"""Decrypts the password of this Virtual Machine."""
-		return cipher \
+		return get_cipher() \
 			.decrypt(self.password.encode('utf-8')) \
 			.decode('utf-8')
 
@@ -75,6 +92,7 @@ class VirtualMachine(Base):
 	##############################
 
 	@staticmethod
+	@observe_finder
 	def find_all(db: Session,
 				 shared: bool = None,
 				 assigned_to: bool = None,
@@ -112,19 +130,21 @@ class VirtualMachine(Base):
 
 
 	@staticmethod
-	def find_by_id(db: Session, vm_id: int) -> VirtualMachine | None:
+	@observe_finder
+	def find_by_id(db: Session, vm_id: int, load_relationships: bool = True) -> VirtualMachine | None:
 		"""
 		Find a virtual machine by its id.
 		:param db: The database session obtained with get_db()
 		:param vm_id: The id of the virtual machine
+		:param load_relationships: Whether to load the owner too, or only the virtual machine
 		:return A virtual machine if it has been found, otherwise `None`
 		"""
-		return (db.query(VirtualMachine)
-				.filter(VirtualMachine.id == vm_id)
-				.first())
+		# Served by the identity map of the session, if already loaded
+		return db.get(VirtualMachine, vm_id, options=[] if load_relationships else [lazyload("*")])
 
 
 	@staticmethod
+	@observe_finder
 	def find_by_user_id(db: Session, user_id: int, shared: bool = None) -> list[VirtualMachine]:
 		"""
 		Find all virtual machines in the database owned by a user with a specific id.
@@ -146,6 +166,7 @@ class VirtualMachine(Base):
 
 
 	@staticmethod
+	@observe_finder
 	def find_by_user_name(db: Session, user_name: str, shared: bool = None, exclude_assigned_to: bool = False) -> list[VirtualMachine]:
 		"""
 		Find all virtual machines in the database owned by a user with a specific name.
@@ -172,6 +193,7 @@ class VirtualMachine(Base):
 
 
 	@staticmethod
+	@observe_finder
 	def find_by_assigned_to(db: Session, user_name: str) -> list[VirtualMachine]:
 		"""
 		Find all virtual machines in the database assigned to a user with a specific username.
@@ -188,10 +210,72 @@ class VirtualMachine(Base):
 		return cast(List[VirtualMachine], query_result)
 
 
+	@staticmethod
+	@observe_finder
+	def find_by_scopes(db: Session, user_name: str, scopes: list[VmScope]) -> list[tuple[VirtualMachine, set[VmScope]]]:
+		"""
+		Find the virtual machines in some scopes with a single query, each one tagged with the scopes it is in:
+		- "my_owned_vms": Owned by the user and not assigned to anyone
+		- "my_assigned_vms": Assigned to the user
+		- "all_owned_vms": Shared by the other users and not assigned to anyone
+		- "all_assigned_vms": Assigned to anyone
+		:param db: The database session obtained with get_db()
+		:param user_name: The username of the user
+		:param scopes: The scopes to search, a virtual machine is found if it is in at least one of them
+		:return: A list of virtual machines, each with the set of the scopes it is in
+		"""
+		if not scopes:
+			return []
+
+		conditions = {
+			"my_owned_vms": and_(User.username == user_name, VirtualMachine.assigned_to.is_(None)),
+			"my_assigned_vms": VirtualMachine.assigned_to == user_name,
+			"all_owned_vms": and_(
+				User.username != user_name,
+				VirtualMachine.shared == True,
+				VirtualMachine.assigned_to.is_(None)
+			),
+			"all_assigned_vms": VirtualMachine.assigned_to.isnot(None),
+		}
+		try:
+			selected_conditions = {scope: conditions[scope] for scope in scopes}
+		except KeyError as e:
+			raise ValueError(f"Invalid vm search scope {e}.")
+
+		# The owners are loaded by the same join used to filter them, without their own VMs and bookmarks
+		query = (db.query(VirtualMachine, *[condition.label(scope) for scope, condition in selected_conditions.items()])
+				 .join(VirtualMachine.user)
+				 .options(contains_eager(VirtualMachine.user).options(
+					 lazyload(User.virtual_machines),
+					 lazyload(User.bookmarks)
+				 ))
+				 .filter(or_(*selected_conditions.values())))
+
+		result = []
+		for vm, *in_scopes in query.all():
+			result.append((vm, {scope for scope, in_scope in zip(selected_conditions, in_scopes) if in_scope}))
+		return result
+
+
 	################################
 	#        OTHER METHODS         #
 	################################
 
+	def to_snapshot(self) -> VirtualMachineSnapshot:
+		"""Creates an immutable copy of the fields of this Virtual Machine, without the credentials."""
+		return VirtualMachineSnapshot(
+			id=self.id,
+			name=self.name,
+			host=self.host,
+			port=self.port,
+			username=self.username,
+			shared=self.shared,
+			assigned_to=self.assigned_to,
+			user_id=self.user_id,
+			has_password=self.password is not None,
+			has_ssh_key=self.ssh_key is not None,
+		)
+
 	def __str__(self):
 		return (f"VirtualMachine("
 				f"id={self.id}, "
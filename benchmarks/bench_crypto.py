@@ -0,0 +1,46 @@
+"""
+Micro-benchmarks of the encryption of the VM credentials (Fernet) and of the hashing of the user passwords (bcrypt).
+They only need `cipher_key` in `.streamlit/secrets.toml`, not the database.
+See `conftest.py` for how to run them and compare them with the baselines.
+"""
+import random
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from backend.models import User, VirtualMachine
+from benchmarks.synthetic_data import random_ssh_key
+
+PASSWORD = "correct horse battery staple"
+SSH_KEY = random_ssh_key(random.Random(0))
+
+# bcrypt takes a quarter of a second on purpose: a few rounds are enough, and keep the suite short
+BCRYPT_ROUNDS = 5
+
+
+def test_encrypt_password(benchmark):
+	benchmark(VirtualMachine.encrypt_password, PASSWORD)
+
+
+def test_decrypt_password(benchmark):
+	vm = VirtualMachine(password=VirtualMachine.encrypt_password(PASSWORD))
+	assert benchmark(vm.decrypt_password) == PASSWORD
+
+
+def test_encrypt_key(benchmark):
+	benchmark(VirtualMachine.encrypt_key, SSH_KEY)
+
+
+def test_decrypt_key(benchmark):
+	vm = VirtualMachine(ssh_key=VirtualMachine.encrypt_key(SSH_KEY))
+	assert benchmark(vm.decrypt_key) == SSH_KEY
+
+
+def test_hash_password(benchmark):
+	benchmark.pedantic(User.hash_password, args=(PASSWORD,), rounds=BCRYPT_ROUNDS)
+
+
+def test_verify_password(benchmark):
+	user = User(password=User.hash_password(PASSWORD))
+	assert benchmark.pedantic(user.verify_password, args=(PASSWORD,), rounds=BCRYPT_ROUNDS)
@@ -0,0 +1,88 @@
+"""
+Micro-benchmarks of the find methods of the models and of the rows of the VM tables, on the synthetic data.
+See `conftest.py` for how to run them and compare them with the baselines.
+"""
+import inspect
+from typing import Callable
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from backend.database import get_db
+from backend.models import User, VirtualMachine, Bookmark
+from backend.role import Role
+from benchmarks.synthetic_data import SyntheticDataset
+from utils.refresh_db_functions import build_vm_dict
+
+ALL_SCOPES = ["my_owned_vms", "my_assigned_vms", "all_owned_vms", "all_assigned_vms"]
+
+# The arguments of each find method, the same the pages use, for the sampled users of the synthetic data
+FINDER_CASES: dict[str, Callable[[SyntheticDataset], tuple[Callable, dict]]] = {
+	"User.find_all": lambda data: (User.find_all, {"exclude_user_roles": [Role.ADMIN]}),
+	"User.find_by_id": lambda data: (User.find_by_id, {"user_id": data.user_ids[Role.ADMIN]}),
+	"User.find_by_user_name": lambda data: (User.find_by_user_name, {"user_name": data.usernames[Role.REGULAR]}),
+	"User.find_by_email": lambda data: (User.find_by_email, {"email": data.emails[Role.REGULAR]}),
+	"User.find_by_role": lambda data: (User.find_by_role, {"role": Role.REGULAR}),
+	"VirtualMachine.find_all": lambda data: (VirtualMachine.find_all, {"shared": True}),
+	"VirtualMachine.find_by_id": lambda data: (VirtualMachine.find_by_id, {"vm_id": data.vm_id}),
+	"VirtualMachine.find_by_user_id": lambda data: (
+		VirtualMachine.find_by_user_id, {"user_id": data.user_ids[Role.MANAGER]}
+	),
+	"VirtualMachine.find_by_user_name": lambda data: (
+		VirtualMachine.find_by_user_name, {"user_name": data.usernames[Role.MANAGER], "exclude_assigned_to": True}
+	),
+	"VirtualMachine.find_by_assigned_to": lambda data: (
+		VirtualMachine.find_by_assigned_to, {"user_name": data.usernames[Role.REGULAR]}
+	),
+	"VirtualMachine.find_by_scopes": lambda data: (
+		VirtualMachine.find_by_scopes, {"user_name": data.usernames[Role.ADMIN], "scopes": ALL_SCOPES}
+	),
+	"Bookmark.find_all": lambda data: (Bookmark.find_all, {}),
+	"Bookmark.find_by_id": lambda data: (Bookmark.find_by_id, {"bookmark_id": data.bookmark_id}),
+	"Bookmark.find_by_user_id": lambda data: (Bookmark.find_by_user_id, {"user_id": data.user_ids[Role.REGULAR]}),
+	"Bookmark.find_by_user_name": lambda data: (
+		Bookmark.find_by_user_name, {"user_name": data.usernames[Role.REGULAR]}
+	),
+}
+
+
+def in_new_session(finder: Callable, **kwargs):
+	"""
+	Calls a find method in a new session, like the first call of a rerun:
+	the identity map is empty, so the rows are always queried and loaded.
+	"""
+	with get_db() as db:
+		return finder(db, **kwargs)
+
+
+@pytest.mark.parametrize("case", FINDER_CASES)
+def test_finder(benchmark, synthetic_dataset, case):
+	finder, kwargs = FINDER_CASES[case](synthetic_dataset)
+	benchmark.extra_info["synthetic_vms"] = synthetic_dataset.vms
+
+	found = benchmark(in_new_session, finder, **kwargs)
+	assert found
+
+
+def test_every_finder_is_benchmarked():
+	finders = {
+		f"{model.__name__}.{name}"
+		for model in (User, VirtualMachine, Bookmark)
+		for name, _ in inspect.getmembers(model, inspect.isfunction)
+		if name.startswith("find_")
+	}
+	assert finders == set(FINDER_CASES)
+
+
+def test_build_vm_dict(benchmark, synthetic_dataset):
+	"""The rows of the VM tables of an admin, who sees every scope, from VMs already loaded."""
+	username = synthetic_dataset.usernames[Role.ADMIN]
+	benchmark.extra_info["synthetic_vms"] = synthetic_dataset.vms
+
+	# The session stays open, the rows read the owners loaded with the VMs
+	with get_db() as db:
+		vms = [vm for vm, _ in VirtualMachine.find_by_scopes(db, username, ALL_SCOPES)]
+		rows = benchmark(lambda: [build_vm_dict(vm, username) for vm in vms])
+
+	assert len(rows) == len(vms)
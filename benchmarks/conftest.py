@@ -0,0 +1,36 @@
+"""
+Fixtures of the micro-benchmarks of `bench_*.py`, run with pytest-benchmark (`pip install pytest-benchmark`).
+
+The benchmarks of the models run on the synthetic data of `synthetic_data.py`, in the database of
+`.streamlit/secrets.toml`: it must be a local one, the synthetic rows are replaced at the start of the session.
+
+Usage (from the repository root):
+	python -m pytest benchmarks -o python_files="bench_*.py" --synthetic-scale 10000 \
+		--benchmark-storage=benchmarks/baselines --benchmark-autosave
+	python -m pytest benchmarks -o python_files="bench_*.py" --synthetic-scale 10000 \
+		--benchmark-storage=benchmarks/baselines --benchmark-compare --benchmark-compare-fail=median:25%
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_data import (DEFAULT_SETTINGS, SyntheticDataSettings, generate_synthetic_data,
+									   load_synthetic_dataset)
+
+
+def pytest_addoption(parser):
+	parser.addoption("--synthetic-scale", type=int, default=DEFAULT_SETTINGS.scale,
+					 help="VMs of the synthetic data of the benchmarks, e.g. 1000, 10000 or 100000")
+	parser.addoption("--reuse-synthetic-data", action="store_true",
+					 help="Benchmark the synthetic data already in the database, instead of generating it again")
+
+
+@pytest.fixture(scope="session")
+def synthetic_dataset(request):
+	"""The synthetic data of the benchmarks, generated once for the whole session."""
+	if not request.config.getoption("--reuse-synthetic-data"):
+		generate_synthetic_data(SyntheticDataSettings(scale=request.config.getoption("--synthetic-scale")))
+	return load_synthetic_dataset()
@@ -0,0 +1,124 @@
+"""
+Benchmark of the render time of the interactive data table, in the "widgets" and in the "grid" render modes.
+
+Each table is run as a Streamlit script with `AppTest`, which executes the script and collects the elements
+it sends to the browser, so the times include the building of every element, not the drawing in the browser.
+The number of elements sent is reported too, since it is what the browser has to draw.
+
+Usage (from the repository root):
+	python benchmarks/data_table_benchmark.py --rows 100 1000 10000 --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The component is loaded from its file, so that the `frontend` package (and the database) is not imported
+TABLE_SCRIPT = """
+import importlib.util
+import sys
+
+sys.path.insert(0, {repository_root!r})
+
+spec = importlib.util.spec_from_file_location(
+	"interactive_data_table", {component_path!r}
+)
+component = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(component)
+
+data = [
+	{{
+		"name": f"vm-{{index}}",
+		"host_complete": f":blue[10.0.{{index // 256 % 256}}.{{index % 256}}] : :red[22]",
+		"username": "student",
+		"shared": ":heavy_check_mark: Yes" if index % 2 else ":x: No",
+		"auth": ":material/password: Password",
+		"buttons_disabled": {{}},
+	}}
+	for index in range({rows})
+]
+
+component.interactive_data_table(
+	key="benchmark_table",
+	data=data,
+	column_settings={{
+		"Name": {{"data_name": "name"}},
+		"Host": {{"data_name": "host_complete"}},
+		"Username": {{"data_name": "username"}},
+		"Is Shared": {{"data_name": "shared"}},
+		"Auth": {{"data_name": "auth"}},
+	}},
+	button_settings={{
+		"Connect": {{"primary": True, "icon": ":material/arrow_forward:"}},
+		"Edit": {{"icon": ":material/edit:"}},
+		"Delete": {{"icon": ":material/delete:"}},
+	}},
+	action_header_name=None,
+	popover_settings={popover_settings!r},
+	render_mode={render_mode!r},
+)
+"""
+
+
+def count_elements(node) -> int:
+	children = getattr(node, "children", None)
+	if not children:
+		return 1
+	return 1 + sum(count_elements(child) for child in children.values())
+
+
+def measure(rows: int, render_mode: str, popover: bool, runs: int, timeout: float) -> dict:
+	script = TABLE_SCRIPT.format(
+		repository_root=REPOSITORY_ROOT,
+		component_path=os.path.join(REPOSITORY_ROOT, "frontend", "components", "interactive_data_table.py"),
+		rows=rows,
+		render_mode=render_mode,
+		popover_settings={"text": "View"} if popover else None,
+	)
+
+	app = AppTest.from_string(script, default_timeout=timeout)
+	app.secrets["data_table_grid_threshold"] = 200
+
+	times = []
+	for _ in range(runs):
+		start = time.perf_counter()
+		app.run()
+		times.append(time.perf_counter() - start)
+
+	if app.exception:
+		raise RuntimeError(app.exception[0].message)
+
+	return {
+		"rows": rows,
+		"render_mode": render_mode,
+		"first_run_ms": round(times[0] * 1000, 1),
+		"rerun_median_ms": round(statistics.median(times[1:] or times) * 1000, 1),
+		"elements": count_elements(app._tree),
+		"buttons": len(app.button),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000], help="Table sizes")
+	parser.add_argument("--runs", type=int, default=3, help="Runs of each table, the first one included")
+	parser.add_argument("--popover", action="store_true", help="Put the buttons of each row in a popover")
+	parser.add_argument("--timeout", type=float, default=600, help="Seconds before a run is aborted")
+	args = parser.parse_args()
+
+	results = []
+	for rows in args.rows:
+		for render_mode in ("widgets", "grid"):
+			results.append(measure(rows, render_mode, args.popover, args.runs, args.timeout))
+			print(json.dumps(results[-1]), flush=True)
+
+	print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+	main()
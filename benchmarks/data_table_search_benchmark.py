@@ -0,0 +1,138 @@
+"""
+Benchmark of the search and the sorting of the interactive data table: the index against the scan of every row,
+and the cached column ranks against sorting the row dicts, on tables of VM-like rows.
+
+Usage (from the repository root):
+	python benchmarks/data_table_search_benchmark.py --rows 50000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_table_index import DataTableIndex
+
+DATA_NAMES = ["name", "owner", "host_complete", "username", "shared", "auth"]
+QUERIES = ["vm-4", "alice", "10.0.3", "bob key", "student password", "web 12", "nothing-matches"]
+
+
+class BenchObject:
+	def __init__(self, object_id: int):
+		self.id = object_id
+
+
+def generate_rows(count: int, seed: int = 0) -> list[dict]:
+	rng = random.Random(seed)
+	owners = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi"]
+	prefixes = ["vm", "web", "db", "lab", "gpu"]
+	return [
+		{
+			"original_object": BenchObject(index),
+			"name": f"{rng.choice(prefixes)}-{index}",
+			"owner": rng.choice(owners),
+			"host_complete": f":blue[10.0.{index // 256 % 256}.{index % 256}] : :red[{rng.choice([22, 2222])}]",
+			"username": rng.choice(["student", "root", "ubuntu"]),
+			"shared": ":heavy_check_mark: Yes" if rng.random() < 0.5 else ":x: No",
+			"auth": rng.choice([":material/key: SSH Key", ":material/password: Password"]),
+		}
+		for index in range(count)
+	]
+
+
+def scan_search(data: list[dict], query: str) -> list[int]:
+	"""The search before the index: a column at a time, lowering every value on every search."""
+	return [
+		data_index for data_index, data_row in enumerate(data)
+		if any(query.lower() in str(data_row[data_name]).lower() for data_name in DATA_NAMES)
+	]
+
+
+def timed(function) -> float:
+	start = time.perf_counter()
+	function()
+	return time.perf_counter() - start
+
+
+def median_ms(function, repeat: int) -> float:
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		function()
+		times.append(time.perf_counter() - start)
+	return round(statistics.median(times) * 1000, 3)
+
+
+def run_benchmark(rows: int, repeat: int, changed_fraction: float) -> dict:
+	data = generate_rows(rows)
+	index = DataTableIndex(DATA_NAMES)
+
+	start = time.perf_counter()
+	index.update(data)
+	build_ms = round((time.perf_counter() - start) * 1000, 1)
+
+	# Same rows in new dicts, like the copies returned by st.cache_data on every rerun
+	copies = [dict(data_row) for data_row in data]
+	unchanged_update_ms = median_ms(lambda: index.update(copies), repeat)
+
+	changed = [dict(data_row) for data_row in data]
+	for data_index in random.Random(1).sample(range(rows), int(rows * changed_fraction)):
+		changed[data_index]["owner"] = "mallory"
+	start = time.perf_counter()
+	index.update(changed)
+	changed_update_ms = round((time.perf_counter() - start) * 1000, 1)
+
+	queries = {}
+	for query in QUERIES:
+		index._prefix_cache.clear()
+		queries[query] = {
+			"matches": len(index.search(query)),
+			"index_first_ms": median_ms(lambda: (index._prefix_cache.clear(), index.search(query)), repeat),
+			"index_cached_ms": median_ms(lambda: index.search(query), repeat),
+			"single_column_ms": median_ms(lambda: index.search(query, "name"), repeat),
+			"scan_ms": median_ms(lambda: scan_search(changed, query), max(1, repeat // 10)),
+		}
+
+	sorting = {
+		"first_sort_by_owner_ms": round(timed(lambda: index.sort(range(rows), [("owner", False)])) * 1000, 2),
+		"cached_sort_by_owner_ms": median_ms(lambda: index.sort(range(rows), [("owner", False)]), repeat),
+		"first_sort_by_owner_and_name_ms": round(
+			timed(lambda: index.sort(range(rows), [("owner", False), ("name", True)])) * 1000, 2
+		),
+		"cached_sort_by_owner_and_name_ms": median_ms(
+			lambda: index.sort(range(rows), [("owner", False), ("name", True)]), repeat
+		),
+		"sort_search_result_ms": median_ms(lambda: index.sort(index.search("student"), [("host_complete", True)]), repeat),
+		"dict_sort_by_owner_and_name_ms": median_ms(
+			lambda: sorted(changed, key=lambda data_row: (str(data_row["owner"]).lower(), str(data_row["name"]).lower())),
+			max(1, repeat // 10)
+		),
+	}
+
+	return {
+		"rows": rows,
+		"build_ms": build_ms,
+		"update_unchanged_ms": unchanged_update_ms,
+		"update_changed_ms": changed_update_ms,
+		"changed_rows": int(rows * changed_fraction),
+		"queries": queries,
+		"sorting": sorting,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=50000, help="Rows of the table")
+	parser.add_argument("--repeat", type=int, default=20, help="Runs of each measure, the median is reported")
+	parser.add_argument("--changed-fraction", type=float, default=0.01, help="Rows changed before the update")
+	args = parser.parse_args()
+
+	print(json.dumps(run_benchmark(args.rows, args.repeat, args.changed_fraction), indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,628 @@
+"""
+Load test of the app, with simulated users that follow the flows of their role at the same time, each in its own session.
+
+The users are WebSocket clients that talk to a `streamlit run app.py` server like the browser does: they send the
+values of the widgets and wait until the runs of the script that they trigger are finished (the reruns of
+`st.switch_page` and `st.rerun` included). The time of a step is the time a user waits for the page, without the
+drawing in the browser.
+
+The flow of every user, repeated for each iteration in a new session:
+- All the roles: open the app, login, search a VM, refresh the table, connect to the VM and go back to the dashboard
+- Sidekick, manager and admin: open the details of one of their VMs and edit it
+
+The server is started by the harness with the secrets of `.streamlit/secrets.toml`. Its database must be a local one
+with the schema of `init-db.sql`, never the production one: the users `loadtest_*`, their VMs and their bookmarks are
+created again at every start (the other rows are not touched). The VMs point to an SSH server stand-in, and the SSH
+and SFTP modules are replaced by a stub, both run by the harness.
+
+The report has the p50/p95/p99 of every step, the errors, and the CPU and memory (RSS) of the server process read
+from `/proc` (Linux only). It is printed as JSON, with the commit, to compare the results across commits.
+The exit status is 1 if a step has failed.
+
+Usage (from the repository root):
+	python benchmarks/load_test.py --users 20 --iterations 3
+	python benchmarks/load_test.py --users 100 --mix regular=70,sidekick=20,manager=8,admin=2 --ramp-up 30 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import toml
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.role import Role
+from benchmarks.startup_benchmark import REPOSITORY_ROOT, free_port
+from benchmarks.terminal_bridge_benchmark import BENCH_USERNAME, BENCH_PASSWORD, start_ssh_stand_in, percentile
+
+LOAD_TEST_PREFIX = "loadtest_"
+LOAD_TEST_PASSWORD = "loadtest"
+# Owns the VMs assigned to the simulated users, it does not log in
+ASSIGNING_USERNAME = f"{LOAD_TEST_PREFIX}owner"
+
+DEFAULT_MIX = "regular=70,sidekick=15,manager=10,admin=5"
+BOOKMARKS_PER_USER = 3
+
+# The URL path of the default page of `st.navigation`, the dashboard (`my_vms.py`)
+DASHBOARD_PAGE = ""
+
+SCRIPT_FINISHED_EARLY_FOR_RERUN = ForwardMsg.ScriptFinishedStatus.FINISHED_EARLY_FOR_RERUN
+
+
+################################
+#     SEEDING AND STAND-INS    #
+################################
+
+def load_test_username(role: Role, index: int) -> str:
+	return f"{LOAD_TEST_PREFIX}{role.value}_{index}"
+
+
+def load_test_vm_name(username: str, index: int) -> str:
+	return f"{username.removeprefix(LOAD_TEST_PREFIX)}-vm-{index}"
+
+
+def seed_database(users_by_role: dict[Role, int], vms_per_user: int, ssh_port: int):
+	"""
+	Creates the users of the load test again, with their VMs on the SSH server stand-in and their bookmarks.
+	The sidekicks and the regular users have VMs assigned to them too, like the students of a course.
+	"""
+	# Imported here, so that `--help` works without a database
+	from sqlalchemy import delete, select
+	from backend.database import get_db
+	from backend.models import User, VirtualMachine, Bookmark
+
+	# A single hash for everyone, bcrypt is slow on purpose
+	password_hash = User.hash_password(LOAD_TEST_PASSWORD)
+	vm_password = VirtualMachine.encrypt_password(BENCH_PASSWORD)
+
+	def new_user(username: str, role: Role) -> User:
+		return User(username=username, password=password_hash, email=f"{username}@loadtest.invalid",
+					first_name="Load", last_name="Test", role=role.value)
+
+	def new_vm(owner: User, name: str, assigned_to: str = None) -> VirtualMachine:
+		return VirtualMachine(name=name, host="127.0.0.1", port=ssh_port, username=BENCH_USERNAME,
+							  password=vm_password, shared=True, assigned_to=assigned_to, user=owner)
+
+	with get_db() as db:
+		previous_user_ids = select(User.id).where(User.username.startswith(LOAD_TEST_PREFIX))
+		db.execute(delete(VirtualMachine).where(VirtualMachine.user_id.in_(previous_user_ids)))
+		db.execute(delete(Bookmark).where(Bookmark.user_id.in_(previous_user_ids)))
+		db.execute(delete(User).where(User.username.startswith(LOAD_TEST_PREFIX)))
+
+		owner = new_user(ASSIGNING_USERNAME, Role.ADMIN)
+		db.add(owner)
+		for role, count in users_by_role.items():
+			for index in range(count):
+				username = load_test_username(role, index)
+				user = new_user(username, role)
+				db.add(user)
+
+				for vm_index in range(vms_per_user):
+					vm_name = load_test_vm_name(username, vm_index)
+					if role in (Role.REGULAR, Role.SIDEKICK):
+						db.add(new_vm(owner, f"{vm_name}-assigned", assigned_to=username))
+					if role != Role.REGULAR:
+						db.add(new_vm(user, vm_name))
+
+				if role != Role.REGULAR:
+					for bookmark_index in range(BOOKMARKS_PER_USER):
+						db.add(Bookmark(name=f"Bookmark {bookmark_index}", link="https://example.com", user=user))
+		db.commit()
+
+
+class ModuleStubHandler(BaseHTTPRequestHandler):
+	"""Answers like the SSH and SFTP modules: every connection is created, and every connection is alive."""
+
+	def do_POST(self):
+		self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		self._send_json({"success": True, "connection_uuid": str(uuid.uuid4())})
+
+	def do_GET(self):
+		self._send_json({"success": True})
+
+	def _send_json(self, body: dict):
+		payload = json.dumps(body).encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(payload)))
+		self.end_headers()
+		self.wfile.write(payload)
+
+	def log_message(self, format, *args):
+		pass  # One line for each request would flood the output
+
+
+def start_module_stub() -> int:
+	"""Starts the stub of the modules on a free local port and returns the port."""
+	server = ThreadingHTTPServer(("127.0.0.1", 0), ModuleStubHandler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server.server_address[1]
+
+
+################################
+#            SERVER            #
+################################
+
+def write_server_directory(module_port: int) -> str:
+	"""
+	Writes the configuration and the secrets of the app, with the modules replaced by the stub, in a new directory:
+	the server is started from it, since Streamlit reads `.streamlit/secrets.toml` from the working directory.
+	"""
+	with open(os.path.join(REPOSITORY_ROOT, ".streamlit", "secrets.toml")) as file:
+		secrets = toml.load(file)
+
+	for module_type in ("ssh", "sftp"):
+		for secret in (f"{module_type}_module_endpoints", f"{module_type}_liveness_request_format",
+					   f"{module_type}_health_request_format"):
+			secrets.pop(secret, None)
+		secrets[f"{module_type}_module_url"] = "http://127.0.0.1"
+		secrets[f"{module_type}_module_port"] = str(module_port)
+	secrets["ssh_credentials_request_format"] = "$SSH_URL:$SSH_PORT/create-credentials"
+	secrets["sftp_credentials_request_format"] = "$SFTP_URL:$SFTP_PORT/api/sftp/credentials/create"
+	secrets["ssh_connection_request_format"] = "$SSH_URL:$SSH_PORT/?connection=$CONNECTION_ID"
+	secrets["sftp_connection_request_format"] = "$SFTP_URL:$SFTP_PORT/?connection=$CONNECTION_ID"
+	secrets["terminal_backend"] = "modules"
+
+	server_directory = tempfile.mkdtemp(prefix="vm_lab_load_test_")
+	os.makedirs(os.path.join(server_directory, ".streamlit"))
+	shutil.copy(os.path.join(REPOSITORY_ROOT, ".streamlit", "config.toml"), os.path.join(server_directory, ".streamlit"))
+	with open(os.path.join(server_directory, ".streamlit", "secrets.toml"), "w") as file:
+		toml.dump(secrets, file)
+	return server_directory
+
+
+def start_server(server_directory: str, port: int, timeout: float) -> subprocess.Popen:
+	"""Starts `streamlit run app.py` from the server directory, and waits for its health endpoint."""
+	log_file = open(os.path.join(server_directory, "server.log"), "w")
+	server = subprocess.Popen(
+		[sys.executable, "-m", "streamlit", "run", os.path.join(REPOSITORY_ROOT, "app.py"),
+		 "--server.headless", "true", "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+		cwd=server_directory,
+		stdout=log_file,
+		stderr=subprocess.STDOUT,
+	)
+
+	start = time.perf_counter()
+	while time.perf_counter() - start < timeout:
+		if server.poll() is not None:
+			break
+		try:
+			with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+				if response.status == 200:
+					return server
+		except OSError:
+			time.sleep(0.1)
+
+	server.terminate()
+	server.wait()
+	with open(log_file.name) as file:
+		raise RuntimeError(f"The server was not ready after {timeout} seconds:\n{file.read()[-2000:]}")
+
+
+class ProcessMonitor:
+	def __init__(self, pid: int, interval: float = 0.5):
+		"""
+		Samples the CPU time and the resident memory of a process from `/proc` at a fixed interval.
+		:param pid: The process to sample, the server
+		:param interval: Seconds between two samples
+		"""
+		self.pid = pid
+		self.interval = interval
+		self._clock_ticks = os.sysconf("SC_CLK_TCK")
+		self._page_size = os.sysconf("SC_PAGE_SIZE")
+		self._samples: list[tuple[float, float, int]] = []  # Wall time, CPU seconds, RSS bytes
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._sample_loop, name="process-monitor", daemon=True)
+
+	def _sample(self) -> tuple[float, float, int]:
+		with open(f"/proc/{self.pid}/stat") as file:
+			# The name of the command is between parentheses and may contain spaces
+			fields = file.read().rsplit(")", 1)[1].split()
+		with open(f"/proc/{self.pid}/statm") as file:
+			resident_pages = int(file.read().split()[1])
+		cpu_seconds = (int(fields[11]) + int(fields[12])) / self._clock_ticks  # utime and stime
+		return time.perf_counter(), cpu_seconds, resident_pages * self._page_size
+
+	def _sample_loop(self):
+		while not self._stop.wait(self.interval):
+			try:
+				self._samples.append(self._sample())
+			except OSError:
+				return  # The process has exited
+
+	def start(self):
+		self._samples.append(self._sample())
+		self._thread.start()
+
+	def stop(self) -> dict:
+		"""Stops the sampling and summarizes it, the CPU is in percent of one core."""
+		self._stop.set()
+		self._thread.join()
+		self._samples.append(self._sample())
+
+		(start, start_cpu, start_rss), (end, end_cpu, _) = self._samples[0], self._samples[-1]
+		window_cpu_percents = [
+			(cpu - previous_cpu) / (now - previous_now) * 100
+			for (previous_now, previous_cpu, _), (now, cpu, _) in zip(self._samples, self._samples[1:])
+		]
+		rss_values = [rss for _, _, rss in self._samples]
+		return {
+			"cpu_seconds": round(end_cpu - start_cpu, 2),
+			"cpu_percent_mean": round((end_cpu - start_cpu) / (end - start) * 100, 1),
+			"cpu_percent_p95": round(percentile(window_cpu_percents, 0.95), 1) if window_cpu_percents else None,
+			"rss_mb_start": round(start_rss / 2 ** 20, 1),
+			"rss_mb_mean": round(sum(rss_values) / len(rss_values) / 2 ** 20, 1),
+			"rss_mb_peak": round(max(rss_values) / 2 ** 20, 1),
+		}
+
+
+################################
+#            CLIENT            #
+################################
+
+class StepError(Exception):
+	pass
+
+
+class StreamlitClient:
+	def __init__(self, url: str, timeout: float):
+		"""
+		A session of the app driven like the browser does, through the protocol of the Streamlit frontend.
+		:param url: The URL of the server
+		:param timeout: Seconds before a run that does not finish is an error
+		"""
+		self.url = url
+		self.timeout = timeout
+		self.page = None  # The URL path of the current page
+		self.elements = {}  # The elements of the page by their position: type, proto and fragment
+		self.exceptions = []  # The exceptions shown by the last runs
+		self._websocket = None
+		self._page_hashes = {}  # The script hash of the pages by their URL path
+		self._page_hash = ""
+		self._widget_values: dict[str, WidgetState] = {}  # The values typed by the user, sent in every run
+		self._cached_messages: dict[str, ForwardMsg] = {}
+
+	async def connect(self):
+		self._websocket = await websocket_connect(
+			self.url.replace("http", "ws", 1) + "/_stcore/stream",
+			subprotocols=["streamlit"],
+			max_message_size=256 * 2 ** 20,
+		)
+
+	def close(self):
+		if self._websocket is not None:
+			self._websocket.close()
+
+	def find_widget(self, key_prefix: str = None, label: str = None, form: str = None) -> tuple[str, str]:
+		"""
+		Finds a widget of the page by the start of its key or by its label.
+		:return: The id of the widget and the id of its fragment
+		:raises StepError: If the widget is not on the page
+		"""
+		for _, element, fragment_id in self.elements.values():
+			widget_id = getattr(element, "id", "")
+			if not widget_id.startswith("$$ID-"):
+				continue
+			widget_key = widget_id.split("-", 2)[2]
+			if key_prefix is not None and not widget_key.startswith(key_prefix):
+				continue
+			if label is not None and getattr(element, "label", None) != label:
+				continue
+			if form is not None and getattr(element, "form_id", None) != form:
+				continue
+			return widget_id, fragment_id
+		raise StepError(f"No widget {key_prefix or label!r} on the page {self.page!r}")
+
+	def set_text(self, widget_id: str, value: str):
+		self._widget_values[widget_id] = WidgetState(id=widget_id, string_value=value)
+
+	async def open_page(self, page: str = ""):
+		"""Runs a page like the browser does when its URL path is opened, the default page if none is given."""
+		self._page_hash = self._page_hashes.get(page, "")
+		await self.rerun()
+
+	async def click(self, widget_id: str, fragment_id: str = ""):
+		"""Clicks a button, or submits a form with the values set for its widgets."""
+		await self.rerun(WidgetState(id=widget_id, trigger_value=True), fragment_id)
+
+	async def rerun(self, trigger: WidgetState = None, fragment_id: str = ""):
+		message = BackMsg()
+		client_state = message.rerun_script
+		client_state.page_script_hash = self._page_hash
+		client_state.fragment_id = fragment_id
+		client_state.widget_states.widgets.extend(self._widget_values.values())
+		if trigger is not None:
+			client_state.widget_states.widgets.append(trigger)
+
+		self.exceptions = []
+		await self._websocket.write_message(message.SerializeToString(), binary=True)
+		await asyncio.wait_for(self._read_until_finished(), self.timeout)
+		if self.exceptions:
+			raise StepError(self.exceptions[0])
+
+	async def _read_until_finished(self):
+		"""Applies the messages of the server until a run finishes without starting another one."""
+		while True:
+			payload = await self._websocket.read_message()
+			if payload is None:
+				raise StepError("The server has closed the session")
+
+			message = ForwardMsg()
+			message.ParseFromString(payload)
+			message = self._resolve_cached(message)
+			message_type = message.WhichOneof("type")
+
+			if message_type == "new_session":
+				if not message.new_session.fragment_ids_this_run:
+					self.elements = {}
+			elif message_type == "navigation":
+				self._page_hashes = {page.url_pathname: page.page_script_hash for page in message.navigation.app_pages}
+				self._page_hash = message.navigation.page_script_hash
+				self.page = next(
+					(path for path, page_hash in self._page_hashes.items() if page_hash == self._page_hash), None
+				)
+			elif message_type == "delta" and message.delta.WhichOneof("type") == "new_element":
+				element_type = message.delta.new_element.WhichOneof("type")
+				element = getattr(message.delta.new_element, element_type)
+				self.elements[tuple(message.metadata.delta_path)] = (element_type, element, message.delta.fragment_id)
+				if element_type == "exception":
+					self.exceptions.append(f"{element.type}: {element.message}")
+			elif message_type == "script_finished" and message.script_finished != SCRIPT_FINISHED_EARLY_FOR_RERUN:
+				return
+
+	def _resolve_cached(self, message: ForwardMsg) -> ForwardMsg:
+		"""The server sends only the hash of the big messages that it has already sent, like the browser they are cached."""
+		if message.WhichOneof("type") == "ref_hash":
+			cached = ForwardMsg()
+			cached.CopyFrom(self._cached_messages[message.ref_hash])
+			cached.metadata.CopyFrom(message.metadata)
+			return cached
+		if message.metadata.cacheable:
+			self._cached_messages[message.hash] = message
+		return message
+
+
+################################
+#            FLOWS             #
+################################
+
+class LoadTestResults:
+	def __init__(self):
+		self.durations: dict[str, list[float]] = defaultdict(list)
+		self.errors: dict[str, Counter] = defaultdict(Counter)
+
+	def summary(self) -> dict:
+		steps = {}
+		for step in list(self.durations) + [step for step in self.errors if step not in self.durations]:
+			durations = self.durations.get(step, [])
+			steps[step] = {
+				"count": len(durations),
+				"errors": sum(self.errors.get(step, Counter()).values()),
+				"p50_ms": round(percentile(durations, 0.50) * 1000, 1) if durations else None,
+				"p95_ms": round(percentile(durations, 0.95) * 1000, 1) if durations else None,
+				"p99_ms": round(percentile(durations, 0.99) * 1000, 1) if durations else None,
+				"max_ms": round(max(durations) * 1000, 1) if durations else None,
+			}
+		return steps
+
+
+class SimulatedUser:
+	def __init__(self, url: str, role: Role, index: int, results: LoadTestResults, think_time: float, timeout: float):
+		"""
+		A user of the load test, logging in with a new session for each iteration of the flow of its role.
+		:param think_time: Mean seconds between two steps, like a user reading the page
+		"""
+		self.url = url
+		self.role = role
+		self.username = load_test_username(role, index)
+		self.results = results
+		self.think_time = think_time
+		self.timeout = timeout
+		self.iteration = 0
+
+	async def step(self, name: str, action):
+		"""Times a step, after the think time."""
+		if self.think_time > 0:
+			await asyncio.sleep(random.uniform(0.5, 1.5) * self.think_time)
+
+		start = time.perf_counter()
+		try:
+			await action()
+		except (StepError, asyncio.TimeoutError) as e:
+			self.results.errors[name][str(e) or type(e).__name__] += 1
+			raise
+		self.results.durations[name].append(time.perf_counter() - start)
+
+	async def run(self, iterations: int):
+		for self.iteration in range(iterations):
+			client = StreamlitClient(self.url, self.timeout)
+			try:
+				await client.connect()
+				await self.flow(client)
+			except (StepError, asyncio.TimeoutError):
+				pass  # Already counted by the step, the next iteration starts from a new session
+			finally:
+				client.close()
+
+	async def flow(self, client: StreamlitClient):
+		# The tables of the dashboard where the VMs of the user are
+		table = "data_table_assigned_vms_to_this_user" if self.role == Role.REGULAR else "data_table_this_user_vms"
+		vm_name = load_test_vm_name(self.username, self.iteration % 2)
+		if self.role == Role.REGULAR:
+			vm_name += "-assigned"
+
+		async def open_app():
+			await client.open_page()
+			expect_page(client, "login")
+
+		async def login():
+			client.set_text(client.find_widget(label="Username", form="Login")[0], self.username)
+			client.set_text(client.find_widget(label="Password", form="Login")[0], LOAD_TEST_PASSWORD)
+			await client.click(client.find_widget(label="Login", form="Login")[0])
+			# In the browser, the cookie of the login is written by a component, which reruns the page when it is done
+			await client.rerun()
+			expect_page(client, DASHBOARD_PAGE)
+
+		async def search():
+			widget_id, fragment_id = client.find_widget(key_prefix=f"{table}-search_query")
+			client.set_text(widget_id, vm_name)
+			await client.rerun(fragment_id=fragment_id)
+
+		async def refresh():
+			await client.click(*client.find_widget(key_prefix=f"{table}-refresh-data-button"))
+
+		async def connect():
+			await client.click(*client.find_widget(key_prefix=f"{table}_button_Connect_"))
+			expect_page(client, "terminal")
+
+		async def dashboard():
+			await client.open_page(DASHBOARD_PAGE)
+			expect_page(client, DASHBOARD_PAGE)
+
+		async def open_vm():
+			await client.click(*client.find_widget(key_prefix=f"{table}_button_Edit_"))
+			expect_page(client, "vm_details")
+
+		async def edit_vm():
+			# The name is changed back and forth, so that the searches of the next iterations still find it
+			name_id, _ = client.find_widget(label="VM name", form="Edit VM information")
+			client.set_text(name_id, load_test_vm_name(self.username, (self.iteration + 1) % 2))
+			await client.click(client.find_widget(label="Edit", form="Edit VM information")[0])
+			expect_page(client, DASHBOARD_PAGE)
+
+		steps = [open_app, login, search, refresh, connect, dashboard]
+		if self.role != Role.REGULAR:
+			steps += [search, open_vm, edit_vm]
+		for action in steps:
+			await self.step(action.__name__, action)
+
+
+def expect_page(client: StreamlitClient, page: str):
+	if client.page != page:
+		raise StepError(f"Expected the page {page!r}, got {client.page!r}")
+
+
+def parse_mix(mix: str, users: int) -> dict[Role, int]:
+	"""Splits the users among the roles by the weights of the mix, e.g. "regular=70,manager=30"."""
+	weights = {}
+	for item in mix.split(","):
+		role, weight = item.split("=")
+		weights[Role(role.strip())] = float(weight)
+	if Role.NEW_USER in weights:
+		raise ValueError("The new users cannot log in, leave them out of the mix")
+
+	total = sum(weights.values())
+	users_by_role = {role: int(users * weight / total) for role, weight in weights.items()}
+	# The users left by the rounding go to the roles with the most weight
+	for role in sorted(weights, key=weights.get, reverse=True)[:users - sum(users_by_role.values())]:
+		users_by_role[role] += 1
+	return users_by_role
+
+
+async def run_users(url: str, users_by_role: dict[Role, int], results: LoadTestResults,
+					iterations: int, ramp_up: float, think_time: float, timeout: float):
+	simulated_users = [
+		SimulatedUser(url, role, index, results, think_time, timeout)
+		for role, count in users_by_role.items()
+		for index in range(count)
+	]
+	random.shuffle(simulated_users)
+
+	async def start_later(delay: float, simulated_user: SimulatedUser):
+		await asyncio.sleep(delay)
+		await simulated_user.run(iterations)
+
+	await asyncio.gather(*(
+		start_later(ramp_up * position / len(simulated_users), simulated_user)
+		for position, simulated_user in enumerate(simulated_users)
+	))
+
+
+def current_commit() -> str | None:
+	try:
+		return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_ROOT,
+							  capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--users", type=int, default=10, help="Simulated users at the same time")
+	parser.add_argument("--mix", default=DEFAULT_MIX, help="Weights of the roles among the users")
+	parser.add_argument("--iterations", type=int, default=3, help="Flows of each user, each in a new session")
+	parser.add_argument("--vms-per-user", type=int, default=5, help="VMs owned by (or assigned to) each user")
+	parser.add_argument("--ramp-up", type=float, default=10, help="Seconds over which the users are started")
+	parser.add_argument("--think-time", type=float, default=1, help="Mean seconds between two steps of a user")
+	parser.add_argument("--timeout", type=float, default=60, help="Seconds before a step is an error")
+	parser.add_argument("--output", help="Also write the report to this file")
+	args = parser.parse_args()
+
+	started_at = datetime.now(timezone.utc)
+	users_by_role = parse_mix(args.mix, args.users)
+	ssh_port = start_ssh_stand_in()
+	module_port = start_module_stub()
+	seed_database(users_by_role, args.vms_per_user, ssh_port)
+
+	server_directory = write_server_directory(module_port)
+	port = free_port()
+	url = f"http://127.0.0.1:{port}"
+	server = start_server(server_directory, port, args.timeout)
+	try:
+		# The first run imports the pages and fills the caches, it is left out like the warm-up of a benchmark
+		warm_up_role = next(role for role, count in users_by_role.items() if count > 0)
+		asyncio.run(run_users(url, {warm_up_role: 1}, LoadTestResults(), 1, 0, 0, args.timeout))
+
+		results = LoadTestResults()
+		monitor = ProcessMonitor(server.pid)
+		start = time.perf_counter()
+		monitor.start()
+		asyncio.run(run_users(url, users_by_role, results, args.iterations, args.ramp_up, args.think_time, args.timeout))
+		server_usage = monitor.stop()
+		duration = time.perf_counter() - start
+	finally:
+		server.terminate()
+		server.wait()
+		shutil.rmtree(server_directory, ignore_errors=True)
+
+	report = {
+		"commit": current_commit(),
+		"started_at": started_at.isoformat(timespec="seconds"),
+		"users": {role.value: count for role, count in users_by_role.items()},
+		"iterations": args.iterations,
+		"vms_per_user": args.vms_per_user,
+		"ramp_up_seconds": args.ramp_up,
+		"think_time_seconds": args.think_time,
+		"duration_seconds": round(duration, 1),
+		"steps": results.summary(),
+		"errors": {step: dict(errors.most_common(5)) for step, errors in results.errors.items()},
+		"server": server_usage,
+	}
+	output = json.dumps(report, indent=2)
+	print(output)
+	if args.output:
+		with open(args.output, "w") as file:
+			file.write(output + "\n")
+	sys.exit(1 if results.errors else 0)
+
+
+if __name__ == "__main__":
+	main()
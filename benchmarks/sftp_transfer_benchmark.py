@@ -0,0 +1,272 @@
+"""
+Benchmark of the SFTP transfer engine against a local SFTP server stand-in.
+
+A TCP proxy between the engine and the server adds a fixed round-trip latency, so that the difference between
+a naive transfer (one write at a time, each waiting for its acknowledgement) and the engine (pipelined writes,
+concurrent ranges, many hosts at once) shows up as it would on a real network.
+
+Usage (from the repository root):
+	python benchmarks/sftp_transfer_benchmark.py --size-mb 32 --hosts 4 --rtt-ms 20
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import heapq
+
+import paramiko
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.batch_exec import BatchTarget
+from utils.sftp_transfer import TransferSettings, push_file_to_targets, download_from_target
+from utils.ssh_transport_pool import SSHTransportPool, open_ssh_client
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench"
+SSH_TIMEOUTS = {"timeout": 30, "banner_timeout": 30, "auth_timeout": 30}
+
+
+################################
+#     SFTP SERVER STAND-IN     #
+################################
+
+class BenchServerInterface(paramiko.ServerInterface):
+	def check_channel_request(self, kind, chanid):
+		return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+	def check_auth_password(self, username, password):
+		# Every host of the benchmark logs in with its own user, so that they do not share a pooled connection
+		if username.startswith(BENCH_USERNAME) and password == BENCH_PASSWORD:
+			return paramiko.AUTH_SUCCESSFUL
+		return paramiko.AUTH_FAILED
+
+	def get_allowed_auths(self, username):
+		return "password"
+
+
+class BenchSFTPHandle(paramiko.SFTPHandle):
+	def stat(self):
+		return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class BenchSFTPServer(paramiko.SFTPServerInterface):
+	"""Serves the files of a local directory, with just the operations used by the transfer engine."""
+
+	def __init__(self, server, root: str, *args, **kwargs):
+		super().__init__(server, *args, **kwargs)
+		self.root = root
+
+	def _local_path(self, path: str) -> str:
+		return os.path.join(self.root, path.lstrip("/"))
+
+	def open(self, path, flags, attr):
+		try:
+			fd = os.open(self._local_path(path), flags | getattr(os, "O_BINARY", 0), 0o644)
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+		if flags & (os.O_WRONLY | os.O_RDWR):
+			mode = "r+b"
+		else:
+			mode = "rb"
+
+		handle = BenchSFTPHandle(flags)
+		handle.filename = self._local_path(path)
+		handle.readfile = handle.writefile = os.fdopen(fd, mode)
+		return handle
+
+	def stat(self, path):
+		try:
+			return paramiko.SFTPAttributes.from_stat(os.stat(self._local_path(path)))
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+	lstat = stat
+
+
+def start_sftp_stand_in(root: str) -> int:
+	"""Starts the SFTP server stand-in on a free local port and returns the port."""
+	host_key = paramiko.RSAKey.generate(2048)
+	server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	server_socket.bind(("127.0.0.1", 0))
+	server_socket.listen(1024)
+
+	def accept_loop():
+		while True:
+			client_socket, _ = server_socket.accept()
+			client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Like OpenSSH
+			transport = paramiko.Transport(client_socket)
+			transport.add_server_key(host_key)
+			transport.set_subsystem_handler("sftp", paramiko.SFTPServer, BenchSFTPServer, root)
+			transport.start_server(server=BenchServerInterface())
+
+	threading.Thread(target=accept_loop, daemon=True).start()
+	return server_socket.getsockname()[1]
+
+
+################################
+#        LATENCY PROXY         #
+################################
+
+def start_latency_proxy(target_port: int, rtt: float) -> int:
+	"""Starts a TCP proxy that delays every byte by half the round trip in each direction, returning its port."""
+	proxy_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	proxy_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	proxy_socket.bind(("127.0.0.1", 0))
+	proxy_socket.listen(1024)
+
+	def forward(source: socket.socket, destination: socket.socket):
+		pending = []
+		condition = threading.Condition()
+		closed = []
+
+		def sender():
+			while True:
+				with condition:
+					while not pending and not closed:
+						condition.wait()
+					if not pending:
+						break
+					deadline, _, chunk = pending[0]
+				delay = deadline - time.monotonic()
+				if delay > 0:
+					time.sleep(delay)
+				with condition:
+					heapq.heappop(pending)
+				try:
+					destination.sendall(chunk)
+				except OSError:
+					break
+			destination.close()
+
+		threading.Thread(target=sender, daemon=True).start()
+		sequence = 0
+		while True:
+			try:
+				chunk = source.recv(256 * 1024)
+			except OSError:
+				chunk = b""
+			with condition:
+				if not chunk:
+					closed.append(True)
+				else:
+					sequence += 1
+					heapq.heappush(pending, (time.monotonic() + rtt / 2, sequence, chunk))
+				condition.notify()
+			if not chunk:
+				break
+
+	def accept_loop():
+		while True:
+			client_socket, _ = proxy_socket.accept()
+			server_socket = socket.create_connection(("127.0.0.1", target_port))
+			for proxied_socket in (client_socket, server_socket):
+				proxied_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			for source, destination in ((client_socket, server_socket), (server_socket, client_socket)):
+				threading.Thread(target=forward, args=(source, destination), daemon=True).start()
+
+	threading.Thread(target=accept_loop, daemon=True).start()
+	return proxy_socket.getsockname()[1]
+
+
+################################
+#          BENCHMARK           #
+################################
+
+def naive_upload(target: BatchTarget, data: bytes, remote_path: str):
+	"""One write at a time, each waiting for its acknowledgement, like a plain `SFTPFile.write` loop."""
+	ssh_client = open_ssh_client(
+		target.hostname, target.port, target.username, target.password, ssh_timeouts=SSH_TIMEOUTS
+	)
+	try:
+		sftp = ssh_client.open_sftp()
+		with sftp.open(remote_path, "wb", bufsize=0) as remote_file:
+			for offset in range(0, len(data), 32768):
+				remote_file.write(data[offset:offset + 32768])
+	finally:
+		ssh_client.close()
+
+
+def throughput(size: int, seconds: float) -> float:
+	return round(size / seconds / 1024 / 1024, 2)
+
+
+def run_benchmark(size_mb: int, hosts: int, rtt_ms: float, ranges_per_file: int) -> dict:
+	root = tempfile.mkdtemp(prefix="sftp-bench-")
+	try:
+		port = start_latency_proxy(start_sftp_stand_in(root), rtt_ms / 1000)
+		data = os.urandom(size_mb * 1024 * 1024)
+		targets = [
+			BatchTarget(index, f"host-{index}", "127.0.0.1", port, f"{BENCH_USERNAME}{index}", password=BENCH_PASSWORD)
+			for index in range(hosts)
+		]
+		settings = TransferSettings(ranges_per_file=ranges_per_file, min_range_size=1024 * 1024)
+		pool = SSHTransportPool(health_check_interval=0)
+
+		# Naive upload to a single host
+		start = time.perf_counter()
+		naive_upload(targets[0], data, "/naive.bin")
+		naive_seconds = time.perf_counter() - start
+
+		# Engine upload to a single host
+		start = time.perf_counter()
+		events = list(push_file_to_targets(
+			targets[:1], data, "/single.bin", settings, ssh_timeouts=SSH_TIMEOUTS, pool=pool
+		))
+		single_seconds = time.perf_counter() - start
+		errors = [event.data for event in events if event.kind == "error"]
+
+		# Engine upload fanned out to every host (the hosts share the same disk and proxy)
+		start = time.perf_counter()
+		events = list(push_file_to_targets(
+			targets, data, "/fan_out.bin", settings, ssh_timeouts=SSH_TIMEOUTS, pool=pool
+		))
+		fan_out_seconds = time.perf_counter() - start
+		errors += [event.data for event in events if event.kind == "error"]
+
+		# Engine download from a single host
+		start = time.perf_counter()
+		downloaded = download_from_target(targets[0], "/single.bin", settings, ssh_timeouts=SSH_TIMEOUTS, pool=pool)
+		download_seconds = time.perf_counter() - start
+
+		with open(os.path.join(root, "single.bin"), "rb") as uploaded:
+			verified = uploaded.read() == data and downloaded == data
+
+		return {
+			"file_size_mb": size_mb,
+			"hosts": hosts,
+			"rtt_ms": rtt_ms,
+			"ranges_per_file": ranges_per_file,
+			"verified": verified,
+			"errors": errors,
+			"naive_upload_mb_per_second": throughput(len(data), naive_seconds),
+			"engine_upload_mb_per_second": throughput(len(data), single_seconds),
+			"engine_fan_out_total_mb_per_second": throughput(len(data) * hosts, fan_out_seconds),
+			"engine_download_mb_per_second": throughput(len(data), download_seconds),
+			"transport_pool": pool.stats(),
+		}
+	finally:
+		shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--size-mb", type=int, default=32, help="Size of the uploaded file")
+	parser.add_argument("--hosts", type=int, default=4, help="Number of hosts of the fan-out upload")
+	parser.add_argument("--rtt-ms", type=float, default=20, help="Round-trip latency added by the proxy")
+	parser.add_argument("--ranges-per-file", type=int, default=4, help="Concurrent ranges of each file")
+	args = parser.parse_args()
+
+	result = run_benchmark(args.size_mb, args.hosts, args.rtt_ms, args.ranges_per_file)
+	print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+	main()
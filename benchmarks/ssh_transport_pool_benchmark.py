@@ -0,0 +1,75 @@
+"""
+Benchmark of the SSH transport pool against a local SSH server stand-in.
+
+Measures repeated short operations on the same VM (a connection test followed by opening a channel, like a probe)
+with a fresh connection every time and with the pooled connections. A TCP proxy adds a fixed round-trip latency,
+so that the cost of the TCP handshake, key exchange and authentication shows up as it would on a real network.
+
+Usage (from the repository root):
+	python benchmarks/ssh_transport_pool_benchmark.py --operations 50 --rtt-ms 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.terminal_bridge_benchmark import BENCH_USERNAME, BENCH_PASSWORD, start_ssh_stand_in
+from benchmarks.sftp_transfer_benchmark import start_latency_proxy
+from utils.ssh_transport_pool import SSHTransportPool, open_ssh_client
+
+SSH_TIMEOUTS = {"timeout": 30, "banner_timeout": 30, "auth_timeout": 30}
+
+
+def fresh_operation(port: int):
+	ssh_client = open_ssh_client("127.0.0.1", port, BENCH_USERNAME, BENCH_PASSWORD, ssh_timeouts=SSH_TIMEOUTS)
+	try:
+		ssh_client.get_transport().open_session(timeout=SSH_TIMEOUTS["timeout"]).close()
+	finally:
+		ssh_client.close()
+
+
+def pooled_operation(pool: SSHTransportPool, port: int):
+	with pool.lease("127.0.0.1", port, BENCH_USERNAME, BENCH_PASSWORD, ssh_timeouts=SSH_TIMEOUTS) as transport:
+		transport.open_session(timeout=SSH_TIMEOUTS["timeout"]).close()
+
+
+def measure(operation, operations: int) -> dict:
+	latencies = []
+	for _ in range(operations):
+		start = time.perf_counter()
+		operation()
+		latencies.append(time.perf_counter() - start)
+
+	ordered = sorted(latencies)
+	return {
+		"p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+		"p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 2),
+		"mean_ms": round(statistics.mean(latencies) * 1000, 2),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--operations", type=int, default=50, help="Operations on the same VM")
+	parser.add_argument("--rtt-ms", type=float, default=20, help="Round-trip latency added by the proxy")
+	args = parser.parse_args()
+
+	port = start_latency_proxy(start_ssh_stand_in(), args.rtt_ms / 1000)
+	pool = SSHTransportPool(health_check_interval=0)
+
+	result = {
+		"operations": args.operations,
+		"rtt_ms": args.rtt_ms,
+		"fresh_connection": measure(lambda: fresh_operation(port), args.operations),
+		"pooled_connection": measure(lambda: pooled_operation(pool, port), args.operations),
+		"transport_pool": pool.stats(),
+	}
+	print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+	main()
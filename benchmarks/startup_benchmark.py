@@ -0,0 +1,155 @@
+"""
+Benchmark of the cold start of the app, checked against time budgets.
+
+- Import: a fresh interpreter imports the modules that every page imports, with `python -X importtime`.
+  The slow modules that must be imported only on first use (e.g. paramiko) must not show up.
+- Server ready: `streamlit run app.py` is started until its health endpoint answers, no database is needed.
+- First render: `app.py` is run once with `AppTest`, like the first visit of a browser. It needs the database
+  and the secrets of `.streamlit/secrets.toml`, skip it with `--skip-render` where they are not available.
+
+The exit status is 1 if a budget is exceeded or a deferred module is imported, so that it can be used in CI.
+
+Usage (from the repository root):
+	python benchmarks/startup_benchmark.py --runs 3
+	python benchmarks/startup_benchmark.py --skip-render --import-budget-ms 1500
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported, directly or not, by every page
+PAGE_MODULES = ["frontend", "frontend.components", "frontend.click_handlers.vm", "utils.refresh_db_functions"]
+
+# Imported only by the pages and the actions that use them
+DEFERRED_MODULES = ["paramiko", "tornado.websocket", "utils.terminal_bridge", "utils.ssh_transport_pool"]
+
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure_imports() -> dict:
+	"""Imports the page modules in a new interpreter and parses the `-X importtime` report (in microseconds)."""
+	process = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", f"import {', '.join(PAGE_MODULES)}"],
+		cwd=REPOSITORY_ROOT,
+		capture_output=True,
+		text=True,
+	)
+	if process.returncode != 0:
+		raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+	cumulative = {}
+	total = 0
+	for line in process.stderr.splitlines():
+		match = IMPORT_TIME_PATTERN.match(line)
+		if match is None:
+			continue
+		own_us, cumulative_us, indent, module = match.groups()
+		cumulative[module] = int(cumulative_us)
+		if len(indent) == 1:  # Top-level imports, their times include everything below them
+			total += int(cumulative_us)
+
+	heaviest = sorted(
+		((module, us) for module, us in cumulative.items() if module.split(".")[0] in ("backend", "frontend", "utils")),
+		key=lambda item: item[1],
+		reverse=True,
+	)[:10]
+	return {
+		"import_ms": round(total / 1000, 1),
+		"heaviest_own_modules_ms": {module: round(us / 1000, 1) for module, us in heaviest},
+		"deferred_modules_imported": [module for module in DEFERRED_MODULES if module in cumulative],
+	}
+
+
+def free_port() -> int:
+	with socket.socket() as probe:
+		probe.bind(("127.0.0.1", 0))
+		return probe.getsockname()[1]
+
+
+def measure_server_ready(timeout: float) -> float:
+	"""Starts the server and waits for its health endpoint, in milliseconds."""
+	port = free_port()
+	start = time.perf_counter()
+	server = subprocess.Popen(
+		[sys.executable, "-m", "streamlit", "run", "app.py", "--server.headless", "true",
+		 "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+		cwd=REPOSITORY_ROOT,
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.DEVNULL,
+	)
+	try:
+		while time.perf_counter() - start < timeout:
+			try:
+				with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+					if response.status == 200:
+						return (time.perf_counter() - start) * 1000
+			except OSError:
+				time.sleep(0.05)
+		raise TimeoutError(f"The server was not ready after {timeout} seconds")
+	finally:
+		server.terminate()
+		server.wait()
+
+
+def measure_first_render(timeout: float) -> float:
+	"""Runs `app.py` once, like the first visit of a browser, in milliseconds."""
+	from streamlit.testing.v1 import AppTest
+
+	os.chdir(REPOSITORY_ROOT)
+	app = AppTest.from_file(os.path.join(REPOSITORY_ROOT, "app.py"), default_timeout=timeout)
+	start = time.perf_counter()
+	app.run()
+	elapsed = (time.perf_counter() - start) * 1000
+
+	if app.exception:
+		raise RuntimeError(app.exception[0].message)
+	return elapsed
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--runs", type=int, default=3, help="Runs of each measure, the median is reported")
+	parser.add_argument("--import-budget-ms", type=float, default=2000, help="Maximum import time of the page modules")
+	parser.add_argument("--ready-budget-ms", type=float, default=5000, help="Maximum time before the server answers")
+	parser.add_argument("--render-budget-ms", type=float, default=3000, help="Maximum time of the first run of the app")
+	parser.add_argument("--skip-render", action="store_true", help="Do not measure the first render (needs the database)")
+	parser.add_argument("--timeout", type=float, default=60, help="Seconds before a measure is aborted")
+	args = parser.parse_args()
+
+	imports = [measure_imports() for _ in range(args.runs)]
+	result = {
+		"import_ms": statistics.median(run["import_ms"] for run in imports),
+		"heaviest_own_modules_ms": imports[-1]["heaviest_own_modules_ms"],
+		"deferred_modules_imported": imports[-1]["deferred_modules_imported"],
+		"server_ready_ms": round(statistics.median(measure_server_ready(args.timeout) for _ in range(args.runs)), 1),
+	}
+	if not args.skip_render:
+		# Only the first run is cold, the next ones would find the modules and the caches ready
+		result["first_render_ms"] = round(measure_first_render(args.timeout), 1)
+
+	failures = []
+	if result["import_ms"] > args.import_budget_ms:
+		failures.append(f"import_ms {result['import_ms']} > {args.import_budget_ms}")
+	if result["server_ready_ms"] > args.ready_budget_ms:
+		failures.append(f"server_ready_ms {result['server_ready_ms']} > {args.ready_budget_ms}")
+	if result.get("first_render_ms", 0) > args.render_budget_ms:
+		failures.append(f"first_render_ms {result['first_render_ms']} > {args.render_budget_ms}")
+	if result["deferred_modules_imported"]:
+		failures.append(f"imported at startup: {', '.join(result['deferred_modules_imported'])}")
+
+	result["failures"] = failures
+	print(json.dumps(result, indent=2))
+	sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+	main()
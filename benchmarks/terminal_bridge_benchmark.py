@@ -0,0 +1,185 @@
+"""
+Benchmark of the built-in terminal bridge against a local SSH server stand-in.
+
+Measures the keystroke echo latency (browser -> bridge -> SSH -> bridge -> browser) and the CPU cost
+of idle-typing sessions, reported as sessions per core. The stand-in SSH server and the WebSocket clients run
+in the same process as the bridge, so their CPU time is included: the sessions per core are a lower bound.
+
+Usage (from the repository root):
+	python benchmarks/terminal_bridge_benchmark.py --sessions 50 --duration 10 --keystrokes-per-second 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import paramiko
+from tornado.websocket import websocket_connect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ssh_transport_pool import SSHTransportPool
+from utils.terminal_bridge import TerminalBridge
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench"
+
+
+################################
+#      SSH SERVER STAND-IN     #
+################################
+
+class EchoServerInterface(paramiko.ServerInterface):
+	"""Accepts a single user and echoes everything typed in the shell."""
+
+	def check_channel_request(self, kind, chanid):
+		return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+	def check_auth_password(self, username, password):
+		if username == BENCH_USERNAME and password == BENCH_PASSWORD:
+			return paramiko.AUTH_SUCCESSFUL
+		return paramiko.AUTH_FAILED
+
+	def get_allowed_auths(self, username):
+		return "password"
+
+	def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+		return True
+
+	def check_channel_shell_request(self, channel):
+		threading.Thread(target=echo_shell, args=(channel,), daemon=True).start()
+		return True
+
+	def check_channel_window_change_request(self, channel, width, height, pixelwidth, pixelheight):
+		return True
+
+
+def echo_shell(channel: paramiko.Channel):
+	while True:
+		data = channel.recv(4096)
+		if not data:
+			break
+		channel.sendall(data)
+	channel.close()
+
+
+def start_ssh_stand_in() -> int:
+	"""Starts the SSH server stand-in on a free local port and returns the port."""
+	host_key = paramiko.RSAKey.generate(2048)
+	server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	server_socket.bind(("127.0.0.1", 0))
+	server_socket.listen(1024)
+
+	def accept_loop():
+		while True:
+			client_socket, _ = server_socket.accept()
+			client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Like OpenSSH
+			transport = paramiko.Transport(client_socket)
+			transport.add_server_key(host_key)
+			transport.start_server(server=EchoServerInterface())
+
+	threading.Thread(target=accept_loop, daemon=True).start()
+	return server_socket.getsockname()[1]
+
+
+################################
+#          BENCHMARK           #
+################################
+
+async def open_session(bridge: TerminalBridge, ssh_port: int):
+	connection_id = bridge.register_connection("127.0.0.1", ssh_port, BENCH_USERNAME, password=BENCH_PASSWORD)
+	return await websocket_connect(bridge.build_url(connection_id))
+
+
+async def echo_latency(websocket, keystroke: str = "a") -> float:
+	"""Sends a keystroke and waits until it is echoed back, returning the round trip in seconds."""
+	start = time.perf_counter()
+	await websocket.write_message(json.dumps({"input": keystroke}))
+
+	received = b""
+	while keystroke.encode("utf-8") not in received:
+		message = await websocket.read_message()
+		if message is None:
+			raise ConnectionError("The terminal has been closed.")
+		received += message
+
+	return time.perf_counter() - start
+
+
+def percentile(values: list[float], fraction: float) -> float:
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_benchmark(sessions: int, duration: float, keystrokes_per_second: float) -> dict:
+	ssh_port = start_ssh_stand_in()
+	# Every session uses the same credentials, so they are multiplexed on the pooled SSH connections
+	transport_pool = SSHTransportPool(max_transports_per_host=max(8, sessions // 10 + 1), health_check_interval=0)
+	bridge = TerminalBridge(host="127.0.0.1", port=0, transport_pool=transport_pool, max_workers=64).start()
+
+	# Open the sessions
+	start = time.perf_counter()
+	websockets = await asyncio.gather(*(open_session(bridge, ssh_port) for _ in range(sessions)))
+	open_seconds = time.perf_counter() - start
+
+	# Warm up every session once
+	await asyncio.gather(*(echo_latency(websocket) for websocket in websockets))
+
+	# Steady typing on every session
+	latencies = []
+	interval = 1 / keystrokes_per_second
+
+	async def type_on(websocket):
+		deadline = time.perf_counter() + duration
+		while time.perf_counter() < deadline:
+			latencies.append(await echo_latency(websocket))
+			await asyncio.sleep(interval)
+
+	cpu_start = time.process_time()
+	wall_start = time.perf_counter()
+	await asyncio.gather(*(type_on(websocket) for websocket in websockets))
+	wall_seconds = time.perf_counter() - wall_start
+	cpu_seconds = time.process_time() - cpu_start
+
+	for websocket in websockets:
+		websocket.close()
+	bridge.stop()
+
+	cpu_per_session = cpu_seconds / wall_seconds / sessions
+	return {
+		"sessions": sessions,
+		"duration_seconds": round(wall_seconds, 3),
+		"keystrokes_per_second_per_session": keystrokes_per_second,
+		"keystrokes": len(latencies),
+		"session_open_seconds_total": round(open_seconds, 3),
+		"echo_latency_ms": {
+			"p50": round(percentile(latencies, 0.50) * 1000, 3),
+			"p95": round(percentile(latencies, 0.95) * 1000, 3),
+			"p99": round(percentile(latencies, 0.99) * 1000, 3),
+			"mean": round(statistics.mean(latencies) * 1000, 3),
+		},
+		"cpu_cores_used": round(cpu_seconds / wall_seconds, 3),
+		"sessions_per_core": round(1 / cpu_per_session, 1) if cpu_per_session > 0 else None,
+		"ssh_connections": transport_pool.stats()["opened"],
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--sessions", type=int, default=50, help="Number of concurrent terminals")
+	parser.add_argument("--duration", type=float, default=10, help="Seconds of steady typing")
+	parser.add_argument("--keystrokes-per-second", type=float, default=5, help="Typing rate of each terminal")
+	args = parser.parse_args()
+
+	result = asyncio.run(run_benchmark(args.sessions, args.duration, args.keystrokes_per_second))
+	print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,62 @@
+"""
+Command line tools of VM Lab. They read the same `.streamlit/secrets.toml` of the web app,
+so they must be run from the repository root.
+
+Usage:
+	python cli.py export --format parquet --output-dir exports
+	python cli.py export virtual_machines --include-credentials --export-key <FERNET KEY>
+"""
+import argparse
+import os
+import sys
+
+
+def export_command(args: argparse.Namespace):
+	# Imported here, so that `--help` works without a database
+	from utils.data_export import EXPORT_TABLES, export_table, generate_export_key
+
+	tables = args.tables or list(EXPORT_TABLES.keys())
+	unknown = [table for table in tables if table not in EXPORT_TABLES]
+	if unknown:
+		sys.exit(f"Unknown tables: {', '.join(unknown)}. Use {', '.join(EXPORT_TABLES)}.")
+
+	export_key = args.export_key.encode("utf-8") if args.export_key else None
+	if args.include_credentials and export_key is None:
+		export_key = generate_export_key()
+		print("The credentials are encrypted with this key, store it safely:", export_key.decode("utf-8"),
+			  file=sys.stderr)
+
+	os.makedirs(args.output_dir, exist_ok=True)
+	for table in tables:
+		path = os.path.join(args.output_dir, f"{table}.{args.format}")
+		try:
+			with open(path, "wb") as file:
+				for chunk in export_table(table, args.format, args.include_credentials, export_key, args.chunk_size):
+					file.write(chunk)
+		except ValueError as e:
+			os.remove(path)
+			sys.exit(str(e))
+		print(f"Exported {table} to {path}", file=sys.stderr)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	subparsers = parser.add_subparsers(dest="command", required=True)
+
+	export_parser = subparsers.add_parser("export", help="Export tables to JSON Lines, CSV or Parquet files")
+	export_parser.add_argument("tables", nargs="*", help="The tables to export, all of them if none is given")
+	export_parser.add_argument("--format", default="jsonl", help="jsonl (default), csv or parquet")
+	export_parser.add_argument("--output-dir", default=".", help="Where the files are written, one for each table")
+	export_parser.add_argument("--include-credentials", action="store_true",
+							   help="Export the VM credentials, encrypted with the export key")
+	export_parser.add_argument("--export-key", help="A Fernet key for the credentials, a new one is printed if missing")
+	export_parser.add_argument("--chunk-size", type=int, default=None,
+							   help="Rows read and written at a time, `data_export_chunk_size` of the secrets if missing")
+	export_parser.set_defaults(handler=export_command)
+
+	args = parser.parse_args()
+	args.handler(args)
+
+
+if __name__ == "__main__":
+	main()
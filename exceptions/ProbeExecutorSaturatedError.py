@@ -0,0 +1,8 @@
+class ProbeExecutorSaturatedError(Exception):
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.message = f"Too many SSH connections are in progress ({capacity}), try again in a few seconds."
+		super().__init__(self.message)
+
+	def __str__(self):
+		return f"{self.message}"
@@ -1,9 +1,11 @@
 from .ModuleResponseError import ModuleResponseError
 from .VmNotSharedError import VmNotSharedError
 from .NotFoundError import NotFoundError
+from .ProbeExecutorSaturatedError import ProbeExecutorSaturatedError
 
 __all__ = [
 	'ModuleResponseError',
 	'VmNotSharedError',
 	'NotFoundError',
-]
\ No newline at end of file
+	'ProbeExecutorSaturatedError',
+]
@@ -7,5 +7,5 @@ from utils.session_state import set_session_state_item
 
 def user_details_clicked(data_row):
 	callback_user: User = data_row["original_object"]
-	set_session_state_item("selected_user", callback_user)
+	set_session_state_item("selected_user", callback_user.to_snapshot())
 	switch_page(PageNames.DETAILS_USER())
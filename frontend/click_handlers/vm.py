@@ -2,10 +2,9 @@ import time
 import requests
 import streamlit as st
 
-from paramiko import AuthenticationException
 from streamlit import switch_page
 
-from exceptions import ModuleResponseError, VmNotSharedError
+from exceptions import ModuleResponseError, VmNotSharedError, ProbeExecutorSaturatedError
 
 from backend.models import VirtualMachine
 
@@ -13,9 +12,11 @@ from frontend import PageNames
 from frontend.components import error_message
 from frontend.forms.vm import add_vm_form, vm_delete_form, assign_vm_form
 
+from utils.module_pool import ModuleEndpoint
+from utils.module_sessions import get_module_session_registry, build_vm_fingerprint
 from utils.session_state import set_session_state_item
-from utils.terminal_connection import test_connection_with_paramiko, send_credentials_to_external_module, \
-	build_module_url
+from utils.terminal_connection import BUILTIN_ENDPOINT_KEY, test_connection_with_paramiko, request_module_connection, \
+	build_connection_url, is_module_connection_alive
 
 
 @st.dialog("Add a new VM")
@@ -31,7 +32,7 @@ def vm_assign_clicked(current_username: str):
 def vm_edit_clicked(data_row):
 	selected_vm: VirtualMachine = data_row["original_object"]
 	st.cache_data.clear()  # Refresh my_vms table
-	set_session_state_item("selected_vm", selected_vm)
+	set_session_state_item("selected_vm", selected_vm.to_snapshot())
 	switch_page(PageNames.DETAILS_VM())
 
 
@@ -40,17 +41,96 @@ def vm_delete_clicked(data_row):
 	return vm_delete_form(selected_vm)
 
 
+def request_module_connection_with_status(connection_status, module_type: str, module_label: str, vm_id: int,
+										  hostname: str, port: int, username: str,
+										  password: str = None, ssh_key: bytes = None) -> tuple[str, ModuleEndpoint] | None:
+	"""
+	Sends the credentials to a module, showing any error inside the status container.
+	:param connection_status: The `st.status` container that shows the progress
+	:param module_type: The type of the module ("ssh" or "sftp")
+	:param module_label: The name of the module service to show in the messages (e.g. "SSH terminal")
+	:param vm_id: The id of the VM, used to choose the module instance
+	:return: The id of the new connection and the module instance that has created it, or `None` if something went wrong
+	"""
+	module_name = module_type.upper()
+	st.write(f"Requesting {module_label}...")
+
+	try:
+		connection_id, endpoint = request_module_connection(
+			module_type=module_type,
+			vm_id=vm_id,
+			hostname=hostname,
+			port=port,
+			username=username,
+			password=password,
+			ssh_key=ssh_key
+		)
+	except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+		connection_status.update(label="Error!", state="error", expanded=True)
+		error_message(
+			when=f"while requesting the {module_label}",
+			cause=f"Could not reach {module_name} module."
+		)
+		return None
+	except ModuleResponseError as e:
+		connection_status.update(label="Error!", state="error", expanded=True)
+		error_message(
+			when=f"while requesting the {module_label}",
+			cause=str(e)
+		)
+		return None
+	except Exception as e:
+		connection_status.update(label="Error!", state="error", expanded=True)
+		error_message(
+			unknown_exception=e,
+			when=f"while requesting the {module_label}",
+		)
+		return None
+
+	st.caption("Success!")
+	return connection_id, endpoint
+
+
+def prompt_vm_credentials(selected_vm: VirtualMachine, on_credentials, button_label: str = "Connect"):
+	"""
+	Calls `on_credentials` with the stored credentials of a VM, or asks the user for a password if there are none.
+	:param selected_vm: The VM to connect to
+	:param on_credentials: A function accepting the `password` and `ssh_key` keyword arguments
+	:param button_label: The label of the submit button of the password form
+	"""
+	if selected_vm.ssh_key:
+		# Connect using SSH key
+		on_credentials(ssh_key=selected_vm.decrypt_key())
+	elif selected_vm.password:
+		# Connect using saved password
+		on_credentials(password=selected_vm.decrypt_password())
+	else:
+		# Prompt user for password
+		with st.form(f"connection-form-{selected_vm.id}"):
+			st.write(f"Enter your password for {selected_vm.name}")
+			password_input = st.text_input("Password", type="password", placeholder="Insert password")
+			submit_button = st.form_submit_button(button_label)
+
+		if submit_button:
+			if not password_input:
+				st.warning("Type the password.")
+			else:
+				# Connect using user-provided password
+				on_credentials(password=password_input)
+
+
 @st.dialog("Connecting to VM")
 def vm_connect_clicked(data_row):
-	def was_request_successful(req) -> bool:
-		"""Verifies if a request to a module was successful."""
-		return "success" in req and req["success"]
+	def handle_connection(password=None, ssh_key=None):
+		"""Handles the connection logic and updates session state."""
+		# Imported on the first connection, paramiko and the bridge are slow to import
+		from paramiko import AuthenticationException
+		from utils.terminal_bridge import get_terminal_bridge, is_builtin_terminal_enabled
 
+		hostname = selected_vm.host
+		port = selected_vm.port
+		username = selected_vm.username
 
-	def handle_connection(
-			hostname, port, username,
-			password=None, ssh_key=None):
-		"""Handles the connection logic and updates session state."""
 		with st.status(f"Connecting to `{username}@{hostname}:{port}`", expanded=True) as connection_status:
 			# Test the connection to the remote
 			st.write("Connecting to remote server...")
@@ -76,6 +156,13 @@ def vm_connect_clicked(data_row):
 					cause="Could not connect to the remote server."
 				)
 				return
+			except ProbeExecutorSaturatedError as e:
+				connection_status.update(label="Error!", state="error", expanded=True)
+				error_message(
+					when="while connecting to the remote server",
+					cause=str(e)
+				)
+				return
 			except Exception as e:
 				connection_status.update(label="Error!", state="error", expanded=True)
 				error_message(
@@ -86,112 +173,92 @@ def vm_connect_clicked(data_row):
 
 			st.caption("Success!")
 
-			# Send the credentials to the SSH module
-			st.write("Requesting SSH terminal...")
-			try:
-				response_ssh = send_credentials_to_external_module(
-					module_type="ssh",
+			if is_builtin_terminal_enabled():
+				# The built-in bridge opens the SSH session itself when the terminal page connects to it
+				ssh_connection_id = get_terminal_bridge().register_connection(
 					hostname=hostname,
 					port=port,
 					username=username,
 					password=password,
 					ssh_key=ssh_key
 				)
-
-				if not was_request_successful(response_ssh):
-					raise ModuleResponseError(
-						module_name="SSH",
-						message=response_ssh['error']
-					)
-			except requests.exceptions.ConnectionError as e:
-				connection_status.update(label="Error!", state="error", expanded=True)
-				error_message(
-					when="while requesting the SSH terminal",
-					cause="Could not reach SSH module."
-				)
-				return
-			except ModuleResponseError as e:
-				connection_status.update(label="Error!", state="error", expanded=True)
-				error_message(
-					when="while requesting the SSH terminal",
-					cause=str(e)
-				)
-				return
-			except Exception as e:
-				connection_status.update(label="Error!", state="error", expanded=True)
-				error_message(
-					unknown_exception=e,
-					when="while requesting the SSH terminal",
-				)
-				return
-
-			st.caption("Success!")
-			# Send the credentials to the SFTP module
-			st.write("Requesting SFTP file explorer...")
-			try:
-				response_sftp = send_credentials_to_external_module(
-					module_type="sftp",
+				ssh_endpoint_key = BUILTIN_ENDPOINT_KEY
+			else:
+				# Send the credentials to the SSH module, the SFTP module is requested from the terminal page when needed
+				ssh_connection = request_module_connection_with_status(
+					connection_status, "ssh", "SSH terminal", selected_vm.id,
 					hostname=hostname,
 					port=port,
 					username=username,
 					password=password,
 					ssh_key=ssh_key
 				)
+				if ssh_connection is None:
+					return
+				ssh_connection_id, ssh_endpoint = ssh_connection
+				ssh_endpoint_key = ssh_endpoint.key
 
-				if not was_request_successful(response_sftp):
-					raise ModuleResponseError(
-						module_name="SFTP",
-						message=response_sftp['error']
-					)
-			except requests.exceptions.ConnectionError as e:
-				connection_status.update(label="Error!", state="error", expanded=True)
-				error_message(
-					when="while requesting the SFTP file explorer",
-					cause="Could not reach SFTP module."
-				)
-				return
-			except ModuleResponseError as e:
-				connection_status.update(label="Error!", state="error", expanded=True)
-				error_message(
-					when="while requesting the SFTP file explorer",
-					cause=str(e)
-				)
-			except Exception as e:
-				connection_status.update(label="Error!", state="error", expanded=True)
-				error_message(
-					unknown_exception=e,
-					when="while requesting the SFTP file explorer",
-				)
-				return
-
-			st.caption("Success!")
 			connection_status.update(label="Connection successful! Redirecting to page...", state="complete", expanded=True)
 			time.sleep(1)
 
-			set_session_state_item("selected_vm", selected_vm)
-
-			ssh_connection_url = build_module_url(
-				connection_type="ssh",
-				request_type="connection",
-				connection_id=response_ssh["connection_uuid"]
-			)
-			set_session_state_item(
-				"terminal_page_ssh_connection_url",
-				ssh_connection_url
+			# Remember the connection, so that the next click can reuse it
+			get_module_session_registry().put(
+				requesting_user, selected_vm.id, build_vm_fingerprint(selected_vm),
+				"ssh", ssh_connection_id, ssh_endpoint_key
 			)
 
-			sftp_connection_url = build_module_url(
-				connection_type="sftp",
-				request_type="connection",
-				connection_id=response_sftp["connection_uuid"]
-			)
-			set_session_state_item(
-				"terminal_page_sftp_connection_url",
-				sftp_connection_url
-			)
+			open_terminal_page(build_connection_url("ssh", ssh_connection_id, ssh_endpoint_key))
+
+
+	def reuse_live_session() -> bool:
+		"""
+		Sends the user back to the terminal of a live session for this VM, skipping the whole credentials handshake.
+		:return: `True` if a live session has been found, otherwise `False`
+		"""
+		registry = get_module_session_registry()
+		session = registry.get(requesting_user, selected_vm.id, build_vm_fingerprint(selected_vm))
+
+		if session is None or "ssh" not in session.connections:
+			return False
+
+		ssh_connection = session.connections["ssh"]
+		if not is_module_connection_alive("ssh", ssh_connection.connection_id, ssh_connection.endpoint_key):
+			registry.remove(requesting_user, selected_vm.id)
+			return False
+		ssh_connection.touch()
+
+		# The file explorer is optional, reuse it only if it is still alive too
+		sftp_connection = session.connections.get("sftp", None)
+		if sftp_connection is not None:
+			if is_module_connection_alive("sftp", sftp_connection.connection_id, sftp_connection.endpoint_key):
+				sftp_connection.touch()
+			else:
+				session.connections.pop("sftp", None)
+				sftp_connection = None
+
+		open_terminal_page(
+			build_connection_url("ssh", ssh_connection.connection_id, ssh_connection.endpoint_key),
+			build_connection_url("sftp", sftp_connection.connection_id, sftp_connection.endpoint_key)
+			if sftp_connection is not None else None
+		)
+		return True
 
-			st.cache_data.clear()  # Refresh my_vms table
-			switch_page(PageNames.VM_CONNECTION())
+
+	def open_terminal_page(ssh_connection_url: str, sftp_connection_url: str = None):
+		"""Stores the connection URLs in the session state and switches to the terminal page."""
+		set_session_state_item("selected_vm", selected_vm.to_snapshot())
+
+		set_session_state_item(
+			"terminal_page_ssh_connection_url",
+			ssh_connection_url
+		)
+		set_session_state_item(
+			"terminal_page_sftp_connection_url",
+			sftp_connection_url
+		)
+
+		st.cache_data.clear()  # Refresh my_vms table
+		switch_page(PageNames.VM_CONNECTION())
 
 	try:
 		selected_vm: VirtualMachine = data_row["original_object"]
@@ -202,40 +269,61 @@ def vm_connect_clicked(data_row):
 		if vm_owner != requesting_user and not vm_shared:
 			raise VmNotSharedError(selected_vm.name)
 
-		if selected_vm.ssh_key:
-			# Connect using SSH key
-			handle_connection(
-				hostname=selected_vm.host,
-				port=selected_vm.port,
-				username=selected_vm.username,
-				ssh_key=selected_vm.decrypt_key()
-			)
-		elif selected_vm.password:
-			# Connect using saved password
-			handle_connection(
-				hostname=selected_vm.host,
-				port=selected_vm.port,
-				username=selected_vm.username,
-				password=selected_vm.decrypt_password()
+		if reuse_live_session():
+			return
+
+		prompt_vm_credentials(selected_vm, handle_connection)
+	except VmNotSharedError as e:
+		error_message(cause=str(e))
+	except Exception as e:
+		error_message(unknown_exception=e)
+
+
+@st.dialog("Opening file explorer")
+def vm_open_files_clicked(selected_vm: VirtualMachine, requesting_user: str):
+	"""
+	Opens the file explorer of the VM of the terminal page, if the user can still access it.
+	:param selected_vm: The VM with its owner, read again from the database
+	"""
+	def handle_connection(password=None, ssh_key=None):
+		"""Requests the SFTP file explorer and shows it in the terminal page."""
+		hostname = selected_vm.host
+		port = selected_vm.port
+		username = selected_vm.username
+
+		with st.status(f"Connecting to `{username}@{hostname}:{port}`", expanded=True) as connection_status:
+			sftp_connection = request_module_connection_with_status(
+				connection_status, "sftp", "SFTP file explorer", selected_vm.id,
+				hostname=hostname,
+				port=port,
+				username=username,
+				password=password,
+				ssh_key=ssh_key
 			)
-		else:
-			# Prompt user for password
-			with st.form(f"connection-form-{selected_vm.id}"):
-				st.write(f"Enter your password for {selected_vm.name}")
-				password_input = st.text_input("Password", type="password", placeholder="Insert password")
-				submit_button = st.form_submit_button("Connect")
-
-			if submit_button:
-				if not password_input:
-					st.warning("Type the password.")
-				else:
-					# Connect using user-provided password
-					handle_connection(
-						hostname=selected_vm.host,
-						port=selected_vm.port,
-						username=selected_vm.username,
-						password=password_input
-					)
+			if sftp_connection is None:
+				return
+			sftp_connection_id, sftp_endpoint = sftp_connection
+
+			connection_status.update(label="Connection successful!", state="complete", expanded=True)
+
+		get_module_session_registry().put(
+			requesting_user, selected_vm.id, build_vm_fingerprint(selected_vm),
+			"sftp", sftp_connection_id, sftp_endpoint.key
+		)
+
+		set_session_state_item(
+			"terminal_page_sftp_connection_url",
+			build_connection_url("sftp", sftp_connection_id, sftp_endpoint.key)
+		)
+		st.rerun()
+
+	try:
+		# The VM may have been unshared since the terminal was opened
+		vm_owner = selected_vm.user.username
+		if vm_owner != requesting_user and selected_vm.assigned_to != requesting_user and not selected_vm.shared:
+			raise VmNotSharedError(selected_vm.name)
+
+		prompt_vm_credentials(selected_vm, handle_connection, button_label="Open")
 	except VmNotSharedError as e:
 		error_message(cause=str(e))
 	except Exception as e:
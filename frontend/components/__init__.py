@@ -2,6 +2,9 @@ from .confirm import confirm_dialog, confirm_in_page
 from .interactive_data_table import interactive_data_table
 from .error import error_toast, error_message
 from .sidebar_menu import sidebar_menu
+from .builtin_terminal import builtin_terminal
+from .vm_multiselect import vm_multiselect
+from .rerun_profiler import rerun_profiler_toggle, rerun_profile_report
 
 __all__ = [
 	'confirm_dialog',
@@ -10,4 +13,8 @@ __all__ = [
 	'error_toast',
 	'error_message',
 	'sidebar_menu',
+	'builtin_terminal',
+	'vm_multiselect',
+	'rerun_profiler_toggle',
+	'rerun_profile_report',
 ]
@@ -0,0 +1,45 @@
+import json
+
+import streamlit.components.v1 as stv1
+
+XTERM_VERSION = "5.5.0"
+XTERM_FIT_VERSION = "0.10.0"
+
+
+def builtin_terminal(websocket_url: str, height: int = 700):
+	"""
+	Renders a browser terminal connected to the built-in terminal bridge.
+
+	:param websocket_url: The URL of the connection, obtained with `TerminalBridge.build_url`
+	:param height: The height of the terminal in pixels
+	"""
+	stv1.html(f"""
+		<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/@xterm/xterm@{XTERM_VERSION}/css/xterm.min.css"/>
+		<script src="https://cdn.jsdelivr.net/npm/@xterm/xterm@{XTERM_VERSION}/lib/xterm.min.js"></script>
+		<script src="https://cdn.jsdelivr.net/npm/@xterm/addon-fit@{XTERM_FIT_VERSION}/lib/addon-fit.min.js"></script>
+		<div id="terminal" style="height: {height - 20}px"></div>
+		<script>
+			const terminal = new Terminal({{cursorBlink: true}});
+			const fitAddon = new FitAddon.FitAddon();
+			terminal.loadAddon(fitAddon);
+			terminal.open(document.getElementById("terminal"));
+			fitAddon.fit();
+
+			const url = new URL({json.dumps(websocket_url)});
+			url.searchParams.set("cols", terminal.cols);
+			url.searchParams.set("rows", terminal.rows);
+
+			const socket = new WebSocket(url);
+			socket.binaryType = "arraybuffer";
+			socket.onmessage = (event) => terminal.write(new Uint8Array(event.data));
+			socket.onclose = (event) => terminal.write(`\\r\\n[Disconnected: ${{event.reason || event.code}}]\\r\\n`);
+
+			terminal.onData((data) => {{
+				if (socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify({{input: data}}));
+			}});
+			terminal.onResize(({{cols, rows}}) => {{
+				if (socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify({{resize: [cols, rows]}}));
+			}});
+			window.addEventListener("resize", () => fitAddon.fit());
+		</script>
+	""", height=height)
@@ -1,13 +1,24 @@
-from typing import Callable
+import math
+from typing import Callable, Literal, Sequence
 
+import pandas as pd
 import streamlit as st
 
+from utils.data_table_index import DataTableIndex, get_row_key, strip_markdown
+from utils.rerun_timing import time_fragment_rerun
+from utils.session_memory import get_session_tracker
+
+ALL_COLUMNS = "All columns"
+PAGE_SIZE_OPTIONS = [10, 25, 50, 100]
+
 
 def interactive_data_table(key: str, data: list[dict],
 						   column_settings: dict, button_settings: dict,
 						   popover_settings: dict = None, filters_expanded: bool = False,
 						   refresh_data_callback: Callable = None, clear_filters_button: bool = True,
-						   title: str | None = None, action_header_name: str | None = "Actions"):
+						   title: str | None = None, action_header_name: str | None = "Actions",
+						   render_mode: Literal["auto", "widgets", "grid"] = "auto", page_size: int = None,
+						   fragment: bool = True):
 	"""
 	Full documentation here:
 	https://github.com/isislab-unisa/vm-lab/wiki/Component-%E2%80%90-Interactive-Data-Table
@@ -22,8 +33,51 @@ def interactive_data_table(key: str, data: list[dict],
 	:param clear_filters_button: Whether to display the "Clear Filters" button in the filters' menu.
 	:param title: The title to display above the table.
 	:param action_header_name: The string to show in the header of the buttons' header.
+	:param render_mode: How the rows are drawn:
+	- "widgets": a row of columns for each row, with its own buttons.
+	- "grid": a single dataframe where a row is selected, with one bar of buttons acting on the selected row.
+	Much faster with many rows, since the widgets do not grow with the data.
+	- "auto" (default): "grid" when there are more rows than `data_table_grid_threshold` in the secrets.
+	:param page_size: The initial rows of each page in the "widgets" mode, `data_table_page_size` in the secrets if `None`.
+	:param fragment: If `True`, searching, sorting, paging and clicking the buttons rerun only the table instead of the
+	whole page. The data is the one of the last full rerun: `st.rerun()` after changing it (the forms already do it).
 	:raises ValueError: If `data_name` is not defined in a `column_settings` entry.
 	"""
+	table_arguments = dict(
+		key=key,
+		data=data,
+		column_settings=column_settings,
+		button_settings=button_settings,
+		popover_settings=popover_settings,
+		filters_expanded=filters_expanded,
+		refresh_data_callback=refresh_data_callback,
+		clear_filters_button=clear_filters_button,
+		title=title,
+		action_header_name=action_header_name,
+		render_mode=render_mode,
+		page_size=page_size,
+	)
+
+	if fragment:
+		interactive_data_table_fragment(**table_arguments)
+	else:
+		render_interactive_data_table(**table_arguments)
+
+
+@st.fragment
+def interactive_data_table_fragment(**table_arguments):
+	get_session_tracker().touch()  # The fragment reruns do not run `app.py`
+	with time_fragment_rerun():
+		render_interactive_data_table(**table_arguments)
+
+
+def render_interactive_data_table(key: str, data: list[dict],
+								  column_settings: dict, button_settings: dict,
+								  popover_settings: dict, filters_expanded: bool,
+								  refresh_data_callback: Callable | None, clear_filters_button: bool,
+								  title: str | None, action_header_name: str | None,
+								  render_mode: Literal["auto", "widgets", "grid"], page_size: int | None):
+	"""Renders the table, see `interactive_data_table`."""
 
 	# Write the title
 	if title is not None:
@@ -39,9 +93,6 @@ def interactive_data_table(key: str, data: list[dict],
 		column_width: int = column_settings.get(name).get("column_width", 1)
 		widths.append(column_width)
 
-	# Default filtered data is all the data
-	filtered_data = data
-
 	# Filters
 	with st.expander("Filters", expanded=filters_expanded):
 		filters_buttons_col1, filters_buttons_col2 = st.columns(2)
@@ -54,7 +105,7 @@ def interactive_data_table(key: str, data: list[dict],
 					key=f"{key}-refresh-data-button",
 			):
 				st.cache_data.clear()
-				filtered_data = refresh_data_callback()
+				data = refresh_data_callback()
 
 		with filters_buttons_col2:
 			if clear_filters_button and st.button(
@@ -63,45 +114,92 @@ def interactive_data_table(key: str, data: list[dict],
 					key=f"{key}-clear-filters-button",
 			):
 				# Clear the inputs
-				st.session_state[f"{key}-search_selectbox"] = display_names[0]
+				st.session_state[f"{key}-search_selectbox"] = ALL_COLUMNS
 				st.session_state[f"{key}-search_query"] = ""
+				st.session_state[f"{key}-sort"] = []
+				st.session_state[f"{key}-page"] = 1
 
 		# Search Bars
 		search_column = st.selectbox("Select column to search",
-									 display_names,
-									 key=f"{key}-search_selectbox")
+									 [ALL_COLUMNS] + display_names,
+									 key=f"{key}-search_selectbox",
+									 on_change=reset_page,
+									 args=(key,))
 		search_query = st.text_input("Search",
 									 "",
-									 key=f"{key}-search_query")
+									 key=f"{key}-search_query",
+									 on_change=reset_page,
+									 args=(key,),
+									 help="In all the columns, each word must be the start of a word of the row.")
+
+		# Default filtered rows are all the rows, kept as positions in `data` instead of copies
+		filtered_indices = range(len(data))
 
 		# Search in the entire data list
 		if search_query:
-			data_name_to_search: str | None = column_settings.get(search_column).get("data_name", None)
-			if data_name_to_search is None:
-				raise ValueError(f"data_name must be defined in column_settings for '{search_column}'")
+			if search_column == ALL_COLUMNS:
+				data_name_to_search = None
+			else:
+				data_name_to_search: str | None = column_settings.get(search_column).get("data_name", None)
+				if data_name_to_search is None:
+					raise ValueError(f"data_name must be defined in column_settings for '{search_column}'")
+
+			search_index = get_search_index(key, column_settings)
+			search_index.update(data)
+			filtered_indices = search_index.search(search_query, data_name_to_search)
+
+	if render_mode == "auto":
+		grid_threshold = int(st.secrets.get("data_table_grid_threshold", 200))
+		render_mode = "grid" if len(data) > grid_threshold else "widgets"
+
+	if render_mode == "grid":
+		render_grid(key, [data[data_index] for data_index in filtered_indices], column_settings, button_settings)
+		return
 
-			filtered_data = []
-			for row in data:
-				if search_query.lower() in str(row[data_name_to_search]).lower():
-					filtered_data.append(row)
+	# The grid sorts on its own, in the browser
+	sort_keys = st.session_state.get(f"{key}-sort", [])
+	if sort_keys:
+		search_index = get_search_index(key, column_settings)
+		search_index.update(data)
+		filtered_indices = search_index.sort(filtered_indices, sort_keys)
 
-	# Write the Header Row
+	# Only the rows of the current page are rendered
+	window = render_pager(key, filtered_indices, page_size)
+
+	# Write the Header Row, a click sorts by the column
 	columns_header = st.columns(widths + [1])
+	sort_positions = {data_name: (priority, descending) for priority, (data_name, descending) in enumerate(sort_keys)}
 
 	for index, name in enumerate(display_names):
 		#columns_header[index].markdown(f'<div style="text-align: center"><b>{name}</b></div>', unsafe_allow_html=True)
-		columns_header[index].markdown(f"<u>**{name}**</u>", unsafe_allow_html=True)
+		data_name = column_settings.get(name).get("data_name", None)
+		if data_name in sort_positions:
+			priority, descending = sort_positions[data_name]
+			arrow = ":material/arrow_downward:" if descending else ":material/arrow_upward:"
+			header_label = f"**{name}** {arrow}{priority + 1 if len(sort_keys) > 1 else ''}"
+		else:
+			header_label = f"**{name}**"
+
+		columns_header[index].button(
+			header_label,
+			key=f"{key}-sort-{data_name}",
+			help="Sort by this column: ascending, descending, then not sorted. The columns clicked later break the ties.",
+			on_click=cycle_sort,
+			args=(key, data_name),
+		)
 
 	if action_header_name is not None:
-		columns_header[-1].wrimarkdownte(f"<u>**{action_header_name}**</u>", unsafe_allow_html=True)
+		columns_header[-1].markdown(f"<u>**{action_header_name}**</u>", unsafe_allow_html=True)
 
-	if len(filtered_data) == 0:
+	if len(window) == 0:
 		with st.container():
 			st.caption("No data")
 		return
 
-	# Write all the Rows
-	for data_index, data_row in enumerate(filtered_data):
+	# Write the Rows of the page
+	for data_index in window:
+		data_row = data[data_index]
+		row_key = get_row_key(data_row, data_index)
 		columns_row = st.columns(widths + [1])
 
 		# Data Columns
@@ -118,18 +216,171 @@ def interactive_data_table(key: str, data: list[dict],
 				popover_text = popover_settings.get("text", "Open")
 				popover_icon = popover_settings.get("icon", None)
 				with st.popover(popover_text, icon=popover_icon):
-					render_buttons(button_settings, data_index, data_row, key, True)
+					render_buttons(button_settings, row_key, data_row, key, True)
 			else:
-				render_buttons(button_settings, data_index, data_row, key, False)
+				render_buttons(button_settings, row_key, data_row, key, False)
+
+
+def cycle_sort(key: str, data_name: str):
+	"""Sorts by a column ascending, then descending, then not at all. A new column is added as the last sort key."""
+	sort_keys = list(st.session_state.get(f"{key}-sort", []))
+	descending_by_name = dict(sort_keys)
+
+	if data_name not in descending_by_name:
+		sort_keys.append((data_name, False))
+	elif not descending_by_name[data_name]:
+		sort_keys = [(name, name == data_name or descending) for name, descending in sort_keys]
+	else:
+		sort_keys = [(name, descending) for name, descending in sort_keys if name != data_name]
+
+	st.session_state[f"{key}-sort"] = sort_keys
+	reset_page(key)
+
+
+def reset_page(key: str):
+	"""Goes back to the first page, when the rows shown change."""
+	st.session_state[f"{key}-page"] = 1
+
+
+def get_search_index(key: str, column_settings: dict) -> DataTableIndex:
+	"""
+	The search index of a table, kept in the session state between the reruns.
+	It is built on the first search or sort, then only the changed rows are indexed again.
+	"""
+	data_names = []
+	for name, settings in column_settings.items():
+		data_name = settings.get("data_name", None)
+		if data_name is None:
+			raise ValueError(f"data_name must be defined in column_settings for '{name}'")
+		data_names.append(data_name)
+
+	index_key = f"{key}-search_index"
+	search_index = st.session_state.get(index_key, None)
+	if search_index is None or search_index.data_names != data_names:
+		search_index = DataTableIndex(data_names)
+		st.session_state[index_key] = search_index
 
+	return search_index
 
-def render_buttons(button_settings, data_index, data_row, key, use_width):
+
+def render_pager(key: str, filtered_indices: Sequence[int], page_size: int | None) -> Sequence[int]:
+	"""
+	Renders the page selector and the "rows N–M of T" indicator.
+	:return: The positions of the rows of the current page
+	"""
+	page_size_key = f"{key}-page_size"
+	page_key = f"{key}-page"
+
+	if page_size_key not in st.session_state:
+		st.session_state[page_size_key] = page_size or int(st.secrets.get("data_table_page_size", 25))
+	if page_key not in st.session_state:
+		st.session_state[page_key] = 1
+
+	total = len(filtered_indices)
+	current_page_size = st.session_state[page_size_key]
+	page_count = max(1, math.ceil(total / current_page_size))
+
+	# The rows may have been reduced by the search or a refresh
+	if st.session_state[page_key] > page_count:
+		st.session_state[page_key] = page_count
+
+	start = (st.session_state[page_key] - 1) * current_page_size
+	end = min(start + current_page_size, total)
+
+	page_size_options = sorted({*PAGE_SIZE_OPTIONS, current_page_size})
+	if total > page_size_options[0]:
+		indicator_column, page_size_column, page_column = st.columns([4, 1, 1], vertical_alignment="bottom")
+		page_size_column.selectbox(
+			"Rows per page",
+			page_size_options,
+			key=page_size_key,
+			on_change=reset_page,
+			args=(key,),
+		)
+		# Fixed label and bounds, otherwise the widget would be a new one (losing its value) when they change
+		page_column.number_input(
+			"Page",
+			min_value=1,
+			step=1,
+			key=page_key,
+		)
+	else:
+		indicator_column = st.container()
+
+	if total > 0:
+		indicator_column.caption(f"Rows {start + 1}–{end} of {total} · Page {st.session_state[page_key]} of {page_count}")
+
+	return filtered_indices[start:end]
+
+
+def build_grid_frame(data: list[dict], column_settings: dict) -> pd.DataFrame:
+	"""Builds the columnar frame shown by the grid, a column for each entry of `column_settings`."""
+	columns = {}
+	for name, settings in column_settings.items():
+		data_name = settings.get("data_name", None)
+		if data_name is None:
+			raise ValueError(f"data_name must be defined in column_settings for '{name}'")
+
+		columns[name] = [strip_markdown(data_row[data_name]) for data_row in data]
+
+	return pd.DataFrame(columns, columns=list(column_settings.keys()))
+
+
+def render_grid(key: str, data: list[dict], column_settings: dict, button_settings: dict):
+	"""Renders the rows in a single dataframe, with the buttons of the selected row below it."""
+	if len(data) == 0:
+		st.caption("No data")
+		return
+
+	column_config = {
+		name: st.column_config.TextColumn(width="large" if settings.get("column_width", 1) > 1 else None)
+		for name, settings in column_settings.items()
+	}
+
+	event = st.dataframe(
+		build_grid_frame(data, column_settings),
+		key=f"{key}-grid",
+		on_select="rerun",
+		selection_mode="single-row",
+		hide_index=True,
+		use_container_width=True,
+		column_config=column_config,
+	)
+
+	# The selection is a position, it may be stale if the data has changed meanwhile
+	selected_rows = [index for index in event.selection.rows if index < len(data)]
+	selected_row = data[selected_rows[0]] if selected_rows else None
+
+	# Action bar, shared by all the rows
+	if len(button_settings) == 0:
+		return
+
+	if selected_row is None:
+		st.caption("Select a row to act on it")
+
+	with st.container():
+		columns_buttons = st.columns(len(button_settings) + 4)
+		for index, (button_label, button_configuration) in enumerate(button_settings.items()):
+			with columns_buttons[index]:
+				render_buttons(
+					{button_label: button_configuration},
+					"selected",
+					selected_row if selected_row is not None else {},
+					key,
+					True,
+					disabled=selected_row is None
+				)
+
+
+def render_buttons(button_settings, row_key, data_row, key, use_width, disabled: bool = False):
 	all_disabled_buttons = data_row.get("buttons_disabled", None)
 
 	for button_label, button_configuration in button_settings.items():
 		button_type = "primary" if button_configuration.get("primary", False) else "secondary"
 
-		if all_disabled_buttons is None:
+		if disabled:
+			button_disabled = True
+		elif all_disabled_buttons is None:
 			button_disabled = False
 		else:
 			button_disabled = all_disabled_buttons.get(button_label, False)
@@ -145,7 +396,7 @@ def render_buttons(button_settings, data_index, data_row, key, use_width):
 		else:
 			button_label_to_show = f"{button_icon} {button_label}"  # Show icon and label
 
-		if st.button(key=f"{key}_button_{button_label}_{data_index}",
+		if st.button(key=f"{key}_button_{button_label}_{row_key}",
 					 label=button_label_to_show,
 					 type=button_type,
 					 disabled=button_disabled,
@@ -153,4 +404,8 @@ def render_buttons(button_settings, data_index, data_row, key, use_width):
 					 use_container_width=use_width):
 			button_callback = button_configuration.get("callback", None)
 			if not button_disabled and button_callback is not None:
-				button_callback(data_row=data_row)
+				# Imported here, so that the tables can be used without a database
+				from backend.database import database_action
+
+				with database_action(f"{key}/{button_label}"):
+					button_callback(data_row=data_row)
@@ -0,0 +1,35 @@
+import streamlit as st
+
+from utils.rerun_profiler import PROFILER_ENABLED_KEY, RerunProfile
+from utils.session_state import get_session_state_item, set_session_state_item
+
+
+def rerun_profiler_toggle():
+	"""Renders the toggle of the profiler in the sidebar, for the admins only (see `page_setup`)."""
+	with st.sidebar:
+		enabled = st.toggle(
+			":material/speed: Profile reruns",
+			value=bool(get_session_state_item(PROFILER_ENABLED_KEY)),
+			help="Samples the next reruns of the pages in this session and shows their hottest functions "
+				 "at the bottom of the page. The last profiles are kept in the Admin Tools page.",
+		)
+	set_session_state_item(PROFILER_ENABLED_KEY, enabled)
+
+
+def rerun_profile_report(profile: RerunProfile, key: str):
+	"""
+	Renders the hottest functions of a profile and the download of its stacks, for a flamegraph viewer.
+	:param key: Unique key of the component
+	"""
+	st.caption(f"`{profile.page}` at {profile.started_at:%H:%M:%S}: "
+			   f"{profile.duration * 1000:.0f} ms, {profile.samples} samples every {profile.sample_interval * 1000:.0f} ms")
+	st.dataframe(profile.hot_functions(), hide_index=True, use_container_width=True)
+	st.download_button(
+		"Download stacks for a flamegraph",
+		data=profile.folded_stacks(),
+		file_name=f"profile_{profile.started_at:%Y%m%d_%H%M%S}.folded",
+		mime="text/plain",
+		icon=":material/download:",
+		help="The folded stacks, for flamegraph.pl or speedscope.app",
+		key=key,
+	)
@@ -60,6 +60,14 @@ def sidebar_menu(role: Role | None, full_name: str | None):
 					page=PageNames.MAIN_DASHBOARD.file_name,
 					label=PageNames.MAIN_DASHBOARD.label
 				)
+				st.page_link(
+					page=PageNames.BATCH_EXEC.file_name,
+					label=PageNames.BATCH_EXEC.label
+				)
+				st.page_link(
+					page=PageNames.FILE_PUSH.file_name,
+					label=PageNames.FILE_PUSH.label
+				)
 				st.page_link(
 					page=PageNames.MANAGE_USER_LIST.file_name,
 					label=PageNames.MANAGE_USER_LIST.label
@@ -82,6 +90,14 @@ def sidebar_menu(role: Role | None, full_name: str | None):
 					page=PageNames.MAIN_DASHBOARD.file_name,
 					label=PageNames.MAIN_DASHBOARD.label
 				)
+				st.page_link(
+					page=PageNames.BATCH_EXEC.file_name,
+					label=PageNames.BATCH_EXEC.label
+				)
+				st.page_link(
+					page=PageNames.FILE_PUSH.file_name,
+					label=PageNames.FILE_PUSH.label
+				)
 				st.page_link(
 					page=PageNames.MANAGE_USER_LIST.file_name,
 					label=PageNames.MANAGE_USER_LIST.label
@@ -90,6 +106,10 @@ def sidebar_menu(role: Role | None, full_name: str | None):
 					page=PageNames.MANAGE_WAITING_LIST.file_name,
 					label=PageNames.MANAGE_WAITING_LIST.label
 				)
+				st.page_link(
+					page=PageNames.ADMIN_TOOLS.file_name,
+					label=PageNames.ADMIN_TOOLS.label
+				)
 				st.page_link(
 					page=PageNames.USER_SETTINGS.file_name,
 					label=PageNames.USER_SETTINGS.label
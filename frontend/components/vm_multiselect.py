@@ -0,0 +1,27 @@
+import streamlit as st
+
+
+def vm_multiselect(key: str, vm_data: dict[int, dict], label: str = "VMs") -> list[int]:
+	"""
+	Renders a multiselect of VMs with a checkbox to select all of them.
+
+	:param key: Unique key of the component
+	:param vm_data: The VM dictionaries indexed by VM id (see `get_connectable_vm_data_from_db`)
+	:param label: The label of the multiselect
+	:return: The ids of the selected VMs
+	"""
+	def vm_label(vm_id: int) -> str:
+		vm = vm_data[vm_id]["original_object"]
+		return f"{vm.name} ({vm.username}@{vm.host}:{vm.port})"
+
+	select_all = st.checkbox("Select all VMs", key=f"{key}_select_all")
+	selected_ids = st.multiselect(
+		label,
+		options=list(vm_data.keys()),
+		default=list(vm_data.keys()) if select_all else None,
+		format_func=vm_label,
+		disabled=select_all,
+		key=f"{key}_selected",
+	)
+
+	return list(vm_data.keys()) if select_all else selected_ids
@@ -47,10 +47,9 @@ def change_role_form(user: User, requesting_role: Role):
 		try:
 			edit_role(user.username, Role.from_phrase(selected_role))
 
-			set_session_state_item("selected_user", user)
 			set_session_state_item("role-change-success", True)
 
-			st.cache_data.clear() # Refresh table data
+			st.cache_data.clear() # Refresh table data and the user in its page
 			st.rerun()
 		except UpdateError as e:
 			error_message(intro="", cause=str(e))
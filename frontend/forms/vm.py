@@ -8,7 +8,7 @@ from exceptions import NotFoundError
 from frontend.components import error_message, error_toast
 from frontend.components.confirm import confirm_dialog
 from frontend.page_names import PageNames
-from utils.session_state import set_session_state_item, pop_session_state_item
+from utils.session_state import pop_session_state_item
 
 
 ################################
@@ -160,7 +160,12 @@ def vm_delete_form(selected_vm: VirtualMachine):
 	def vm_deletion_process():
 		with get_db() as db:
 			try:
-				delete_from_db(db, selected_vm)
+				# The selected VM may be a copy from the cache, the one of this session is deleted
+				vm = VirtualMachine.find_by_id(db, selected_vm.id)
+				if vm is None:
+					raise Exception("VM not found")
+
+				delete_from_db(db, vm)
 			except Exception as e:
 				error_toast(
 					unknown_exception=e,
@@ -205,12 +210,11 @@ def vm_password_edit_form(selected_vm: VirtualMachine, user: User, key='Change V
 
 						vm.password = VirtualMachine.encrypt_password(password)
 						db.commit()
-						db.refresh(vm)
-						set_session_state_item("selected_vm", vm)
 					except Exception as e:
 						st.error(f"An error has occurred: **{e}**")
 					else:
 						st.success(f"Edited")
+						st.cache_data.clear()  # Reload the VM in its page
 						switch_page(PageNames.DETAILS_VM())
 
 	with st.form(key=key, clear_on_submit=True):
@@ -244,12 +248,11 @@ def vm_password_delete_form(selected_vm: VirtualMachine, key: str = 'Delete VM p
 
 				vm.password = None
 				db.commit()
-				db.refresh(vm)
-				set_session_state_item("selected_vm", vm)
 			except Exception as e:
 				st.error(f"An error has occurred: **{e}**")
 			else:
 				st.success(f"Edited")
+				st.cache_data.clear()  # Reload the VM in its page
 				switch_page(PageNames.DETAILS_VM())
 
 	with st.form(key=key):
@@ -286,12 +289,11 @@ def vm_ssh_key_edit_form(selected_vm: VirtualMachine, user: User, key='Change VM
 
 						vm.ssh_key = VirtualMachine.encrypt_key(ssh_key.getvalue())
 						db.commit()
-						db.refresh(vm)
-						set_session_state_item("selected_vm", vm)
 					except Exception as e:
 						st.error(f"An error has occurred: **{e}**")
 					else:
 						st.success(f"Edited")
+						st.cache_data.clear()  # Reload the VM in its page
 						switch_page(PageNames.DETAILS_VM())
 
 	with st.form(key=key, clear_on_submit=True):
@@ -325,12 +327,11 @@ def ssh_key_delete_form(selected_vm: VirtualMachine, key: str = 'Delete VM SSH K
 
 				vm.ssh_key = None
 				db.commit()
-				db.refresh(vm)
-				set_session_state_item("selected_vm", vm)
 			except Exception as e:
 				st.error(f"An error has occurred: **{e}**")
 			else:
 				st.success(f"Edited")
+				st.cache_data.clear()  # Reload the VM in its page
 				switch_page(PageNames.DETAILS_VM())
 
 	with st.form(key=key):
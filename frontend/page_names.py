@@ -16,6 +16,7 @@ class PageNames:
 
 	- To get the file name, call the page as a function (e.g. `PageNames.ERROR()`) or use the `file_name` attribute.
 	- To get the label, use the `label` attribute.
+	- To get all the pages, call `PageNames.all()`.
 	"""
 	ERROR = PageEntry(
 		"pages/error.py",
@@ -65,6 +66,26 @@ class PageNames:
 		"Manage Waiting List"
 	)
 
+	BATCH_EXEC = PageEntry(
+		"pages/batch_exec.py",
+		"Run Command on VMs"
+	)
+
+	FILE_PUSH = PageEntry(
+		"pages/file_push.py",
+		"Transfer Files to VMs"
+	)
+
+	VM_IMPORT = PageEntry(
+		"pages/vm_import.py",
+		"Import VMs"
+	)
+
+	ADMIN_TOOLS = PageEntry(
+		"pages/admin_tools.py",
+		"Admin Tools"
+	)
+
 	DETAILS_VM = PageEntry(
 		"pages/vm_details.py",
 		"VM Details"
@@ -73,3 +94,8 @@ class PageNames:
 		"pages/user_details.py",
 		"User Details"
 	)
+
+	@classmethod
+	def all(cls) -> list[PageEntry]:
+		"""All the pages of the application, in the order they are declared."""
+		return [value for value in vars(cls).values() if isinstance(value, PageEntry)]
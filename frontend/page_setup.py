@@ -10,6 +10,7 @@ from backend.authentication.current_user_data import is_logged_in, get_current_u
 from backend.authentication.authenticator_creation import get_or_create_authenticator_object
 from backend.models import User
 from backend.role import Role, role_in_white_list
+from frontend.components.rerun_profiler import rerun_profiler_toggle
 from frontend.components.sidebar_menu import sidebar_menu
 from frontend.page_names import PageNames
 
@@ -134,6 +135,10 @@ def page_setup(layout: Literal["centered", "wide"] = "wide",
 	# Sidebar
 	sidebar_menu(user_role, user_full_name)
 
+	# Profiler of the reruns, applied by `app.py` from the next rerun
+	if user_role == Role.ADMIN:
+		rerun_profiler_toggle()
+
 	# Debug
 	if print_session_state:
 		st.write(st.session_state)
@@ -0,0 +1,193 @@
+import io
+from datetime import datetime
+
+import streamlit as st
+from streamlit import switch_page
+
+from backend.role import Role
+
+from frontend import PageNames, page_setup
+from frontend.components import rerun_profile_report
+from utils.data_export import EXPORT_FORMATS, EXPORT_TABLES, export_tables_to_zip, generate_export_key
+from utils.metrics import REGISTRY, cache_hit_ratios
+from utils.query_log import get_query_stats
+from utils.rerun_profiler import get_stored_profiles
+from utils.rerun_timing import get_rerun_timings
+from utils.session_memory import get_session_tracker, session_state_report, cache_report
+
+FORMAT_LABELS = {
+	"jsonl": "JSON Lines",
+	"csv": "CSV",
+	"parquet": "Parquet",
+}
+
+################################
+#            SETUP             #
+################################
+
+psd = page_setup(
+	title=PageNames.ADMIN_TOOLS.label,
+	access_control="accepted_roles_only",
+	accepted_roles=[Role.ADMIN],
+)
+
+current_username = psd.user_name
+current_role = psd.user_role
+
+if current_username is None or current_role is None:
+	switch_page(PageNames.ERROR())
+
+
+################################
+#             PAGE             #
+################################
+
+st.title(":blue[:material/admin_panel_settings:] Admin Tools")
+
+st.header("Rerun timings")
+st.write("How long the pages take to run, since the server started. "
+		 "A full rerun runs the whole page, a fragment rerun only the part that was interacted with "
+		 "(e.g. searching, sorting or paging a table). "
+		 "`queries_p50` is the median number of database queries sent in a rerun.")
+
+rerun_stats = get_rerun_timings().stats()
+if len(rerun_stats) == 0:
+	st.info("No page has run yet.")
+else:
+	st.dataframe(rerun_stats, hide_index=True, use_container_width=True)
+
+if st.button("Reset timings", icon=":material/restart_alt:"):
+	get_rerun_timings().clear()
+	st.rerun()
+
+st.header("Rerun profiles")
+st.write("The last reruns profiled in this session. Turn on **Profile reruns** in the sidebar, "
+		 "then open the slow page: its reruns are sampled until the toggle is turned off. "
+		 "The downloaded stacks can be opened in a flamegraph viewer, such as speedscope.app.")
+
+stored_profiles = get_stored_profiles()
+if len(stored_profiles) == 0:
+	st.info("No rerun has been profiled in this session.")
+else:
+	selected_profile = st.selectbox(
+		"Profile",
+		options=range(len(stored_profiles)),
+		format_func=lambda index: f"{stored_profiles[index].page} at {stored_profiles[index].started_at:%H:%M:%S} "
+								  f"({stored_profiles[index].duration * 1000:.0f} ms)",
+	)
+	rerun_profile_report(stored_profiles[selected_profile], key="admin_tools_rerun_profile")
+
+st.header("Database queries")
+st.write("The SQL statements sent by each page since the server started, grouped by their shape "
+		 "(the values are replaced by `?`), with the slowest overall first. "
+		 "The statements slower than `slow_query_threshold_ms` are also written to the query log.")
+
+query_stats = get_query_stats()
+statement_stats = query_stats.statement_stats()
+if len(statement_stats) == 0:
+	st.info("No query has been sent yet.")
+else:
+	st.dataframe(statement_stats, hide_index=True, use_container_width=True)
+
+st.subheader("Repeated queries")
+st.write("The statements sent at least `repeated_query_threshold` times in a single run of a page or of an action, "
+		 "usually a query or a commit inside a loop (N+1 queries) that could be a single statement.")
+
+repeated_queries = query_stats.repeated_queries()
+if len(repeated_queries) == 0:
+	st.info("No repeated query has been found.")
+else:
+	st.dataframe(repeated_queries, hide_index=True, use_container_width=True)
+
+if st.button("Reset query statistics", icon=":material/restart_alt:"):
+	query_stats.clear()
+	st.rerun()
+
+st.header("Memory")
+st.write("The approximate memory used by each browser session and by the cached data of this server. "
+		 "The heavy state of the sessions idle for longer than `idle_session_eviction_minutes` is dropped, "
+		 "and rebuilt when they come back.")
+
+# Measuring every session takes a while, only when asked
+if st.button("Measure memory", icon=":material/memory:"):
+	st.subheader("Sessions")
+	st.dataframe(get_session_tracker().session_reports(), hide_index=True, use_container_width=True)
+
+	st.subheader("Caches")
+	st.dataframe(cache_report(), hide_index=True, use_container_width=True)
+
+	st.subheader("This session")
+	st.dataframe(session_state_report(), hide_index=True, use_container_width=True)
+
+st.header("Metrics")
+st.write("The counters and the histograms of this server in the Prometheus text format. "
+		 "If `metrics_port` is set, they are also served on that port at `/metrics`, for Prometheus to scrape.")
+
+st.subheader("Cache hit ratios")
+cache_ratios = cache_hit_ratios()
+if len(cache_ratios) == 0:
+	st.info("No cached function has been called yet.")
+else:
+	st.dataframe(cache_ratios, hide_index=True, use_container_width=True)
+
+if st.button("Show all metrics", icon=":material/monitoring:"):
+	st.code(REGISTRY.exposition(), language=None)
+
+st.header("Export data")
+st.write("Exports the users, the VMs and the bookmarks in a zip archive, with a file for each table. "
+		 "The same export is available from the command line with `python cli.py export`.")
+
+with st.form("data_export_form"):
+	tables = st.multiselect("Tables", options=list(EXPORT_TABLES.keys()), default=list(EXPORT_TABLES.keys()))
+	export_format = st.radio(
+		"Format",
+		options=EXPORT_FORMATS,
+		format_func=lambda key: FORMAT_LABELS[key],
+		horizontal=True,
+	)
+	include_credentials = st.toggle(
+		"Include the credentials",
+		help="The VM passwords and SSH keys are encrypted with the export key, the user passwords are already hashed.",
+	)
+	export_key = st.text_input(
+		"Export key",
+		type="password",
+		help="A Fernet key, a new one is generated if empty.",
+	)
+	submitted = st.form_submit_button("Prepare export", type="primary", icon=":material/database:")
+
+if submitted:
+	if len(tables) == 0:
+		st.error("Please select at least one table.")
+		st.stop()
+
+	generated_key = None
+	if include_credentials and not export_key.strip():
+		generated_key = generate_export_key()
+
+	# The rows are streamed from the database, but the download button needs the whole archive
+	archive = io.BytesIO()
+	try:
+		with st.spinner("Exporting..."):
+			export_tables_to_zip(
+				archive,
+				tables,
+				export_format,
+				include_credentials=include_credentials,
+				export_key=generated_key or export_key.strip().encode("utf-8") or None,
+			)
+	except ValueError as e:
+		st.error(str(e))
+		st.stop()
+
+	if generated_key is not None:
+		st.warning("The credentials are encrypted with this key, store it safely: it is not saved anywhere.")
+		st.code(generated_key.decode("utf-8"), language=None)
+
+	st.download_button(
+		"Download export",
+		data=archive.getvalue(),
+		file_name=f"vm_lab_export_{datetime.now():%Y%m%d_%H%M%S}.zip",
+		mime="application/zip",
+		icon=":material/download:",
+	)
@@ -0,0 +1,126 @@
+import time
+
+import streamlit as st
+from streamlit import switch_page
+
+from backend.role import Role
+
+from frontend import PageNames, page_setup
+from frontend.components import vm_multiselect
+from utils.batch_exec import BatchTarget, build_batch_targets, run_command_on_targets
+from utils.refresh_db_functions import get_connectable_vm_data_from_db
+
+MAX_SHOWN_OUTPUT = 20_000
+RENDER_INTERVAL = 0.25
+
+################################
+#            SETUP             #
+################################
+
+psd = page_setup(
+	title=PageNames.BATCH_EXEC.label,
+	access_control="accepted_roles_only",
+	accepted_roles=[Role.ADMIN, Role.MANAGER],
+)
+
+current_username = psd.user_name
+current_role = psd.user_role
+
+if current_username is None or current_role is None:
+	switch_page(PageNames.ERROR())
+
+
+################################
+#             VMS              #
+################################
+
+vm_rows = get_connectable_vm_data_from_db(current_username, current_role)
+
+
+################################
+#             PAGE             #
+################################
+
+st.title(":blue[:material/terminal:] Run Command on VMs")
+st.write("Runs a shell command on many VMs at the same time, using their stored credentials.")
+
+selected_ids = vm_multiselect("batch_exec_vms", vm_rows)
+
+with st.form("batch_exec_form"):
+	command = st.text_area("Command", placeholder="uptime")
+	host_timeout = st.number_input(
+		"Timeout for each VM (seconds)",
+		min_value=1,
+		value=int(st.secrets.get("batch_exec_host_timeout", 60)),
+	)
+	submitted = st.form_submit_button("Run", type="primary", icon=":material/play_arrow:")
+
+if submitted:
+	if not command.strip():
+		st.error("Please enter a command.")
+		st.stop()
+
+	if len(selected_ids) == 0:
+		st.error("Please select at least one VM.")
+		st.stop()
+
+	targets, skipped = build_batch_targets(vm_rows, selected_ids)
+	if skipped:
+		st.warning(f"Skipped the VMs without stored credentials: {', '.join(skipped)}")
+
+	if len(targets) == 0:
+		st.stop()
+
+	st.divider()
+	progress_bar = st.progress(0.0, text=f"0 / {len(targets)} VMs done")
+	summary_placeholder = st.empty()
+
+	outputs = {target.vm_id: "" for target in targets}
+	statuses = {target.vm_id: ":material/schedule: Waiting" for target in targets}
+	placeholders = {target.vm_id: st.empty() for target in targets}
+	last_rendered_at = {target.vm_id: 0.0 for target in targets}
+	exit_statuses = {}
+	errors = {}
+
+	def render_target(target: BatchTarget):
+		with placeholders[target.vm_id].container(border=True):
+			st.markdown(f"**{target.name}** — {statuses[target.vm_id]}")
+			if outputs[target.vm_id]:
+				st.code(outputs[target.vm_id][-MAX_SHOWN_OUTPUT:], language=None)
+		last_rendered_at[target.vm_id] = time.monotonic()
+
+	for target in targets:
+		render_target(target)
+
+	for event in run_command_on_targets(targets, command, host_timeout=host_timeout):
+		target = event.target
+
+		if event.kind == "started":
+			statuses[target.vm_id] = ":material/sync: Running"
+		elif event.kind == "output":
+			# Only the tail is shown, no need to keep everything in memory
+			outputs[target.vm_id] = (outputs[target.vm_id] + event.data)[-MAX_SHOWN_OUTPUT:]
+			if event.timestamp - last_rendered_at[target.vm_id] < RENDER_INTERVAL:
+				continue
+		elif event.kind == "finished":
+			exit_statuses[target.vm_id] = event.exit_status
+			if event.exit_status == 0:
+				statuses[target.vm_id] = ":green[:material/check_circle: Exit status 0]"
+			else:
+				statuses[target.vm_id] = f":red[:material/cancel: Exit status {event.exit_status}]"
+		elif event.kind == "error":
+			errors[target.vm_id] = event.data
+			statuses[target.vm_id] = f":red[:material/error: {event.data}]"
+
+		render_target(target)
+
+		done = len(exit_statuses) + len(errors)
+		progress_bar.progress(done / len(targets), text=f"{done} / {len(targets)} VMs done")
+
+	succeeded = sum(1 for exit_status in exit_statuses.values() if exit_status == 0)
+	failed = len(exit_statuses) - succeeded
+	summary_placeholder.markdown(
+		f":green[**{succeeded}** succeeded] · "
+		f":red[**{failed}** non-zero exit status] · "
+		f":red[**{len(errors)}** unreachable or timed out]"
+	)
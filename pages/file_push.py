@@ -0,0 +1,182 @@
+import posixpath
+
+import streamlit as st
+from streamlit import switch_page
+
+from backend.role import Role
+
+from frontend import PageNames, page_setup
+from frontend.components import vm_multiselect
+from utils.batch_exec import BatchTarget, build_batch_targets
+from utils.refresh_db_functions import get_connectable_vm_data_from_db
+from utils.sftp_transfer import push_file_to_targets, download_from_target
+
+################################
+#            SETUP             #
+################################
+
+psd = page_setup(
+	title=PageNames.FILE_PUSH.label,
+	access_control="accepted_roles_only",
+	accepted_roles=[Role.ADMIN, Role.MANAGER],
+)
+
+current_username = psd.user_name
+current_role = psd.user_role
+
+if current_username is None or current_role is None:
+	switch_page(PageNames.ERROR())
+
+
+################################
+#             VMS              #
+################################
+
+vm_rows = get_connectable_vm_data_from_db(current_username, current_role)
+
+
+def format_size(size: int) -> str:
+	for unit in ["B", "KB", "MB", "GB"]:
+		if size < 1024 or unit == "GB":
+			return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+		size /= 1024
+
+
+def push_file(uploaded_file, remote_directory: str, selected_ids: list[int]):
+	if uploaded_file is None:
+		st.error("Please choose a file.")
+		return
+
+	if len(selected_ids) == 0:
+		st.error("Please select at least one VM.")
+		return
+
+	targets, skipped = build_batch_targets(vm_rows, selected_ids)
+	if skipped:
+		st.warning(f"Skipped the VMs without stored credentials: {', '.join(skipped)}")
+
+	if len(targets) == 0:
+		return
+
+	remote_path = posixpath.join(remote_directory.strip(), uploaded_file.name)
+	data = uploaded_file.getvalue()
+
+	st.divider()
+	st.write(f"Uploading `{remote_path}` ({format_size(len(data))})")
+	overall_progress = st.progress(0.0, text=f"0 / {len(targets)} VMs done")
+	summary_placeholder = st.empty()
+
+	placeholders = {target.vm_id: st.empty() for target in targets}
+	done = 0
+	errors = {}
+
+	def render_target(target: BatchTarget, fraction: float, text: str):
+		placeholders[target.vm_id].progress(fraction, text=f"**{target.name}** — {text}")
+
+	for target in targets:
+		render_target(target, 0.0, ":material/schedule: Waiting")
+
+	for event in push_file_to_targets(targets, data, remote_path):
+		target = event.target
+
+		if event.kind == "started":
+			render_target(target, 0.0, ":material/sync: Uploading")
+		elif event.kind == "progress":
+			render_target(
+				target,
+				event.transferred / event.total,
+				f":material/sync: {format_size(event.transferred)} / {format_size(event.total)}"
+			)
+		elif event.kind == "finished":
+			done += 1
+			render_target(target, 1.0, ":green[:material/check_circle: Done]")
+		elif event.kind == "error":
+			done += 1
+			errors[target.vm_id] = event.data
+			render_target(target, 0.0, f":red[:material/error: {event.data}]")
+
+		overall_progress.progress(done / len(targets), text=f"{done} / {len(targets)} VMs done")
+
+	summary_placeholder.markdown(
+		f":green[**{len(targets) - len(errors)}** uploaded] · "
+		f":red[**{len(errors)}** failed]"
+	)
+
+
+def download_file(vm_id: int | None, remote_path: str):
+	remote_path = remote_path.strip()
+	if vm_id is None or not remote_path:
+		st.error("Please select a VM and enter the path of the file.")
+		return
+
+	targets, skipped = build_batch_targets(vm_rows, [vm_id])
+	if skipped:
+		st.error(f"The VM `{skipped[0]}` has no stored credentials.")
+		return
+
+	download_progress = st.progress(0.0, text="Connecting...")
+
+	def on_progress(event):
+		if event.total > 0:
+			download_progress.progress(
+				event.transferred / event.total,
+				text=f"{format_size(event.transferred)} / {format_size(event.total)}"
+			)
+
+	try:
+		content = download_from_target(targets[0], remote_path, on_progress=on_progress)
+	except Exception as e:
+		download_progress.empty()
+		st.error(f"Could not download the file: {e}")
+		return
+
+	download_progress.progress(1.0, text=f"Downloaded {format_size(len(content))}")
+	st.download_button(
+		"Save file",
+		data=content,
+		file_name=posixpath.basename(remote_path),
+		icon=":material/save:",
+	)
+
+
+################################
+#             PAGE             #
+################################
+
+st.title(":blue[:material/upload_file:] Transfer Files to VMs")
+
+upload_tab, download_tab = st.tabs(["Upload to many VMs", "Download from a VM"])
+
+with upload_tab:
+	st.write("Uploads the same file to many VMs at the same time, using their stored credentials.")
+
+	selected_ids = vm_multiselect("file_push_vms", vm_rows)
+
+	with st.form("file_push_form"):
+		uploaded_file = st.file_uploader("File")
+		remote_directory = st.text_input(
+			"Remote directory",
+			placeholder="Relative to the home directory if empty or not starting with /",
+		)
+		submitted = st.form_submit_button("Upload", type="primary", icon=":material/upload:")
+
+	if submitted:
+		push_file(uploaded_file, remote_directory, selected_ids)
+
+with download_tab:
+	st.write("Downloads a file from a VM, using its stored credentials.")
+
+	with st.form("file_download_form"):
+		vm_id = st.selectbox(
+			"VM",
+			options=list(vm_rows.keys()),
+			format_func=lambda key: vm_rows[key]["original_object"].name,
+		)
+		remote_path = st.text_input(
+			"Remote file",
+			placeholder="Relative to the home directory if not starting with /",
+		)
+		submitted = st.form_submit_button("Download", type="primary", icon=":material/download:")
+
+	if submitted:
+		download_file(vm_id, remote_path)
@@ -1,14 +1,14 @@
 import streamlit as st
 from streamlit import switch_page
 
-from backend.role import Role, role_has_enough_priority
+from backend.role import Role
 
 from frontend import PageNames, page_setup
 from frontend.components import interactive_data_table
 from frontend.click_handlers.vm import vm_connect_clicked, vm_add_clicked, vm_edit_clicked, vm_delete_clicked, \
 	vm_assign_clicked
 from frontend.click_handlers.bookmark import bookmark_add_clicked, bookmark_edit_clicked, bookmark_delete_clicked
-from utils.refresh_db_functions import get_vm_data_from_db, get_bookmark_data_from_db
+from utils.refresh_db_functions import get_dashboard_data_from_db
 
 ################################
 #            SETUP             #
@@ -26,6 +26,9 @@ current_role = psd.user_role
 if current_username is None or current_role is None:
 	switch_page(PageNames.ERROR())
 
+# All the tables of the page are loaded together
+dashboard_data = get_dashboard_data_from_db(current_username, current_role)
+
 
 ################################
 #             PAGE             #
@@ -33,17 +36,23 @@ if current_username is None or current_role is None:
 
 if current_role != Role.REGULAR:
 	st.title(f":blue[:material/tv:] My VMs")
-	st.button(
+	add_column, import_column = st.columns([1, 8])
+	add_column.button(
 		"Add VM",
 		type="primary",
 		icon=":material/add:",
 		on_click=lambda: vm_add_clicked(current_username)
 	)
+	import_column.page_link(
+		page=PageNames.VM_IMPORT.file_name,
+		label=PageNames.VM_IMPORT.label,
+		icon=":material/upload:",
+	)
 
 	interactive_data_table(
 		key="data_table_this_user_vms",
-		data=get_vm_data_from_db(current_username, "my_owned_vms"),
-		refresh_data_callback=lambda: get_vm_data_from_db(current_username, "my_owned_vms"),
+		data=dashboard_data["my_owned_vms"],
+		refresh_data_callback=lambda: get_dashboard_data_from_db(current_username, current_role)["my_owned_vms"],
 		column_settings={
 			"Name": {
 				"column_width": 1,
@@ -94,8 +103,8 @@ if current_role == Role.SIDEKICK or current_role == Role.REGULAR:
 	st.title(f":green[:material/tv:] VMs Assigned to Me")
 	interactive_data_table(
 		key="data_table_assigned_vms_to_this_user",
-		data=get_vm_data_from_db(current_username, "my_assigned_vms"),
-		refresh_data_callback=lambda: get_vm_data_from_db(current_username, "my_assigned_vms"),
+		data=dashboard_data["my_assigned_vms"],
+		refresh_data_callback=lambda: get_dashboard_data_from_db(current_username, current_role)["my_assigned_vms"],
 		column_settings={
 			"Name": {
 				"column_width": 1,
@@ -138,8 +147,8 @@ if current_role != Role.REGULAR:
 
 	interactive_data_table(
 		key="data_table_bookmarks",
-		data=get_bookmark_data_from_db(current_username),
-		refresh_data_callback=lambda: get_bookmark_data_from_db(current_username),
+		data=dashboard_data["bookmarks"],
+		refresh_data_callback=lambda: get_dashboard_data_from_db(current_username, current_role)["bookmarks"],
 		column_settings={
 			"Name": {
 				"column_width": 1,
@@ -182,8 +191,8 @@ if current_role == Role.ADMIN or current_role == Role.MANAGER:
 
 	interactive_data_table(
 		key="data_table_all_assigned_vms",
-		data=get_vm_data_from_db(current_username, "all_assigned_vms"),
-		refresh_data_callback=lambda: get_vm_data_from_db(current_username, "all_assigned_vms"),
+		data=dashboard_data["all_assigned_vms"],
+		refresh_data_callback=lambda: get_dashboard_data_from_db(current_username, current_role)["all_assigned_vms"],
 		column_settings={
 			"Name": {
 				"column_width": 1,
@@ -238,20 +247,14 @@ if current_role == Role.ADMIN or current_role == Role.MANAGER:
 		filters_expanded=False
 	)
 
-minimum_permissions = st.secrets["vm_sharing_minimum_permissions"]
-
-try:
-	minimum_role = Role.from_phrase(minimum_permissions)
-except ValueError:
-	minimum_role = None # "disabled" in secrets.toml
-
-if minimum_role and role_has_enough_priority(current_role, minimum_role):
+# Only if the role is allowed by `vm_sharing_minimum_permissions`
+if "all_owned_vms" in dashboard_data:
 	st.divider()
 	st.title(":red[:material/lan:] Other Users' VMs")
 	interactive_data_table(
 		key="data_table_all_users_vms",
-		data=get_vm_data_from_db(current_username, "all_owned_vms"),
-		refresh_data_callback=lambda: get_vm_data_from_db(current_username, "all_owned_vms"),
+		data=dashboard_data["all_owned_vms"],
+		refresh_data_callback=lambda: get_dashboard_data_from_db(current_username, current_role)["all_owned_vms"],
 		column_settings={
 			"Name": {
 				"column_width": 1,
@@ -4,8 +4,12 @@ import streamlit.components.v1 as stv1
 from streamlit import switch_page
 
 from backend import Role
+from backend.database import get_db
+from backend.models import VirtualMachine
 
 from frontend import PageNames, page_setup
+from frontend.click_handlers.vm import vm_open_files_clicked
+from frontend.components import builtin_terminal, error_message
 
 from utils.session_state import get_session_state_item
 
@@ -14,7 +18,7 @@ from utils.session_state import get_session_state_item
 #            SETUP             #
 ################################
 
-page_setup(
+psd = page_setup(
 	title=PageNames.VM_CONNECTION.label,
 	access_control="accepted_roles_only",
 	accepted_roles=[Role.ADMIN, Role.MANAGER, Role.SIDEKICK, Role.REGULAR],
@@ -24,14 +28,39 @@ selected_vm = get_session_state_item("selected_vm")
 ssh_url = get_session_state_item("terminal_page_ssh_connection_url")
 sftp_url = get_session_state_item("terminal_page_sftp_connection_url")
 
-if selected_vm is None or ssh_url is None or sftp_url is None:
+if selected_vm is None or ssh_url is None:
 	switch_page(PageNames.MAIN_DASHBOARD())
 
+
+def open_file_explorer():
+	"""Reads the VM and its owner again, not from the cache, since its sharing is checked before opening the files."""
+	with get_db() as db:
+		vm = VirtualMachine.find_by_id(db, selected_vm.id)
+		if vm is None:
+			error_message(cause=f"The VM `{selected_vm.name}` has been deleted.")
+			return
+		vm_open_files_clicked(vm, psd.user_name)
+
+
 ################################
 #             PAGE             #
 ################################
 
 st.title(f"{PageNames.VM_CONNECTION.label} `{selected_vm.name}`")
 
-stv1.iframe(ssh_url, width=800, height=700)
-stv1.iframe(sftp_url, width=800, height=700)
\ No newline at end of file
+if ssh_url.startswith(("ws://", "wss://")):
+	# Served by the built-in terminal bridge
+	builtin_terminal(ssh_url, height=700)
+else:
+	stv1.iframe(ssh_url, width=800, height=700)
+
+# The file explorer is requested to the SFTP module only when the user asks for it
+with st.expander(":material/folder: Files", expanded=sftp_url is not None):
+	if sftp_url is None:
+		st.button(
+			"Open file explorer",
+			icon=":material/folder_open:",
+			on_click=open_file_explorer
+		)
+	else:
+		stv1.iframe(sftp_url, width=800, height=700)
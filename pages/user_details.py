@@ -3,18 +3,19 @@ from typing import Literal
 import streamlit as st
 from streamlit import switch_page
 
-from backend import Role, get_db
-from backend.authentication.user_data_manipulation import disable_user, delete_user
-from backend.models import User, VirtualMachine
+from backend import Role, database_action
+from backend.authentication.user_data_manipulation import disable_user, delete_user, share_all_vms_of_user
+from backend.models import User
+from backend.models.user import UserSnapshot
 
 from frontend import PageNames, page_setup
 from frontend.click_handlers.vm import vm_connect_clicked, vm_edit_clicked, vm_delete_clicked
 from frontend.components import error_message, confirm_dialog
 from frontend.components.interactive_data_table import interactive_data_table
 from frontend.forms.user import change_role_form
-from utils.refresh_db_functions import get_vm_data_from_db
+from utils.refresh_db_functions import get_vm_data_from_db, get_user_by_id_from_db
 
-from utils.session_state import get_session_state_item, set_session_state_item
+from utils.session_state import get_session_state_item, set_session_state_item, pop_session_state_item
 
 ################################
 #            SETUP             #
@@ -28,9 +29,16 @@ psd = page_setup(
 )
 
 curren_role = psd.user_role
-selected_user: User = get_session_state_item("selected_user")
+selected_user_snapshot: UserSnapshot = get_session_state_item("selected_user")
 
-if selected_user is None or curren_role is None or get_session_state_item("user_has_been_disabled_or_enabled"):
+if selected_user_snapshot is None or curren_role is None or get_session_state_item("user_has_been_disabled_or_enabled"):
+	switch_page(PageNames.MANAGE_USER_LIST())
+
+# Reloaded, since it may have been edited or deleted by someone else
+selected_user: User = get_user_by_id_from_db(selected_user_snapshot.id)
+
+if selected_user is None:
+	pop_session_state_item("selected_user")
 	switch_page(PageNames.MANAGE_USER_LIST())
 
 
@@ -51,24 +59,22 @@ st.write(f"Last Name: {selected_user.last_name}")
 # Role select box
 change_role_form(selected_user, curren_role)
 
+@database_action("Disable user")
 def disable():
 	disable_user(selected_user.username)
 	set_session_state_item("user_has_been_disabled_or_enabled", True)
 
 	# Force all vms to be shared
-	with get_db() as db:
-		vms = VirtualMachine.find_by_user_name(db, selected_user.username)
-		for vm in vms:
-			if not vm.shared:
-				vm.shared = True
-				db.commit()
+	share_all_vms_of_user(selected_user.id)
 
 
+@database_action("Delete user")
 def delete():
 	delete_user(selected_user.username)
 	set_session_state_item("user_has_been_disabled_or_enabled", True)
 
 
+@database_action("Revert disabling")
 def revert():
 	disable_user(selected_user.username, revert=True)
 	set_session_state_item("user_has_been_disabled_or_enabled", True)
@@ -5,10 +5,12 @@ from streamlit import switch_page
 from backend.role import Role
 from backend.database import get_db
 from backend.models import VirtualMachine
+from backend.models.virtual_machine import VirtualMachineSnapshot
 from frontend.page_names import PageNames
 from frontend.page_setup import page_setup
 from frontend.forms.vm import vm_edit_form, vm_delete_form, vm_password_edit_form, vm_password_delete_form, vm_ssh_key_edit_form, ssh_key_delete_form
-from utils.session_state import get_session_state_item
+from utils.refresh_db_functions import get_vm_by_id_from_db
+from utils.session_state import get_session_state_item, pop_session_state_item
 
 psd = page_setup(
 	title="Edit VM",
@@ -16,10 +18,17 @@ psd = page_setup(
 	accepted_roles=[Role.ADMIN, Role.MANAGER, Role.SIDEKICK],
 )
 
-selected_vm: VirtualMachine = get_session_state_item("selected_vm")
+selected_vm_snapshot: VirtualMachineSnapshot = get_session_state_item("selected_vm")
 current_username: str = psd.user_name
 
-if selected_vm is None or current_username is None:
+if selected_vm_snapshot is None or current_username is None:
+	switch_page(PageNames.MAIN_DASHBOARD())
+
+# Reloaded, since it may have been edited or deleted by someone else
+selected_vm: VirtualMachine = get_vm_by_id_from_db(selected_vm_snapshot.id)
+
+if selected_vm is None:
+	pop_session_state_item("selected_vm")
 	switch_page(PageNames.MAIN_DASHBOARD())
 
 st.header(f"Edit VM `{selected_vm.name}`")
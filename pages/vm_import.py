@@ -0,0 +1,112 @@
+import streamlit as st
+from streamlit import switch_page
+
+from backend.role import Role
+
+from frontend import PageNames, page_setup
+from utils.vm_import import VM_IMPORT_COLUMNS, import_vms
+
+EXAMPLE_CSV = (",".join(VM_IMPORT_COLUMNS) + "\n"
+			   "web-01,10.0.0.11,22,student,my-password,,true,\n"
+			   "web-02,10.0.0.12,22,student,,keys/web-02.pem,false,\n")
+
+STAGE_LABELS = {
+	"parse": "Reading the file",
+	"encrypt": "Encrypting the credentials",
+	"probe": "Testing the connections",
+	"insert": "Saving the VMs",
+}
+
+################################
+#            SETUP             #
+################################
+
+psd = page_setup(
+	title=PageNames.VM_IMPORT.label,
+	access_control="accepted_roles_only",
+	accepted_roles=[Role.ADMIN, Role.MANAGER, Role.SIDEKICK],
+)
+
+current_username = psd.user_name
+current_role = psd.user_role
+
+if current_username is None or current_role is None:
+	switch_page(PageNames.ERROR())
+
+
+################################
+#             PAGE             #
+################################
+
+st.title(":blue[:material/upload:] Import VMs")
+st.write("Adds many VMs at once from a CSV, YAML or JSON Lines file. The VMs will be owned by you.")
+
+with st.expander("File format"):
+	st.markdown(f"""
+		The columns (or keys) are `{"`, `".join(VM_IMPORT_COLUMNS)}`:
+		- `name`, `host` and `username` are required, `port` defaults to 22
+		- `password` and `ssh_key_file` are optional, the key files are read from the zip archive
+		(in YAML and JSON Lines, a key can also be written inline in `ssh_key`)
+		- `shared` defaults to true
+		- `assigned_to` assigns the VM to a user, only for admins and managers
+
+		YAML files can contain a list of VMs, a `vms` key with a list of VMs, or one VM for each document.
+	""")
+	st.download_button("Download an example CSV", data=EXAMPLE_CSV, file_name="vms.csv", icon=":material/download:")
+
+with st.form("vm_import_form"):
+	import_file = st.file_uploader("VMs file", type=["csv", "yaml", "yml", "jsonl", "ndjson"])
+	key_archive = st.file_uploader("SSH keys archive (optional)", type=["zip"])
+	probe = st.toggle("Test the connection to each VM before importing it", value=False)
+	submitted = st.form_submit_button("Import", type="primary", icon=":material/upload:")
+
+if submitted:
+	if import_file is None:
+		st.error("Please choose a file.")
+		st.stop()
+
+	progress_bar = st.progress(0.0, text="Starting...")
+
+	def on_progress(stage: str, done: int, total: int):
+		if total == 0:
+			progress_bar.progress(0.0, text=f"{STAGE_LABELS[stage]} ({done} rows)")
+		else:
+			progress_bar.progress(done / total, text=f"{STAGE_LABELS[stage]} ({done} / {total})")
+
+	try:
+		report = import_vms(
+			data=import_file,
+			file_name=import_file.name,
+			owner_username=current_username,
+			owner_role=current_role,
+			key_archive=key_archive,
+			probe=probe,
+			on_progress=on_progress,
+		)
+	except ValueError as e:
+		progress_bar.empty()
+		st.error(str(e))
+		st.stop()
+
+	progress_bar.empty()
+	st.cache_data.clear()  # Refresh my_vms table
+
+	if report.imported > 0:
+		st.success(f"Imported {report.imported} VMs.")
+
+	if report.errors:
+		st.warning(f"{len(report.errors)} VMs have not been imported.")
+		st.dataframe(
+			[
+				{"Row": error.row, "Name": error.name, "Error": error.message}
+				for error in sorted(report.errors, key=lambda e: e.row)
+			],
+			hide_index=True,
+			use_container_width=True,
+		)
+		st.download_button(
+			"Download the errors",
+			data=report.errors_csv(),
+			file_name="import_errors.csv",
+			icon=":material/download:",
+		)
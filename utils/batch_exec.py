@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Literal, TYPE_CHECKING
+
+import streamlit as st
+
+from utils.ssh_transport_pool import SSHTransportPool, get_ssh_transport_pool
+from utils.terminal_connection import get_ssh_timeouts
+
+if TYPE_CHECKING:
+	from backend.models import VirtualMachine
+
+
+class BatchTarget:
+	def __init__(self, vm_id: int, name: str, hostname: str, port: int, username: str,
+				 password: str = None, ssh_key: bytes = None):
+		"""
+		A VM on which a batch command is executed, with its credentials already decrypted.
+		Built in the script thread, so that the workers never touch the ORM objects.
+		"""
+		self.vm_id = vm_id
+		self.name = name
+		self.hostname = hostname
+		self.port = port
+		self.username = username
+		self.password = password
+		self.ssh_key = ssh_key
+
+	@staticmethod
+	def from_vm(vm: VirtualMachine) -> BatchTarget:
+		"""Builds a target from a VM, decrypting its stored credentials."""
+		return BatchTarget(
+			vm_id=vm.id,
+			name=vm.name,
+			hostname=vm.host,
+			port=vm.port,
+			username=vm.username,
+			password=vm.decrypt_password() if vm.password else None,
+			ssh_key=vm.decrypt_key() if vm.ssh_key else None,
+		)
+
+	def lease_transport(self, pool: SSHTransportPool, ssh_timeouts: dict, channels: int = 1, deadline: float = None):
+		"""Reserves channels on a pooled connection to this target, see `SSHTransportPool.lease`."""
+		return pool.lease(
+			self.hostname, self.port, self.username, self.password, self.ssh_key, ssh_timeouts, channels, deadline
+		)
+
+
+def build_batch_targets(vm_data: dict[int, dict], vm_ids: list[int]) -> tuple[list[BatchTarget], list[str]]:
+	"""
+	Builds the targets of the selected VMs.
+	:param vm_data: The VM dictionaries indexed by VM id (see `get_connectable_vm_data_from_db`)
+	:param vm_ids: The ids of the selected VMs
+	:return: The targets and the names of the VMs skipped because they have no stored credentials
+	"""
+	targets = []
+	skipped = []
+	for vm_id in vm_ids:
+		vm = vm_data[vm_id]["original_object"]
+		if vm.ssh_key or vm.password:
+			targets.append(BatchTarget.from_vm(vm))
+		else:
+			skipped.append(vm.name)
+
+	return targets, skipped
+
+
+class BatchEvent:
+	def __init__(self, target: BatchTarget,
+				 kind: Literal["started", "output", "finished", "error"],
+				 data: str = None, exit_status: int = None):
+		"""
+		Something that happened on a host while running a batch command.
+		- "started": the command has been sent
+		- "output": `data` contains a new chunk of output (stdout and stderr are merged)
+		- "finished": the command has exited with `exit_status`
+		- "error": the host failed, `data` contains the reason
+		"""
+		self.target = target
+		self.kind = kind
+		self.data = data
+		self.exit_status = exit_status
+		self.timestamp = time.monotonic()
+
+
+def run_on_target(target: BatchTarget, command: str, host_timeout: float,
+				  ssh_timeouts: dict, pool: SSHTransportPool, events: queue.Queue, chunk_size: int = 4096):
+	"""
+	Runs a command on a single target, putting its events on the queue as they happen.
+	The whole run, connection included, must finish within `host_timeout` seconds.
+	"""
+	deadline = time.monotonic() + host_timeout
+
+	try:
+		with target.lease_transport(pool, ssh_timeouts, deadline=deadline) as transport:
+			channel = transport.open_session(
+				timeout=max(min(ssh_timeouts.get("timeout", host_timeout), deadline - time.monotonic()), 0.001)
+			)
+			try:
+				channel.set_combine_stderr(True)
+				channel.settimeout(0.5)
+				channel.exec_command(command)
+				events.put(BatchEvent(target, "started"))
+
+				while True:
+					if time.monotonic() > deadline:
+						raise TimeoutError(f"The command did not finish within {host_timeout:g} seconds.")
+
+					try:
+						chunk = channel.recv(chunk_size)
+					except TimeoutError:
+						continue
+
+					if chunk:
+						events.put(BatchEvent(target, "output", data=chunk.decode("utf-8", errors="replace")))
+					elif channel.exit_status_ready() or channel.closed:
+						break
+					else:
+						# End of output, the exit status is on its way
+						time.sleep(0.05)
+
+				exit_status = channel.recv_exit_status()
+			finally:
+				channel.close()
+
+		events.put(BatchEvent(target, "finished", exit_status=exit_status))
+	except Exception as e:
+		events.put(BatchEvent(target, "error", data=str(e) or type(e).__name__))
+
+
+@st.cache_resource
+def get_batch_executor() -> ThreadPoolExecutor:
+	"""
+	Returns the process-wide pool of threads running the batch commands, shared by the runs of every user.
+	Not the probe executor: a command holds its thread for up to the host timeout, the probes would wait behind it.
+	"""
+	return ThreadPoolExecutor(
+		max_workers=int(st.secrets.get("batch_exec_max_connections", 200)), thread_name_prefix="batch-exec"
+	)
+
+
+def run_command_on_targets(targets: list[BatchTarget], command: str,
+						   host_timeout: float = None, max_workers: int = None,
+						   pool: SSHTransportPool = None) -> Iterator[BatchEvent]:
+	"""
+	Runs a command on many targets concurrently and yields their events as soon as they happen.
+	Every target ends with exactly one "finished" or "error" event.
+
+	:param targets: The targets to run the command on
+	:param command: The shell command
+	:param host_timeout: Seconds allowed for each host, connection included
+	:param max_workers: How many hosts of this run are processed at the same time, a new one starts when one ends
+	:param pool: The pool of SSH connections, the process-wide one if `None`
+	"""
+	if host_timeout is None:
+		host_timeout = float(st.secrets.get("batch_exec_host_timeout", 60))
+	if max_workers is None:
+		max_workers = int(st.secrets.get("batch_exec_max_workers", 50))
+
+	# Read in the script thread, the workers must not depend on the Streamlit context
+	ssh_timeouts = get_ssh_timeouts()
+	if pool is None:
+		pool = get_ssh_transport_pool()
+	executor = get_batch_executor()
+	events = queue.Queue()
+	remaining = len(targets)
+
+	# The hosts are submitted a few at a time, so that the runs of the other users share the threads with this one
+	# instead of waiting behind all its hosts
+	pending = iter(targets)
+	futures = []
+
+	def submit_next():
+		target = next(pending, None)
+		if target is not None:
+			futures.append(executor.submit(run_on_target, target, command, host_timeout, ssh_timeouts, pool, events))
+
+	try:
+		for _ in range(min(max_workers, remaining)):
+			submit_next()
+
+		while remaining > 0:
+			event = events.get()
+			if event.kind in ("finished", "error"):
+				remaining -= 1
+				submit_next()
+			yield event
+	finally:
+		# If the page is left midway, the hosts not started yet are skipped and the running ones end on their timeout
+		for future in futures:
+			future.cancel()
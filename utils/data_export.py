@@ -0,0 +1,223 @@
+import csv
+import io
+import json
+import zipfile
+from typing import IO, Iterator, Literal
+
+import streamlit as st
+from cryptography.fernet import Fernet
+from sqlalchemy import select, Integer, Boolean, String, LargeBinary
+
+from backend.database import get_db
+from backend.fernet_encryption import get_cipher
+from backend.models import User, VirtualMachine, Bookmark
+
+ExportFormat = Literal["jsonl", "csv", "parquet"]
+EXPORT_FORMATS: list[ExportFormat] = ["jsonl", "csv", "parquet"]
+
+EXPORT_TABLES = {
+	"users": User,
+	"virtual_machines": VirtualMachine,
+	"bookmarks": Bookmark,
+}
+
+# The columns holding credentials, exported only when asked to
+CREDENTIAL_COLUMNS = {
+	"users": ["password"],  # Already a bcrypt hash, exported as it is
+	"virtual_machines": ["password", "ssh_key"],  # Re-encrypted with the export key
+	"bookmarks": [],
+}
+
+
+class ChunkSink(io.RawIOBase):
+	"""A write-only file that keeps what has been written since the last `drain`, for encoders that need a file."""
+
+	def __init__(self):
+		super().__init__()
+		self._chunks: list[bytes] = []
+		self._position = 0
+
+	def writable(self) -> bool:
+		return True
+
+	def write(self, data) -> int:
+		data = bytes(data)
+		self._chunks.append(data)
+		self._position += len(data)
+		return len(data)
+
+	def tell(self) -> int:
+		return self._position
+
+	def drain(self) -> bytes:
+		data = b"".join(self._chunks)
+		self._chunks.clear()
+		return data
+
+
+################################
+#            ROWS              #
+################################
+
+def get_export_columns(table: str, include_credentials: bool) -> list[str]:
+	"""The names of the exported columns of a table, in the table order."""
+	excluded = [] if include_credentials else CREDENTIAL_COLUMNS[table]
+	return [column.name for column in EXPORT_TABLES[table].__table__.columns if column.name not in excluded]
+
+
+def reencrypt(value: str | bytes | None, export_cipher: Fernet) -> str | None:
+	"""Decrypts a credential with the application key and encrypts it again with the export key."""
+	if value is None:
+		return None
+	if isinstance(value, str):
+		value = value.encode("utf-8")
+	return export_cipher.encrypt(get_cipher().decrypt(value)).decode("utf-8")
+
+
+def iter_export_partitions(table: str, include_credentials: bool = False, export_key: bytes = None,
+						   chunk_size: int = None) -> Iterator[list[dict]]:
+	"""
+	Reads the rows of a table in partitions of `chunk_size`, through a server-side cursor,
+	so that the whole table is never in memory.
+
+	:param table: One of `EXPORT_TABLES`
+	:param include_credentials: Whether to export the credential columns (see `CREDENTIAL_COLUMNS`)
+	:param export_key: The Fernet key the VM credentials are encrypted with, required with `include_credentials`
+	:param chunk_size: Rows fetched at a time, read from the secrets if `None`
+	"""
+	if chunk_size is None:
+		chunk_size = int(st.secrets.get("data_export_chunk_size", 5000))
+
+	export_cipher = None
+	if include_credentials and table == "virtual_machines":
+		if export_key is None:
+			raise ValueError("An export key is required to export the VM credentials.")
+		export_cipher = Fernet(export_key)
+
+	model = EXPORT_TABLES[table]
+	column_names = get_export_columns(table, include_credentials)
+	# Plain columns instead of entities: no identity map and no joined relationships
+	statement = (select(*[model.__table__.c[name] for name in column_names])
+				 .order_by(model.__table__.c.id)
+				 .execution_options(yield_per=chunk_size))
+
+	with get_db() as db:
+		result = db.execute(statement)
+		for partition in result.partitions():
+			rows = [dict(zip(column_names, values)) for values in partition]
+			if export_cipher is not None:
+				for row in rows:
+					row["password"] = reencrypt(row["password"], export_cipher)
+					row["ssh_key"] = reencrypt(row["ssh_key"], export_cipher)
+			yield rows
+
+
+################################
+#           ENCODERS           #
+################################
+
+def encode_jsonl(partitions: Iterator[list[dict]], column_names: list[str], table: str) -> Iterator[bytes]:
+	for rows in partitions:
+		yield "".join(json.dumps(row, default=str) + "\n" for row in rows).encode("utf-8")
+
+
+def encode_csv(partitions: Iterator[list[dict]], column_names: list[str], table: str) -> Iterator[bytes]:
+	output = io.StringIO()
+	writer = csv.DictWriter(output, fieldnames=column_names)
+	writer.writeheader()
+
+	for rows in partitions:
+		writer.writerows(rows)
+		yield output.getvalue().encode("utf-8")
+		output.seek(0)
+		output.truncate(0)
+
+	if output.tell() > 0:  # Just the header, the table is empty
+		yield output.getvalue().encode("utf-8")
+
+
+def parquet_schema(table: str, column_names: list[str]):
+	"""The Parquet schema of the exported columns, from the column types (the re-encrypted credentials are text)."""
+	import pyarrow as pa
+
+	types = {Integer: pa.int64(), Boolean: pa.bool_(), String: pa.string(), LargeBinary: pa.binary()}
+	columns = EXPORT_TABLES[table].__table__.columns
+	return pa.schema([
+		(name, pa.string() if name in CREDENTIAL_COLUMNS[table] else types[type(columns[name].type)])
+		for name in column_names
+	])
+
+
+def encode_parquet(partitions: Iterator[list[dict]], column_names: list[str], table: str) -> Iterator[bytes]:
+	# pyarrow is installed with streamlit
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+
+	schema = parquet_schema(table, column_names)
+	sink = ChunkSink()
+	writer = pq.ParquetWriter(sink, schema)
+
+	# A row group for each partition
+	for rows in partitions:
+		writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+		yield sink.drain()
+
+	writer.close()
+	yield sink.drain()
+
+
+ENCODERS = {
+	"jsonl": encode_jsonl,
+	"csv": encode_csv,
+	"parquet": encode_parquet,
+}
+
+
+################################
+#            EXPORT            #
+################################
+
+def export_table(table: str, export_format: ExportFormat, include_credentials: bool = False,
+				 export_key: bytes = None, chunk_size: int = None) -> Iterator[bytes]:
+	"""
+	Exports a table as a stream of encoded chunks, ready to be written to a file.
+	Memory stays the same whatever the size of the table: one partition of rows at a time.
+
+	Example:
+	```
+	with open("vms.parquet", "wb") as file:
+		for chunk in export_table("virtual_machines", "parquet"):
+			file.write(chunk)
+	```
+
+	:param table: One of `EXPORT_TABLES`
+	:param export_format: One of `EXPORT_FORMATS`
+	:param include_credentials: Whether to export the credential columns (see `CREDENTIAL_COLUMNS`)
+	:param export_key: The Fernet key the VM credentials are encrypted with, required with `include_credentials`
+	:param chunk_size: Rows fetched and encoded at a time, read from the secrets if `None`
+	:raises ValueError: If the table or the format are unknown, or the export key is missing.
+	"""
+	if table not in EXPORT_TABLES:
+		raise ValueError(f"Unknown table `{table}`, use one of {', '.join(EXPORT_TABLES)}.")
+	if export_format not in ENCODERS:
+		raise ValueError(f"Unknown format `{export_format}`, use one of {', '.join(EXPORT_FORMATS)}.")
+
+	partitions = iter_export_partitions(table, include_credentials, export_key, chunk_size)
+	for chunk in ENCODERS[export_format](partitions, get_export_columns(table, include_credentials), table):
+		if chunk:
+			yield chunk
+
+
+def export_tables_to_zip(file: IO[bytes], tables: list[str], export_format: ExportFormat,
+						 include_credentials: bool = False, export_key: bytes = None, chunk_size: int = None):
+	"""Writes many tables in a zip archive, one file for each table, each streamed like `export_table`."""
+	with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+		for table in tables:
+			with archive.open(f"{table}.{export_format}", "w", force_zip64=True) as member:
+				for chunk in export_table(table, export_format, include_credentials, export_key, chunk_size):
+					member.write(chunk)
+
+
+def generate_export_key() -> bytes:
+	"""A new Fernet key for the credentials of an export."""
+	return Fernet.generate_key()
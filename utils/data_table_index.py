@@ -0,0 +1,324 @@
+import bisect
+import re
+import unicodedata
+from operator import itemgetter
+from typing import Sequence
+
+# Markdown that `st.write` renders, but is not part of the text of a cell
+MARKDOWN_ICON_PATTERN = re.compile(r":material/[a-z0-9_]+:|(?<!\S):[a-z][a-z0-9_+-]*:(?!\S)")
+MARKDOWN_COLOR_PATTERN = re.compile(r":(?:[a-z]+)\[([^\]]*)\]")
+
+MAX_CACHED_PERMUTATIONS = 8
+
+# Runs of digits, compared as numbers when sorting ("vm-9" before "vm-10")
+DIGITS_PATTERN = re.compile(r"(\d+)")
+
+# The parts of a word between punctuation, e.g. "10", "0" and "1" in "10.0.0.1"
+WORD_PART_PATTERN = re.compile(r"[^\W_]+")
+
+
+def strip_markdown(value) -> str:
+	"""The plain text of a cell value: the colors, icons and emoji shortcodes are removed."""
+	if value is None:
+		return ""
+
+	text = str(value)
+	if ":" in text:  # Most values have no markdown at all
+		text = MARKDOWN_COLOR_PATTERN.sub(lambda match: match.group(1), text)
+		text = MARKDOWN_ICON_PATTERN.sub("", text)
+	return text.replace("**", "").strip()
+
+
+def normalize_text(value) -> str:
+	"""The searchable form of a cell value: plain text, case-folded and with the Unicode compatibility forms merged."""
+	text = strip_markdown(value)
+	if text.isascii():
+		return text.lower()
+	return unicodedata.normalize("NFKC", text).casefold()
+
+
+def tokenize(text: str) -> set[str]:
+	"""
+	The tokens of a normalized text: each whitespace-separated word and each of its parts between punctuation,
+	so that "10.0.0.1" is found both by "10.0.0" and by "1".
+	"""
+	words = text.split()
+	tokens = set(words)
+	for word in words:
+		tokens.update(WORD_PART_PATTERN.findall(word))
+	return tokens
+
+
+def natural_sort_key(text: str) -> tuple:
+	"""Splits a text in its parts, with the digits as numbers: the strings and numbers always alternate."""
+	parts = DIGITS_PATTERN.split(text)
+	return tuple(int(part) if position % 2 else part for position, part in enumerate(parts))
+
+
+def get_row_key(data_row: dict, data_index: int) -> str:
+	"""
+	A key that identifies a row whatever its position, so that its widgets keep their state across pages and sorting.
+	It is the id of the `original_object` of the row, or its position if there is none.
+	"""
+	original_object = data_row.get("original_object", None)
+	row_id = getattr(original_object, "id", None)
+	return f"id{row_id}" if row_id is not None else f"index{data_index}"
+
+
+class DataTableIndex:
+	def __init__(self, data_names: list[str]):
+		"""
+		A search index of the rows of a table, built once and then updated only where the rows change.
+
+		- For each row, the normalized text of each column, for the searches in a single column.
+		- An inverted index from each token to the rows containing it, for the searches in all the columns:
+		every term of the query must be the prefix of a token of the row.
+
+		The rows are identified by `get_row_key`, so that the index survives reordering and new rows.
+
+		:param data_names: The `data_name` of the searchable columns
+		"""
+		self.data_names = list(data_names)
+		self.version = 0
+
+		self._data: list[dict] | None = None
+		self._row_keys: list[str] = []  # By position in the data
+		self._positions: dict[str, int] = {}
+		self._values: dict[str, tuple] = {}  # The raw values, to notice the changed rows
+		self._normalized: dict[str, tuple[str, ...]] = {}
+		self._row_tokens: dict[str, set[str]] = {}
+		self._postings: dict[str, set[str]] = {}
+		self._sorted_tokens: list[str] | None = None
+		self._prefix_cache: dict[str, set[str]] = {}
+
+		# Computed on the first sort of each version of the data
+		self._ranks: dict[str, list[int]] = {}
+		self._permutations: dict[tuple, tuple[list[int], list[int]]] = {}
+
+	################################
+	#           UPDATES            #
+	################################
+
+	def update(self, data: list[dict]) -> bool:
+		"""
+		Brings the index up to date with the rows, re-tokenizing only the new and the changed ones.
+		:return: Whether something has changed
+		"""
+		# The same list again, e.g. in the reruns of a fragment (the rows are never changed in place)
+		if data is self._data:
+			return False
+		self._data = data
+
+		row_keys = []
+		seen = set()
+		changed = False
+		get_values = itemgetter(*self.data_names)
+		single_column = len(self.data_names) == 1
+		analyzed_values = {}
+
+		for data_index, data_row in enumerate(data):
+			row_key = get_row_key(data_row, data_index)
+			if row_key in seen:  # The same object twice, index it by position
+				row_key = f"{row_key}@{data_index}"
+			seen.add(row_key)
+			row_keys.append(row_key)
+
+			values = get_values(data_row)
+			if single_column:
+				values = (values,)
+			if self._values.get(row_key, None) != values:
+				self._remove_row(row_key)
+				self._add_row(row_key, values, analyzed_values)
+				changed = True
+
+		for row_key in [row_key for row_key in self._values if row_key not in seen]:
+			self._remove_row(row_key)
+			changed = True
+
+		if changed or row_keys != self._row_keys:
+			self._row_keys = row_keys
+			self._positions = {row_key: position for position, row_key in enumerate(row_keys)}
+			self._ranks.clear()
+			self._permutations.clear()
+			self.version += 1
+			return True
+
+		return False
+
+	def _add_row(self, row_key: str, values: tuple, analyzed_values: dict):
+		"""
+		Indexes a row.
+		:param analyzed_values: The normalized text and the tokens of the values seen in this update,
+		since many rows share the same owner, username, and so on
+		"""
+		normalized = []
+		tokens = set()
+		for value in values:
+			try:
+				text, value_tokens = analyzed_values[value]
+			except KeyError:
+				text = normalize_text(value)
+				value_tokens = tokenize(text)
+				analyzed_values[value] = text, value_tokens
+			except TypeError:  # Not hashable
+				text = normalize_text(value)
+				value_tokens = tokenize(text)
+			normalized.append(text)
+			tokens.update(value_tokens)
+		normalized = tuple(normalized)
+
+		self._values[row_key] = values
+		self._normalized[row_key] = normalized
+		self._row_tokens[row_key] = tokens
+		for token in tokens:
+			postings = self._postings.get(token, None)
+			if postings is None:
+				self._postings[token] = {row_key}
+				self._sorted_tokens = None
+			else:
+				postings.add(row_key)
+		self._prefix_cache.clear()
+
+	def _remove_row(self, row_key: str):
+		if row_key not in self._values:
+			return
+
+		for token in self._row_tokens.pop(row_key):
+			postings = self._postings[token]
+			postings.discard(row_key)
+			if not postings:
+				del self._postings[token]
+				self._sorted_tokens = None
+
+		del self._values[row_key]
+		del self._normalized[row_key]
+		self._prefix_cache.clear()
+
+	################################
+	#           SEARCHES           #
+	################################
+
+	def _rows_with_prefix(self, prefix: str) -> set[str]:
+		"""The rows with a token starting with `prefix`."""
+		rows = self._prefix_cache.get(prefix, None)
+		if rows is not None:
+			return rows
+
+		if self._sorted_tokens is None:
+			self._sorted_tokens = sorted(self._postings)
+
+		rows = set()
+		start = bisect.bisect_left(self._sorted_tokens, prefix)
+		for token in self._sorted_tokens[start:]:
+			if not token.startswith(prefix):
+				break
+			rows.update(self._postings[token])
+
+		self._prefix_cache[prefix] = rows
+		return rows
+
+	def search(self, query: str, data_name: str = None) -> list[int]:
+		"""
+		Finds the rows matching a query, in their order in the data.
+		:param query: In all the columns, whitespace-separated terms that must all be the prefix of a token of the row.
+		In a single column, a text contained in the value.
+		:param data_name: The column to search in, all of them if `None`
+		:return: The positions of the matching rows in the data of the last `update`
+		"""
+		normalized_query = normalize_text(query)
+
+		if data_name is not None:
+			column = self.data_names.index(data_name)
+			return [
+				position for position, row_key in enumerate(self._row_keys)
+				if normalized_query in self._normalized[row_key][column]
+			]
+
+		terms = normalized_query.split()
+		if not terms:
+			return list(range(len(self._row_keys)))
+
+		# Intersect starting from the rarest term
+		matches = sorted((self._rows_with_prefix(term) for term in set(terms)), key=len)
+		rows = set(matches[0])
+		for other in matches[1:]:
+			rows.intersection_update(other)
+			if not rows:
+				break
+
+		return sorted(self._positions[row_key] for row_key in rows)
+
+	################################
+	#           SORTING            #
+	################################
+
+	def _column_ranks(self, data_name: str) -> list[int]:
+		"""
+		The rank of the value of each row in a column, by position: equal values have the same rank.
+		Sorting by the ranks is like sorting by the values, but much cheaper and reusable with other columns.
+		"""
+		ranks = self._ranks.get(data_name, None)
+		if ranks is not None:
+			return ranks
+
+		column = self.data_names.index(data_name)
+		sort_keys = [natural_sort_key(self._normalized[row_key][column]) for row_key in self._row_keys]
+		order = sorted(range(len(sort_keys)), key=sort_keys.__getitem__)
+
+		ranks = [0] * len(sort_keys)
+		rank = 0
+		for index, position in enumerate(order):
+			if index > 0 and sort_keys[position] != sort_keys[order[index - 1]]:
+				rank = index
+			ranks[position] = rank
+
+		self._ranks[data_name] = ranks
+		return ranks
+
+	def _permutation(self, sort_keys: tuple[tuple[str, bool], ...]) -> tuple[list[int], list[int]]:
+		"""
+		The positions of all the rows sorted by some columns, and the inverse: the place of each position in the sort.
+		Both are computed once for each version of the data.
+		"""
+		cached = self._permutations.get(sort_keys, None)
+		if cached is not None:
+			return cached
+
+		columns = [
+			(self._column_ranks(data_name), -1 if descending else 1)
+			for data_name, descending in sort_keys
+		]
+		if len(columns) == 1:
+			ranks, direction = columns[0]
+			permutation = sorted(range(len(ranks)), key=lambda position: direction * ranks[position])
+		else:
+			permutation = sorted(
+				range(len(self._row_keys)),
+				key=lambda position: tuple(direction * ranks[position] for ranks, direction in columns)
+			)
+
+		places = [0] * len(permutation)
+		for place, position in enumerate(permutation):
+			places[position] = place
+
+		# Users try a few sorts at a time, do not keep all of them
+		if len(self._permutations) >= MAX_CACHED_PERMUTATIONS:
+			self._permutations.clear()
+		self._permutations[sort_keys] = permutation, places
+		return permutation, places
+
+	def sort(self, positions: Sequence[int], sort_keys: list[tuple[str, bool]]) -> list[int]:
+		"""
+		Sorts rows by many columns, reusing the sort of the whole data by the same columns. The sort is stable.
+		:param positions: The positions of the rows to sort (e.g. the result of `search`)
+		:param sort_keys: The `data_name` of each column and whether it is descending, the first one has priority
+		:return: The sorted positions
+		"""
+		if not sort_keys:
+			return list(positions)
+
+		permutation, places = self._permutation(tuple((data_name, descending) for data_name, descending in sort_keys))
+		if len(positions) == len(permutation):
+			return permutation
+
+		return sorted(positions, key=places.__getitem__)
@@ -0,0 +1,481 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+import streamlit as st
+
+EXPOSITION_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds (in seconds) of the histogram buckets
+PAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+CONNECT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BCRYPT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2)
+
+
+class ThreadShards:
+	def __init__(self, size: int):
+		"""
+		Numbers written without locks: each thread adds to its own list, the lists are summed when read.
+		The lists of the finished threads (e.g. of the past script runs) are merged when a new thread arrives,
+		so that there are never more lists than live threads.
+		:param size: The numbers in each list
+		"""
+		self.size = size
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._shards: list[tuple[threading.Thread, list]] = []
+		self._finished = [0] * size
+
+	def local(self) -> list:
+		"""The list of the current thread, only this thread writes to it."""
+		try:
+			return self._local.values
+		except AttributeError:
+			return self._add_shard()
+
+	def _add_shard(self) -> list:
+		values = [0] * self.size
+		with self._lock:
+			live = []
+			for thread, shard in self._shards:
+				if thread.is_alive():
+					live.append((thread, shard))
+				else:  # Nothing can write to it anymore
+					for index, value in enumerate(shard):
+						self._finished[index] += value
+			live.append((threading.current_thread(), values))
+			self._shards = live
+		self._local.values = values
+		return values
+
+	def sum(self) -> list:
+		with self._lock:
+			total = list(self._finished)
+			for _, shard in self._shards:
+				for index, value in enumerate(shard):
+					total[index] += value
+		return total
+
+
+class Metric:
+	type_name = ""
+
+	def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+		"""
+		A metric with a child for each combination of label values, created on its first use.
+		The children of fixed labels should be kept by the callers, to skip the lookup in the hot paths.
+		"""
+		self.name = name
+		self.documentation = documentation
+		self.label_names = tuple(label_names)
+		self._children = {}
+		self._children_lock = threading.Lock()
+
+	def labels(self, *values: str):
+		"""The child of some label values, in the order of `label_names`."""
+		child = self._children.get(values, None)
+		if child is not None:
+			return child
+
+		if len(values) != len(self.label_names):
+			raise ValueError(f"{self.name} has the labels {self.label_names}, got {values}")
+		with self._children_lock:
+			child = self._children.get(values, None)
+			if child is None:
+				child = self._children[values] = self._new_child()
+		return child
+
+	def _new_child(self):
+		raise NotImplementedError
+
+	def _label_text(self, values: tuple, extra: str = "") -> str:
+		pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(self.label_names, values)]
+		if extra:
+			pairs.append(extra)
+		return "{" + ",".join(pairs) + "}" if pairs else ""
+
+	def _sample_lines(self) -> list[str]:
+		raise NotImplementedError
+
+	def exposition(self) -> str:
+		"""The metric in the Prometheus text format."""
+		lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+		lines.extend(self._sample_lines())
+		return "\n".join(lines)
+
+
+class CounterChild:
+	__slots__ = ("_shards",)
+
+	def __init__(self):
+		self._shards = ThreadShards(1)
+
+	def inc(self, amount: float = 1):
+		self._shards.local()[0] += amount
+
+	def value(self) -> float:
+		return self._shards.sum()[0]
+
+
+class Counter(Metric):
+	"""A number that only goes up, e.g. the queries sent. Without labels, `inc` can be called on the metric itself."""
+	type_name = "counter"
+
+	def _new_child(self):
+		return CounterChild()
+
+	def inc(self, amount: float = 1):
+		self.labels().inc(amount)
+
+	def _sample_lines(self) -> list[str]:
+		return [
+			f"{self.name}{self._label_text(values)} {format_value(child.value())}"
+			for values, child in list(self._children.items())
+		]
+
+
+class GaugeChild:
+	__slots__ = ("_shards", "_function")
+
+	def __init__(self):
+		self._shards = ThreadShards(1)
+		self._function: Callable[[], float] | None = None
+
+	def inc(self, amount: float = 1):
+		self._shards.local()[0] += amount
+
+	def dec(self, amount: float = 1):
+		self._shards.local()[0] -= amount
+
+	def set_function(self, function: Callable[[], float]):
+		"""Reads the value from `function` when the metrics are collected, instead of counting it."""
+		self._function = function
+
+	@contextmanager
+	def track_in_progress(self) -> Iterator[None]:
+		"""Counts the blocks running at the same time."""
+		values = self._shards.local()
+		values[0] += 1
+		try:
+			yield
+		finally:
+			values[0] -= 1
+
+	def value(self) -> float:
+		if self._function is not None:
+			return self._function()
+		return self._shards.sum()[0]
+
+
+class Gauge(Metric):
+	"""A number that goes up and down, e.g. the sessions connected. Without labels, its methods work on the metric itself."""
+	type_name = "gauge"
+
+	def _new_child(self):
+		return GaugeChild()
+
+	def inc(self, amount: float = 1):
+		self.labels().inc(amount)
+
+	def dec(self, amount: float = 1):
+		self.labels().dec(amount)
+
+	def set_function(self, function: Callable[[], float]):
+		self.labels().set_function(function)
+
+	def track_in_progress(self):
+		return self.labels().track_in_progress()
+
+	def _sample_lines(self) -> list[str]:
+		lines = []
+		for values, child in list(self._children.items()):
+			try:
+				value = child.value()
+			except Exception:  # A broken function must not break the other metrics
+				continue
+			lines.append(f"{self.name}{self._label_text(values)} {format_value(value)}")
+		return lines
+
+
+class HistogramChild:
+	__slots__ = ("buckets", "_shards")
+
+	def __init__(self, buckets: tuple[float, ...]):
+		self.buckets = buckets
+		# A count for each bucket, one for +Inf, then the sum of the values
+		self._shards = ThreadShards(len(buckets) + 2)
+
+	def observe(self, value: float):
+		values = self._shards.local()
+		values[bisect.bisect_left(self.buckets, value)] += 1
+		values[-1] += value
+
+	@contextmanager
+	def time(self) -> Iterator[None]:
+		"""Observes the duration of a block, in seconds, even when it raises."""
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(time.perf_counter() - start)
+
+	def counts(self) -> tuple[list[int], float]:
+		"""The count of each bucket (not cumulative, +Inf last) and the sum of the values."""
+		values = self._shards.sum()
+		return values[:-1], values[-1]
+
+
+class Histogram(Metric):
+	"""Durations counted in fixed buckets, e.g. of the page reruns."""
+	type_name = "histogram"
+
+	def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = (),
+				 buckets: tuple[float, ...] = PAGE_BUCKETS):
+		super().__init__(name, documentation, label_names)
+		self.buckets = tuple(sorted(buckets))
+
+	def _new_child(self):
+		return HistogramChild(self.buckets)
+
+	def observe(self, value: float):
+		self.labels().observe(value)
+
+	def time(self):
+		return self.labels().time()
+
+	def _sample_lines(self) -> list[str]:
+		lines = []
+		for values, child in list(self._children.items()):
+			counts, total = child.counts()
+			cumulative = 0
+			for bound, count in zip(self.buckets + (float("inf"),), counts):
+				cumulative += count
+				le = "+Inf" if bound == float("inf") else format_value(bound)
+				bucket_labels = self._label_text(values, f'le="{le}"')
+				lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+			lines.append(f"{self.name}_sum{self._label_text(values)} {format_value(total)}")
+			lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+		return lines
+
+
+class MetricsRegistry:
+	def __init__(self):
+		"""The metrics of the process, in the order they are registered."""
+		self._metrics: dict[str, Metric] = {}
+		self._lock = threading.Lock()
+
+	def register(self, metric: Metric) -> Metric:
+		"""
+		:raises ValueError: If a metric with the same name already exists.
+		"""
+		with self._lock:
+			if metric.name in self._metrics:
+				raise ValueError(f"The metric {metric.name} already exists.")
+			self._metrics[metric.name] = metric
+		return metric
+
+	def counter(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> Counter:
+		return self.register(Counter(name, documentation, label_names))
+
+	def gauge(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> Gauge:
+		return self.register(Gauge(name, documentation, label_names))
+
+	def histogram(self, name: str, documentation: str, label_names: tuple[str, ...] = (),
+				  buckets: tuple[float, ...] = PAGE_BUCKETS) -> Histogram:
+		return self.register(Histogram(name, documentation, label_names, buckets))
+
+	def exposition(self) -> str:
+		"""All the metrics in the Prometheus text format."""
+		with self._lock:
+			metrics = list(self._metrics.values())
+		return "\n".join(metric.exposition() for metric in metrics) + "\n"
+
+
+def escape_label_value(value) -> str:
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+	if isinstance(value, float):
+		return str(int(value)) if value.is_integer() else repr(value)
+	return str(value)
+
+
+################################
+#     METRICS OF THE APP       #
+################################
+
+# Module-level like the engine of the database, since the worker threads and the CLI record metrics too
+REGISTRY = MetricsRegistry()
+
+PAGE_RERUN_SECONDS = REGISTRY.histogram(
+	"vmlab_page_rerun_seconds", "Duration of the page reruns, full or of a fragment only.",
+	("page", "kind"), PAGE_BUCKETS,
+)
+DB_QUERIES = REGISTRY.counter(
+	"vmlab_db_queries_total", "SQL statements sent to the database, by the finder method that sent them.",
+	("finder",),
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+	"vmlab_db_query_seconds", "Duration of the SQL statements, by the finder method that sent them.",
+	("finder",), DB_BUCKETS,
+)
+FINDER_SECONDS = REGISTRY.histogram(
+	"vmlab_finder_seconds", "Duration of the finder methods of the models, with the loading of the objects.",
+	("finder",), DB_BUCKETS,
+)
+CACHE_REQUESTS = REGISTRY.counter(
+	"vmlab_cache_requests_total", "Calls of the cached functions.",
+	("function",),
+)
+CACHE_MISSES = REGISTRY.counter(
+	"vmlab_cache_misses_total", "Calls of the cached functions that were not found in the cache.",
+	("function",),
+)
+BCRYPT_IN_PROGRESS = REGISTRY.gauge(
+	"vmlab_bcrypt_in_progress", "Password hashes and checks running or waiting for a CPU.",
+)
+BCRYPT_SECONDS = REGISTRY.histogram(
+	"vmlab_bcrypt_seconds", "Duration of the password hashes and checks.",
+	("operation",), BCRYPT_BUCKETS,
+)
+CONNECT_STAGE_SECONDS = REGISTRY.histogram(
+	"vmlab_connect_stage_seconds", "Duration of each stage of the connection to a VM.",
+	("stage",), CONNECT_BUCKETS,
+)
+MODULE_HTTP_ERRORS = REGISTRY.counter(
+	"vmlab_module_http_errors_total", "Failed requests to the SSH and SFTP modules.",
+	("module", "reason"),
+)
+ACTIVE_SESSIONS = REGISTRY.gauge(
+	"vmlab_active_sessions", "Browser sessions open on this server.",
+)
+
+# The metrics of the finder running in the current context, for the queries it sends
+_current_finder: ContextVar["FinderMetrics | None"] = ContextVar("current_finder", default=None)
+
+
+class FinderMetrics:
+	__slots__ = ("queries", "query_seconds", "seconds")
+
+	def __init__(self, finder: str):
+		self.queries = DB_QUERIES.labels(finder)
+		self.query_seconds = DB_QUERY_SECONDS.labels(finder)
+		self.seconds = FINDER_SECONDS.labels(finder)
+
+
+# The queries sent outside the finder methods (e.g. inserts, updates and exports)
+OTHER_QUERIES = FinderMetrics("other")
+
+
+def observe_finder(method: Callable) -> Callable:
+	"""
+	Decorator of the finder methods of the models: times them and counts the queries they send,
+	labelled with `<Model>.<method>`. Put it under `@staticmethod`.
+	"""
+	finder_metrics = FinderMetrics(method.__qualname__)
+
+	@functools.wraps(method)
+	def wrapper(*args, **kwargs):
+		token = _current_finder.set(finder_metrics)
+		start = time.perf_counter()
+		try:
+			return method(*args, **kwargs)
+		finally:
+			finder_metrics.seconds.observe(time.perf_counter() - start)
+			_current_finder.reset(token)
+
+	return wrapper
+
+
+def current_finder_metrics() -> FinderMetrics:
+	"""The metrics of the finder running in the current context, or of the queries outside the finders."""
+	return _current_finder.get() or OTHER_QUERIES
+
+
+def observe_cache(cache_decorator: Callable) -> Callable:
+	"""
+	Counts the calls and the misses of a cached function, to know its hit ratio.
+	Use it in place of the cache decorator, e.g. `@observe_cache(st.cache_data)` or `@observe_cache(st.cache_data(ttl=60))`.
+	"""
+	def decorator(function: Callable) -> Callable:
+		requests = CACHE_REQUESTS.labels(function.__name__)
+		misses = CACHE_MISSES.labels(function.__name__)
+
+		# Run by the cache only when the value is not found
+		@functools.wraps(function)
+		def compute(*args, **kwargs):
+			misses.inc()
+			return function(*args, **kwargs)
+
+		cached_function = cache_decorator(compute)
+
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			requests.inc()
+			return cached_function(*args, **kwargs)
+
+		wrapper.clear = cached_function.clear
+		return wrapper
+
+	return decorator
+
+
+def cache_hit_ratios() -> list[dict]:
+	"""A row for each function wrapped by `observe_cache`, with its calls and the fraction served by the cache."""
+	rows = []
+	for (function,), requests in list(CACHE_REQUESTS._children.items()):
+		calls = requests.value()
+		misses = CACHE_MISSES.labels(function).value()
+		rows.append({
+			"function": function,
+			"calls": calls,
+			"misses": misses,
+			"hit_ratio": round(1 - misses / calls, 3) if calls else None,
+		})
+	return sorted(rows, key=lambda row: row["calls"], reverse=True)
+
+
+################################
+#        METRICS SERVER        #
+################################
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path.split("?")[0] != "/metrics":
+			self.send_error(404)
+			return
+
+		body = REGISTRY.exposition().encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", EXPOSITION_CONTENT_TYPE)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass  # Prometheus scrapes it every few seconds
+
+
+def is_metrics_server_enabled() -> bool:
+	"""Checks whether the metrics are served on their own port, set by `metrics_port` in the secrets."""
+	return int(st.secrets.get("metrics_port", 0)) > 0
+
+
+# No spinner: it is called by `app.py` before the pages, which must start with `st.set_page_config`
+@st.cache_resource(show_spinner=False)
+def get_metrics_server() -> ThreadingHTTPServer:
+	"""Returns the process-wide server of `/metrics`, starting it the first time."""
+	server = ThreadingHTTPServer(
+		(st.secrets.get("metrics_host", "0.0.0.0"), int(st.secrets.get("metrics_port", 0))),
+		MetricsRequestHandler,
+	)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+	return server
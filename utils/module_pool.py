@@ -0,0 +1,224 @@
+import bisect
+import hashlib
+import logging
+import threading
+import time
+from typing import Literal
+
+import requests
+import streamlit as st
+
+from utils.metrics import MODULE_HTTP_ERRORS
+
+logger = logging.getLogger("vm_lab.module_pool")
+
+
+class ModuleEndpoint:
+	def __init__(self, module_type: Literal["ssh", "sftp"], url: str, port: str):
+		"""
+		A single instance of an external module.
+		:param module_type: The type of the module ("ssh" or "sftp")
+		:param url: The URL of the instance, without the port
+		:param port: The port of the instance
+		"""
+		self.module_type = module_type
+		self.url = url
+		self.port = str(port)
+		self.healthy = True
+		self.last_checked_at = None
+
+	@property
+	def key(self) -> str:
+		"""A stable identifier of the instance, stored alongside the connections opened on it."""
+		return f"{self.url}:{self.port}"
+
+	def format_url(self, url_format: str) -> str:
+		"""Replaces the URL and port variables of a request format with the ones of this instance."""
+		if self.module_type == "ssh":
+			return (url_format
+					.replace("$SSH_URL", self.url)
+					.replace("$SSH_PORT", self.port))
+		else:
+			return (url_format
+					.replace("$SFTP_URL", self.url)
+					.replace("$SFTP_PORT", self.port))
+
+	def __str__(self):
+		return (f"ModuleEndpoint("
+				f"module_type={self.module_type}, "
+				f"key={self.key}, "
+				f"healthy={self.healthy}"
+				f")")
+
+
+class ModulePool:
+	def __init__(self, module_type: Literal["ssh", "sftp"], endpoints: list[ModuleEndpoint],
+				 routing: Literal["consistent_hash", "least_connections"] = "consistent_hash",
+				 health_check_interval: float = 15, health_check_timeout: float = 2,
+				 virtual_nodes: int = 64):
+		"""
+		A pool of instances of the same external module.
+		Connections are routed with consistent hashing on the VM id (so a VM keeps landing on the same instance)
+		or to the instance with the fewest open connections. Unhealthy instances are skipped until they recover.
+
+		:param module_type: The type of the module ("ssh" or "sftp")
+		:param endpoints: The instances of the module
+		:param routing: The routing strategy
+		:param health_check_interval: Seconds between two health checks of every instance, 0 disables them
+		:param health_check_timeout: Timeout in seconds of a single health check
+		:param virtual_nodes: Points on the hash ring for each instance, more points spread the VMs more evenly
+		"""
+		if len(endpoints) == 0:
+			raise ValueError(f"At least one {module_type} module endpoint must be configured.")
+
+		self.module_type = module_type
+		self.endpoints = endpoints
+		self.routing = routing
+		self.health_check_interval = health_check_interval
+		self.health_check_timeout = health_check_timeout
+
+		self._lock = threading.Lock()
+		self._endpoints_by_key = {endpoint.key: endpoint for endpoint in endpoints}
+
+		# The hash ring is built once, unhealthy instances are skipped while walking it
+		ring = []
+		for endpoint in endpoints:
+			for node in range(virtual_nodes):
+				ring.append((hash_to_int(f"{endpoint.key}#{node}"), endpoint))
+		ring.sort(key=lambda point: point[0])
+		self._ring_hashes = [point[0] for point in ring]
+		self._ring_endpoints = [point[1] for point in ring]
+
+		self._health_thread = None
+		if health_check_interval > 0 and len(endpoints) > 1:
+			self._health_thread = threading.Thread(
+				target=self._health_check_loop,
+				name=f"{module_type}-module-health",
+				daemon=True
+			)
+			self._health_thread.start()
+
+	def get(self, endpoint_key: str) -> ModuleEndpoint | None:
+		"""Returns the instance with the given key, or `None` if it is not part of the pool anymore."""
+		return self._endpoints_by_key.get(endpoint_key, None)
+
+	def healthy_endpoints(self) -> list[ModuleEndpoint]:
+		"""Returns the instances that passed the last health check."""
+		with self._lock:
+			return [endpoint for endpoint in self.endpoints if endpoint.healthy]
+
+	def choose(self, vm_id: int, active_connections: dict[str, int] = None,
+			   exclude_keys: set[str] = None) -> ModuleEndpoint:
+		"""
+		Chooses the instance that should serve a new connection for a VM.
+		If every instance is unhealthy, they are all considered, since a failed check may be a false negative.
+
+		:param vm_id: The id of the VM, used by the consistent hashing
+		:param active_connections: The number of open connections for each instance key, used by least connections
+		:param exclude_keys: Keys of instances that must not be chosen (e.g. they have just failed)
+		:return: The chosen instance
+		"""
+		if exclude_keys is None:
+			exclude_keys = set()
+
+		with self._lock:
+			candidates = [endpoint for endpoint in self.endpoints
+						  if endpoint.healthy and endpoint.key not in exclude_keys]
+			if len(candidates) == 0:
+				candidates = [endpoint for endpoint in self.endpoints if endpoint.key not in exclude_keys]
+			if len(candidates) == 0:
+				candidates = list(self.endpoints)
+
+		if len(candidates) == 1:
+			return candidates[0]
+
+		if self.routing == "least_connections":
+			if active_connections is None:
+				active_connections = {}
+			return min(candidates, key=lambda endpoint: active_connections.get(endpoint.key, 0))
+
+		# Walk the ring clockwise from the VM hash until a candidate is found
+		candidate_keys = {endpoint.key for endpoint in candidates}
+		start = bisect.bisect(self._ring_hashes, hash_to_int(str(vm_id)))
+		for offset in range(len(self._ring_endpoints)):
+			endpoint = self._ring_endpoints[(start + offset) % len(self._ring_endpoints)]
+			if endpoint.key in candidate_keys:
+				return endpoint
+
+		return candidates[0]
+
+	def mark_unhealthy(self, endpoint: ModuleEndpoint):
+		"""Drains an instance until the next successful health check."""
+		with self._lock:
+			endpoint.healthy = False
+
+	def check_health(self):
+		"""Checks every instance of the pool and updates its health."""
+		health_format = st.secrets.get(f"{self.module_type}_health_request_format", None)
+		if health_format is None:
+			health_format = "$SSH_URL:$SSH_PORT/" if self.module_type == "ssh" else "$SFTP_URL:$SFTP_PORT/"
+
+		for endpoint in self.endpoints:
+			try:
+				response = requests.get(
+					url=endpoint.format_url(health_format),
+					timeout=self.health_check_timeout,
+					allow_redirects=False
+				)
+				healthy = response.status_code < 500
+			except requests.exceptions.RequestException:
+				healthy = False
+
+			if not healthy:
+				MODULE_HTTP_ERRORS.labels(self.module_type, "health_check").inc()
+
+			with self._lock:
+				endpoint.healthy = healthy
+				endpoint.last_checked_at = time.time()
+
+	def _health_check_loop(self):
+		while True:
+			try:
+				self.check_health()
+			except Exception:
+				logger.exception("Health check of the %s module pool failed", self.module_type)
+			time.sleep(self.health_check_interval)
+
+
+def hash_to_int(value: str) -> int:
+	"""Hashes a string to an integer that is stable across processes (unlike `hash`)."""
+	return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+def read_module_endpoints(module_type: Literal["ssh", "sftp"]) -> list[ModuleEndpoint]:
+	"""
+	Reads the instances of a module from the secrets.
+	Uses the `<type>_module_endpoints` list if defined, otherwise the single `<type>_module_url` and `<type>_module_port`.
+	"""
+	endpoints_secret = st.secrets.get(f"{module_type}_module_endpoints", None)
+
+	if endpoints_secret:
+		return [
+			ModuleEndpoint(module_type, entry["url"], entry["port"])
+			for entry in endpoints_secret
+		]
+
+	return [
+		ModuleEndpoint(
+			module_type,
+			st.secrets[f"{module_type}_module_url"],
+			st.secrets[f"{module_type}_module_port"]
+		)
+	]
+
+
+@st.cache_resource
+def get_module_pool(module_type: Literal["ssh", "sftp"]) -> ModulePool:
+	"""Returns the process-wide pool of instances of a module."""
+	return ModulePool(
+		module_type=module_type,
+		endpoints=read_module_endpoints(module_type),
+		routing=st.secrets.get("module_routing", "consistent_hash"),
+		health_check_interval=float(st.secrets.get("module_health_check_interval", 15)),
+		health_check_timeout=float(st.secrets.get("module_health_check_timeout", 2)),
+	)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import streamlit as st
+
+if TYPE_CHECKING:
+	from backend.models import VirtualMachine
+
+
+class ModuleConnection:
+	def __init__(self, module_type: str, connection_id: str, lifetime: float, endpoint_key: str = None):
+		"""
+		A connection opened on an external module (a browser terminal or file explorer).
+		:param module_type: The type of the module ("ssh" or "sftp")
+		:param connection_id: The `connection_uuid` returned by the module
+		:param lifetime: How many seconds the connection can stay unused before it is considered stale
+		:param endpoint_key: The key of the module instance that has opened the connection
+		"""
+		self.module_type = module_type
+		self.connection_id = connection_id
+		self.endpoint_key = endpoint_key
+		self.lifetime = lifetime
+		self.created_at = time.monotonic()
+		self.last_used_at = self.created_at
+
+	def touch(self):
+		"""Marks the connection as used now."""
+		self.last_used_at = time.monotonic()
+
+	def is_stale(self, now: float = None) -> bool:
+		"""Checks whether the connection has not been used for longer than its lifetime."""
+		if now is None:
+			now = time.monotonic()
+		return now - self.last_used_at > self.lifetime
+
+
+class ModuleSession:
+	def __init__(self, user_name: str, vm_id: int, vm_fingerprint: str):
+		"""
+		The module connections opened by a user for a specific VM.
+		:param user_name: The username of the user that opened the connections
+		:param vm_id: The id of the VM
+		:param vm_fingerprint: The fingerprint of the VM address and credentials used to open the connections
+		"""
+		self.user_name = user_name
+		self.vm_id = vm_id
+		self.vm_fingerprint = vm_fingerprint
+		self.connections: dict[str, ModuleConnection] = {}
+
+	def is_stale(self, now: float = None) -> bool:
+		"""A session is stale when it has no connections or one of them is stale."""
+		if not self.connections:
+			return True
+		return any(connection.is_stale(now) for connection in self.connections.values())
+
+
+class ModuleSessionRegistry:
+	def __init__(self, lifetime: float):
+		"""
+		A process-wide registry of the module connections, keyed by (username, VM id).
+		Used to send the user back to a terminal that is still alive instead of creating a new one.
+		:param lifetime: How many seconds a connection can stay unused before it is evicted
+		"""
+		self.lifetime = lifetime
+		self._lock = threading.Lock()
+		self._sessions: dict[tuple[str, int], ModuleSession] = {}
+
+	def get(self, user_name: str, vm_id: int, vm_fingerprint: str) -> ModuleSession | None:
+		"""
+		Returns the session of a user for a VM, evicting it if it is stale or the VM has changed since.
+		:return: The session if it has been found, otherwise `None`
+		"""
+		self.evict_stale()
+
+		with self._lock:
+			session = self._sessions.get((user_name, vm_id))
+			if session is None:
+				return None
+
+			if session.vm_fingerprint != vm_fingerprint:
+				self._sessions.pop((user_name, vm_id))
+				return None
+
+			return session
+
+	def put(self, user_name: str, vm_id: int, vm_fingerprint: str,
+			module_type: str, connection_id: str, endpoint_key: str = None) -> ModuleSession:
+		"""Records a new module connection for a user and a VM, replacing any previous one of the same type."""
+		with self._lock:
+			session = self._sessions.get((user_name, vm_id))
+			if session is None or session.vm_fingerprint != vm_fingerprint:
+				session = ModuleSession(user_name, vm_id, vm_fingerprint)
+				self._sessions[(user_name, vm_id)] = session
+
+			session.connections[module_type] = ModuleConnection(module_type, connection_id, self.lifetime, endpoint_key)
+			return session
+
+	def remove(self, user_name: str, vm_id: int):
+		"""Forgets every connection of a user for a VM."""
+		with self._lock:
+			self._sessions.pop((user_name, vm_id), None)
+
+	def evict_stale(self):
+		"""Removes every session that has a stale connection."""
+		now = time.monotonic()
+		with self._lock:
+			stale_keys = [key for key, session in self._sessions.items() if session.is_stale(now)]
+			for key in stale_keys:
+				self._sessions.pop(key)
+
+	def count_connections(self, module_type: str) -> dict[str, int]:
+		"""Counts the recorded connections of a module type for each module instance key."""
+		counts = {}
+		with self._lock:
+			for session in self._sessions.values():
+				connection = session.connections.get(module_type, None)
+				if connection is not None and connection.endpoint_key is not None:
+					counts[connection.endpoint_key] = counts.get(connection.endpoint_key, 0) + 1
+		return counts
+
+	def __len__(self):
+		with self._lock:
+			return len(self._sessions)
+
+
+def build_vm_fingerprint(vm: VirtualMachine) -> str:
+	"""
+	Builds a fingerprint of the address and stored credentials of a VM, to detect edits made after a connection.
+	The stored credentials are encrypted with a random IV, so any change to them changes the fingerprint.
+	"""
+	digest = hashlib.sha256()
+	for part in (vm.host, str(vm.port), vm.username, vm.password or ""):
+		digest.update(part.encode("utf-8"))
+		digest.update(b"\0")
+	digest.update(vm.ssh_key or b"")
+	return digest.hexdigest()
+
+
+@st.cache_resource
+def get_module_session_registry() -> ModuleSessionRegistry:
+	"""Returns the process-wide registry of the module connections."""
+	lifetime_minutes = float(st.secrets.get("module_session_lifetime_minutes", 30))
+	return ModuleSessionRegistry(lifetime=lifetime_minutes * 60)
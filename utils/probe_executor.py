@@ -0,0 +1,124 @@
+import socket
+import threading
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable
+
+import streamlit as st
+
+from exceptions import ProbeExecutorSaturatedError
+
+
+class ProbeExecutor:
+	def __init__(self, max_workers: int, queue_limit: int):
+		"""
+		A bounded thread pool that runs blocking SSH probes outside the Streamlit script threads.
+		At most `max_workers` probes run at the same time and at most `queue_limit` more can wait for a worker,
+		any probe submitted beyond that is rejected immediately instead of being queued.
+		:param max_workers: The number of probes that can run concurrently
+		:param queue_limit: The number of probes that can wait for a free worker
+		"""
+		self.max_workers = max_workers
+		self.queue_limit = queue_limit
+		self.capacity = max_workers + queue_limit
+
+		self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ssh-probe")
+		self._slots = threading.BoundedSemaphore(self.capacity)
+		self._lock = threading.Lock()
+		self._counters = {
+			"submitted": 0,
+			"completed": 0,
+			"failed": 0,
+			"rejected": 0,
+			"timeouts": 0,  # Probes that failed because of a socket or SSH timeout
+			"wait_timeouts": 0,  # Callers that stopped waiting for a probe, which keeps running and is counted when it ends
+			"in_flight": 0,
+		}
+
+	def _increment(self, counter: str, amount: int = 1):
+		with self._lock:
+			self._counters[counter] += amount
+
+	def _run(self, fn: Callable, args, kwargs):
+		try:
+			result = fn(*args, **kwargs)
+		except BaseException as e:
+			self._increment("timeouts" if is_timeout_exception(e) else "failed")
+			raise
+		else:
+			self._increment("completed")
+			return result
+		finally:
+			self._increment("in_flight", -1)
+			self._slots.release()
+
+	def submit(self, fn: Callable, *args, **kwargs) -> Future:
+		"""
+		Schedules a probe on the pool.
+		:raises ProbeExecutorSaturatedError: If all the workers are busy and the queue is full.
+		:return: The future of the probe.
+		"""
+		if not self._slots.acquire(blocking=False):
+			self._increment("rejected")
+			raise ProbeExecutorSaturatedError(self.capacity)
+
+		self._increment("submitted")
+		self._increment("in_flight")
+
+		try:
+			return self._executor.submit(self._run, fn, args, kwargs)
+		except BaseException:
+			self._increment("in_flight", -1)
+			self._slots.release()
+			raise
+
+	def run(self, fn: Callable, *args, timeout: float = None, **kwargs):
+		"""
+		Schedules a probe on the pool and waits for its result.
+		:param timeout: The maximum number of seconds to wait for the probe, `None` waits forever
+		:raises ProbeExecutorSaturatedError: If all the workers are busy and the queue is full.
+		:raises TimeoutError: If the probe did not finish in time.
+		:return: The value returned by the probe.
+		"""
+		future = self.submit(fn, *args, **kwargs)
+
+		try:
+			return future.result(timeout=timeout)
+		except concurrent.futures.TimeoutError:
+			# The worker keeps going until the socket timeouts kick in, but the caller is released
+			self._increment("wait_timeouts")
+			raise TimeoutError(f"The probe did not finish within {timeout} seconds.")
+
+	def stats(self) -> dict:
+		"""Returns a snapshot of the counters of this executor."""
+		with self._lock:
+			stats = dict(self._counters)
+
+		stats["max_workers"] = self.max_workers
+		stats["queue_limit"] = self.queue_limit
+		stats["saturated"] = stats["in_flight"] >= self.capacity
+		return stats
+
+
+def is_timeout_exception(e: BaseException) -> bool:
+	"""Checks whether an exception raised by a socket or paramiko is caused by a timeout."""
+	if isinstance(e, (TimeoutError, socket.timeout, concurrent.futures.TimeoutError)):
+		return True
+
+	# Paramiko reports banner and authentication timeouts as generic SSH exceptions
+	message = str(e).lower()
+	return "timeout" in message or "timed out" in message
+
+
+@st.cache_resource
+def get_probe_executor() -> ProbeExecutor:
+	"""Returns the process-wide executor shared by every SSH probe."""
+	return ProbeExecutor(
+		max_workers=int(st.secrets.get("ssh_probe_max_workers", 16)),
+		queue_limit=int(st.secrets.get("ssh_probe_queue_limit", 32)),
+	)
+
+
+def get_probe_executor_stats() -> dict:
+	"""Returns the saturation and timeout counters of the SSH probe executor."""
+	return get_probe_executor().stats()
@@ -0,0 +1,233 @@
+import functools
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.rerun_timing import CURRENT_PAGE_FILE_KEY
+
+# Where the queries sent outside a script run (worker threads, CLI) are attributed
+BACKGROUND_PAGE = "background"
+
+# The literals and bind parameters of a statement, replaced by "?" in its fingerprint
+STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\b")
+BIND_PARAMETER_PATTERN = re.compile(r"%\(\w+\)s|%s|(?<![:\w]):\w+|\$\d+")
+IN_LIST_PATTERN = re.compile(r"\bIN \(\?(?:, \?)*\)", re.IGNORECASE)
+VALUES_LIST_PATTERN = re.compile(r"(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class QueryLogSettings(NamedTuple):
+	slow_query_seconds: float  # 0 disables the slow-query log
+	repeated_query_threshold: int  # 0 disables the detection of the N+1 queries
+
+
+@functools.cache
+def get_query_log_settings() -> QueryLogSettings:
+	"""The thresholds of the query log from the secrets, read once: they are needed on every query."""
+	return QueryLogSettings(
+		slow_query_seconds=float(st.secrets.get("slow_query_threshold_ms", 500)) / 1000,
+		repeated_query_threshold=int(st.secrets.get("repeated_query_threshold", 10)),
+	)
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint_statement(statement: str) -> str:
+	"""
+	The shape of an SQL statement, the same for all its executions:
+	the literals and the bind parameters become "?", and the lists of them are collapsed.
+	"""
+	fingerprint = WHITESPACE_PATTERN.sub(" ", statement).strip()
+	fingerprint = STRING_LITERAL_PATTERN.sub("?", fingerprint)
+	fingerprint = BIND_PARAMETER_PATTERN.sub("?", fingerprint)
+	fingerprint = NUMBER_LITERAL_PATTERN.sub("?", fingerprint)
+	fingerprint = IN_LIST_PATTERN.sub("IN (...)", fingerprint)
+	return VALUES_LIST_PATTERN.sub(r"\1, ...", fingerprint)
+
+
+def redact_parameters(parameters):
+	"""The bind parameters of a statement with only the types of their values, which may be passwords or keys."""
+	if isinstance(parameters, dict):
+		return {key: type(value).__name__ for key, value in parameters.items()}
+	if isinstance(parameters, (list, tuple)):
+		if len(parameters) > 0 and isinstance(parameters[0], (dict, list, tuple)):  # executemany
+			return {"rows": len(parameters), "first_row": redact_parameters(parameters[0])}
+		return [type(value).__name__ for value in parameters]
+	return None
+
+
+def current_page_and_user() -> tuple[str, str | None]:
+	"""The page file and the user of the current script run, for the queries sent outside a scope of `app.py`."""
+	if get_script_run_ctx(suppress_warning=True) is None:
+		return BACKGROUND_PAGE, None
+	return st.session_state.get(CURRENT_PAGE_FILE_KEY, "unknown"), st.session_state.get("username", None)
+
+
+################################
+#          QUERY LOG           #
+################################
+
+def get_query_logger() -> logging.Logger:
+	"""
+	The logger of the slow and repeated queries, a JSON object for each line.
+	It writes to `query_log_file` of the secrets, or to the standard error.
+	"""
+	logger = logging.getLogger("vm_lab.queries")
+	if not logger.handlers:
+		log_file = st.secrets.get("query_log_file", None)
+		handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler(sys.stderr)
+		handler.setFormatter(logging.Formatter("%(message)s"))
+		logger.addHandler(handler)
+		logger.setLevel(logging.INFO)
+		logger.propagate = False
+	return logger
+
+
+def log_query_event(event: str, **fields):
+	get_query_logger().warning(json.dumps({
+		"time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+		"event": event,
+		**fields,
+	}, default=str))
+
+
+class QueryStats:
+	def __init__(self, max_fingerprints: int = 2000):
+		"""
+		The statements sent by each page since the server started, grouped by fingerprint,
+		and the statements repeated many times in a single run (the N+1 queries).
+		:param max_fingerprints: Pages and fingerprints kept, the new ones are ignored beyond it
+		"""
+		self.max_fingerprints = max_fingerprints
+		self._lock = threading.Lock()
+		self._statements: dict[tuple[str, str], list] = {}  # Count, total and max seconds
+		self._repeated: dict[tuple[str, str | None, str], list] = {}  # Runs, max count in a run, last time
+
+	def record(self, page: str, fingerprint: str, seconds: float):
+		key = (page, fingerprint)
+		with self._lock:
+			totals = self._statements.get(key, None)
+			if totals is None:
+				if len(self._statements) >= self.max_fingerprints:
+					return
+				totals = self._statements[key] = [0, 0.0, 0.0]
+			totals[0] += 1
+			totals[1] += seconds
+			if seconds > totals[2]:
+				totals[2] = seconds
+
+	def record_repeated(self, page: str, action: str | None, fingerprint: str, count: int):
+		key = (page, action, fingerprint)
+		with self._lock:
+			repeated = self._repeated.get(key, None)
+			if repeated is None:
+				if len(self._repeated) >= self.max_fingerprints:
+					return
+				repeated = self._repeated[key] = [0, 0, 0.0]
+			repeated[0] += 1
+			repeated[1] = max(repeated[1], count)
+			repeated[2] = time.time()
+
+	def statement_stats(self, limit: int = 50) -> list[dict]:
+		"""The fingerprints that took the most time overall, for each page."""
+		with self._lock:
+			snapshot = [(key, list(totals)) for key, totals in self._statements.items()]
+
+		snapshot.sort(key=lambda item: item[1][1], reverse=True)
+		return [
+			{
+				"page": page,
+				"statement": fingerprint,
+				"count": count,
+				"total_ms": round(total * 1000, 1),
+				"mean_ms": round(total / count * 1000, 2),
+				"max_ms": round(maximum * 1000, 1),
+			}
+			for (page, fingerprint), (count, total, maximum) in snapshot[:limit]
+		]
+
+	def repeated_queries(self) -> list[dict]:
+		"""The statements sent many times in a single run, by page and action."""
+		with self._lock:
+			snapshot = [(key, list(repeated)) for key, repeated in self._repeated.items()]
+
+		snapshot.sort(key=lambda item: item[1][2], reverse=True)
+		return [
+			{
+				"page": page,
+				"action": action,
+				"statement": fingerprint,
+				"runs": runs,
+				"max_per_run": max_count,
+				"last_seen": datetime.fromtimestamp(last_seen).strftime("%Y-%m-%d %H:%M:%S"),
+			}
+			for (page, action, fingerprint), (runs, max_count, last_seen) in snapshot
+		]
+
+	def clear(self):
+		with self._lock:
+			self._statements.clear()
+			self._repeated.clear()
+
+
+# Module-level like the metrics, since the queries of the worker threads and of the CLI are recorded too
+_query_stats = QueryStats()
+
+
+def get_query_stats() -> QueryStats:
+	"""Returns the process-wide query statistics."""
+	return _query_stats
+
+
+def observe_statement(statement: str, parameters, seconds: float,
+					  page: str, action: str | None, user: str | None) -> str:
+	"""
+	Records an executed statement, and logs it if it is slow.
+	:return: The fingerprint of the statement
+	"""
+	fingerprint = fingerprint_statement(statement)
+	_query_stats.record(page, fingerprint, seconds)
+
+	slow_query_seconds = get_query_log_settings().slow_query_seconds
+	if 0 < slow_query_seconds <= seconds:
+		log_query_event(
+			"slow_query",
+			duration_ms=round(seconds * 1000, 1),
+			page=page,
+			action=action,
+			user=user,
+			statement=fingerprint,
+			parameters=redact_parameters(parameters),
+		)
+	return fingerprint
+
+
+def report_repeated_statements(page: str, user: str | None, counts: dict[tuple[str | None, str], int]):
+	"""
+	Records and logs the statements sent too many times in a run, usually a query or a commit in a loop.
+	:param counts: The executions of each action and fingerprint in the run
+	"""
+	threshold = get_query_log_settings().repeated_query_threshold
+	if threshold <= 0:
+		return
+
+	for (action, fingerprint), count in counts.items():
+		if count < threshold:
+			continue
+		_query_stats.record_repeated(page, action, fingerprint, count)
+		log_query_event(
+			"repeated_query",
+			count=count,
+			page=page,
+			action=action,
+			user=user,
+			statement=fingerprint,
+		)
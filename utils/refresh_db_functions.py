@@ -3,11 +3,15 @@ from typing import Literal
 import streamlit as st
 
 from backend import get_db
-from backend.models import VirtualMachine, Bookmark
+from backend.database import new_session
+from backend.models import VirtualMachine, Bookmark, User
+from backend.models.virtual_machine import VmScope
+from backend.role import Role, role_has_enough_priority
 from frontend.components import error_message
+from utils.metrics import observe_cache
 
 
-@st.cache_data
+@observe_cache(st.cache_data)
 def get_vm_data_from_db(username: str,
 						scope: Literal["my_owned_vms", "my_assigned_vms", "all_owned_vms", "all_assigned_vms"],
 						shared: bool = None):
@@ -41,6 +45,103 @@ def get_vm_data_from_db(username: str,
 		error_message(unknown_exception=e)
 
 
+def get_connectable_vm_data_from_db(username: str, role: Role) -> dict[int, dict]:
+	"""
+	Fetch the VMs that a user can connect to with their stored credentials, for the pages that act on many VMs.
+	Includes the other users' shared VMs only if the role is allowed by `vm_sharing_minimum_permissions`.
+
+	:return: Dictionary of VM dictionaries (see `build_vm_dict`) indexed by VM id.
+	"""
+	scopes: list[VmScope] = ["my_owned_vms", "all_assigned_vms"]
+	if can_see_other_users_vms(role):
+		scopes.append("all_owned_vms")
+
+	result = {}
+	try:
+		with get_db() as db:
+			vm_list = VirtualMachine.find_by_scopes(db, username, scopes)
+	except Exception as e:
+		error_message(unknown_exception=e)
+		return result
+
+	for vm, _ in vm_list:
+		# Same rule as the Connect button
+		if vm.user.username != username and not vm.shared:
+			continue
+
+		result[vm.id] = build_vm_dict(vm, username)
+
+	return result
+
+
+def can_see_other_users_vms(role: Role) -> bool:
+	"""Whether a role is allowed to see the VMs shared by the other users, by `vm_sharing_minimum_permissions`."""
+	try:
+		minimum_role = Role.from_phrase(st.secrets["vm_sharing_minimum_permissions"])
+	except ValueError:
+		minimum_role = None # "disabled" in secrets.toml
+
+	return minimum_role is not None and role_has_enough_priority(role, minimum_role)
+
+
+def get_dashboard_scopes(role: Role) -> list[VmScope]:
+	"""The VM tables of the dashboard that a role can see."""
+	scopes: list[VmScope] = []
+	if role != Role.REGULAR:
+		scopes.append("my_owned_vms")
+	if role == Role.SIDEKICK or role == Role.REGULAR:
+		scopes.append("my_assigned_vms")
+	if role == Role.ADMIN or role == Role.MANAGER:
+		scopes.append("all_assigned_vms")
+	if can_see_other_users_vms(role):
+		scopes.append("all_owned_vms")
+	return scopes
+
+
+def get_empty_dashboard_data(role: Role) -> dict[str, list[dict]]:
+	"""The tables of the dashboard that a role can see, without rows."""
+	result = {scope: [] for scope in get_dashboard_scopes(role)}
+	if role != Role.REGULAR:
+		result["bookmarks"] = []
+	return result
+
+
+@observe_cache(st.cache_data)
+def load_dashboard_data_from_db(username: str, role: Role) -> dict[str, list[dict]]:
+	"""
+	Fetch the rows of all the tables of the dashboard that a role can see, in a single database session:
+	the VMs of every scope are found with one query, tagged by scope and then split in memory.
+	Raises the errors, so that a failed load is not cached.
+	"""
+	result = get_empty_dashboard_data(role)
+	with get_db() as db:
+		vm_list = VirtualMachine.find_by_scopes(db, username, get_dashboard_scopes(role))
+		if "bookmarks" in result:
+			result["bookmarks"] = [build_bookmark_dict(bookmark) for bookmark in Bookmark.find_by_user_name(db, username)]
+
+	for vm, vm_scopes in vm_list:
+		# The same row can be shown in more tables, it is built once
+		vm_dict = build_vm_dict(vm, username)
+		for scope in vm_scopes:
+			result[scope].append(vm_dict)
+
+	return result
+
+
+def get_dashboard_data_from_db(username: str, role: Role) -> dict[str, list[dict]]:
+	"""
+	Fetch the rows of all the tables of the dashboard that a role can see (see `load_dashboard_data_from_db`).
+
+	:return: The rows of each table by scope (see `get_vm_data_from_db`) and "bookmarks" for the bookmarks.
+	Only the tables that the role can see are included, empty if the data could not be loaded.
+	"""
+	try:
+		return load_dashboard_data_from_db(username, role)
+	except Exception as e:
+		error_message(unknown_exception=e)
+		return get_empty_dashboard_data(role)
+
+
 def build_vm_dict(vm: VirtualMachine, requesting_user_name: str):
 	"""Build a correct dictionary with the VM info to display in the table."""
 	if vm.ssh_key:
@@ -74,22 +175,52 @@ def build_vm_dict(vm: VirtualMachine, requesting_user_name: str):
 	return vm_dict
 
 
-@st.cache_data
+@observe_cache(st.cache_data)
+def get_vm_by_id_from_db(vm_id: int) -> VirtualMachine | None:
+	"""
+	Fetch a single VM, without its owner, for the pages that keep only its snapshot in the session state.
+	Cleared with the other cached data after every edit.
+
+	:return: The VM or `None` if it has been deleted.
+	"""
+	# Not the session of the run: its identity map may hold the VM with its relationships already loaded,
+	# which would be pickled in the cache too
+	with new_session() as db:
+		return VirtualMachine.find_by_id(db, vm_id, load_relationships=False)
+
+
+@observe_cache(st.cache_data)
+def get_user_by_id_from_db(user_id: int) -> User | None:
+	"""
+	Fetch a single user, without their VMs and bookmarks, for the pages that keep only its snapshot in the session state.
+	Cleared with the other cached data after every edit.
+
+	:return: The user or `None` if they have been deleted.
+	"""
+	# Not the session of the run: its identity map may hold the user with its relationships already loaded,
+	# which would be pickled in the cache too
+	with new_session() as db:
+		return User.find_by_id(db, user_id, load_relationships=False)
+
+
+@observe_cache(st.cache_data)
 def get_bookmark_data_from_db(requesting_user_name: str):
 	with get_db() as db_bookmark_list:
 		bookmark_list = Bookmark.find_by_user_name(db_bookmark_list, requesting_user_name)
 
-	result = []
-	for bookmark in bookmark_list:
-		bookmark_dict = {
-			# Hidden
-			"original_object": bookmark,
-			# Shown in columns
-			"name": bookmark.name,
-			"url": bookmark.link,
-			# Button disabled settings
-			"buttons_disabled": {}
-		}
-		result.append(bookmark_dict)
+	return [build_bookmark_dict(bookmark) for bookmark in bookmark_list]
 
-	return result
+
+def build_bookmark_dict(bookmark: Bookmark):
+	"""Build a correct dictionary with the bookmark info to display in the table."""
+	bookmark_dict = {
+		# Hidden
+		"original_object": bookmark,
+		# Shown in columns
+		"name": bookmark.name,
+		"url": bookmark.link,
+		# Button disabled settings
+		"buttons_disabled": {}
+	}
+
+	return bookmark_dict
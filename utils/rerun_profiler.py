@@ -0,0 +1,158 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import CodeType, FrameType
+from typing import Iterator
+
+import streamlit as st
+
+from backend.authentication.current_user_data import get_current_user_role
+from backend.role import Role
+
+# Set by the toggle of the admins in the sidebar, see `page_setup`
+PROFILER_ENABLED_KEY = "rerun_profiler_enabled"
+# The last profiles of the session, the newest first
+PROFILES_KEY = "rerun_profiles"
+
+MAX_STORED_PROFILES = 5
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(REPOSITORY_ROOT, "app.py")
+
+
+def frame_name(code: CodeType) -> str:
+	"""The name of a function in the profiles, with its file relative to the repository or to the installed packages."""
+	path = code.co_filename
+	if path.startswith(REPOSITORY_ROOT):
+		path = os.path.relpath(path, REPOSITORY_ROOT)
+	elif "site-packages" in path:
+		path = path.split("site-packages" + os.sep, 1)[-1]
+	# Semicolons separate the frames in the folded stacks
+	return f"{code.co_qualname} ({path}:{code.co_firstlineno})".replace(";", ",")
+
+
+@dataclass
+class RerunProfile:
+	page: str
+	started_at: datetime
+	duration: float
+	sample_interval: float
+	stacks: Counter = field(default_factory=Counter)  # Of the names of the frames, from the root to the leaf
+
+	@property
+	def samples(self) -> int:
+		return sum(self.stacks.values())
+
+	def folded_stacks(self) -> str:
+		"""
+		The samples in the folded format, a stack and its count for each line:
+		it is read by flamegraph.pl, speedscope.app and most flamegraph viewers.
+		"""
+		return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+	def hot_functions(self, limit: int = 15) -> list[dict]:
+		"""The functions with the most samples, running themselves (self) or any function they called (total)."""
+		self_samples = Counter()
+		total_samples = Counter()
+		for stack, count in self.stacks.items():
+			self_samples[stack[-1]] += count
+			for name in set(stack):
+				total_samples[name] += count
+
+		samples = self.samples or 1
+		ms_per_sample = self.duration * 1000 / samples
+		hottest = sorted(total_samples, key=lambda name: (self_samples[name], total_samples[name]), reverse=True)
+		return [
+			{
+				"function": name,
+				"self_ms": round(self_samples[name] * ms_per_sample, 1),
+				"total_ms": round(total_samples[name] * ms_per_sample, 1),
+				"self_percent": round(self_samples[name] / samples * 100, 1),
+			}
+			for name in hottest[:limit]
+		]
+
+
+class SamplingProfiler:
+	def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_SECONDS):
+		"""
+		Samples the stack of a thread from another thread at a fixed interval.
+		The profiled thread is not slowed down by hooks on every call, like a deterministic profiler would do,
+		and the other sessions are not affected at all.
+		:param thread_id: The `ident` of the thread to sample
+		:param interval: Seconds between two samples
+		"""
+		self.thread_id = thread_id
+		self.interval = interval
+		self._stacks: Counter[tuple[CodeType, ...]] = Counter()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._sample_loop, name="rerun-profiler", daemon=True)
+
+	def _sample_loop(self):
+		while not self._stop.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id, None)
+			if frame is not None:
+				self._stacks[self._stack_of(frame)] += 1
+
+	@staticmethod
+	def _stack_of(frame: FrameType) -> tuple[CodeType, ...]:
+		"""The code objects of a stack from `app.py` (the Streamlit frames above it are left out) to the leaf."""
+		codes = []
+		while frame is not None:
+			codes.append(frame.f_code)
+			if frame.f_code.co_filename == APP_FILE:
+				break
+			frame = frame.f_back
+		codes.reverse()
+		return tuple(codes)
+
+	def start(self):
+		self._thread.start()
+
+	def stop(self) -> Counter:
+		"""Stops the sampling, and returns the stacks with the names of their frames."""
+		self._stop.set()
+		self._thread.join()
+
+		names = {}
+		stacks = Counter()
+		for codes, count in self._stacks.items():
+			stack = tuple(names.setdefault(code, frame_name(code)) for code in codes)
+			stacks[stack] += count
+		return stacks
+
+
+def is_rerun_profiler_enabled() -> bool:
+	"""Whether an admin has turned on the profiler for this session."""
+	return st.session_state.get(PROFILER_ENABLED_KEY, False) and get_current_user_role() == Role.ADMIN
+
+
+@contextmanager
+def profile_rerun(page: str) -> Iterator[RerunProfile]:
+	"""
+	Profiles the block with a `SamplingProfiler` on the current thread,
+	and stores its profile in the session, even when the page is stopped or redirected midway.
+	"""
+	profile = RerunProfile(page=page, started_at=datetime.now(), duration=0, sample_interval=SAMPLE_INTERVAL_SECONDS)
+	profiler = SamplingProfiler(threading.get_ident())
+
+	start = time.perf_counter()
+	profiler.start()
+	try:
+		yield profile
+	finally:
+		profile.stacks = profiler.stop()
+		profile.duration = time.perf_counter() - start
+		stored_profiles = st.session_state.get(PROFILES_KEY, [])
+		st.session_state[PROFILES_KEY] = [profile] + stored_profiles[:MAX_STORED_PROFILES - 1]
+
+
+def get_stored_profiles() -> list[RerunProfile]:
+	"""The last profiles of this session, the newest first."""
+	return st.session_state.get(PROFILES_KEY, [])
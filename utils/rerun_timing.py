@@ -0,0 +1,143 @@
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Literal
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.metrics import PAGE_RERUN_SECONDS
+
+RerunKind = Literal["full", "fragment"]
+
+CURRENT_PAGE_KEY = "rerun_timing_page"
+CURRENT_PAGE_FILE_KEY = "rerun_timing_page_file"
+
+
+class RerunTimings:
+	def __init__(self, max_samples: int = 500):
+		"""
+		The durations of the last reruns of each page, process-wide, to compare the full reruns
+		with the fragment reruns that only redraw a part of the page.
+		:param max_samples: Durations kept for each page and kind of rerun
+		"""
+		self.max_samples = max_samples
+		self._lock = threading.Lock()
+		self._samples: dict[tuple[str, RerunKind], deque[float]] = {}
+		self._queries: dict[tuple[str, RerunKind], deque[int]] = {}
+		self._counts: dict[tuple[str, RerunKind], int] = {}
+
+	def record(self, page: str, kind: RerunKind, seconds: float, queries: int = 0):
+		"""
+		:param seconds: The duration of the rerun
+		:param queries: The database queries sent in the rerun
+		"""
+		with self._lock:
+			key = (page, kind)
+			if key not in self._samples:
+				self._samples[key] = deque(maxlen=self.max_samples)
+				self._queries[key] = deque(maxlen=self.max_samples)
+				self._counts[key] = 0
+			self._samples[key].append(seconds)
+			self._queries[key].append(queries)
+			self._counts[key] += 1
+
+	def stats(self) -> list[dict]:
+		"""
+		A row for each page and kind of rerun, with the percentiles of the last durations (in milliseconds)
+		and the median number of queries.
+		"""
+		with self._lock:
+			snapshot = {
+				key: (list(samples), list(self._queries[key]), self._counts[key])
+				for key, samples in self._samples.items()
+			}
+
+		rows = []
+		for (page, kind), (samples, queries, count) in sorted(snapshot.items()):
+			samples.sort()
+			rows.append({
+				"page": page,
+				"kind": kind,
+				"reruns": count,
+				"p50_ms": round(statistics.median(samples) * 1000, 1),
+				"p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+				"max_ms": round(samples[-1] * 1000, 1),
+				"queries_p50": statistics.median(queries),
+			})
+		return rows
+
+	def clear(self):
+		with self._lock:
+			self._samples.clear()
+			self._queries.clear()
+			self._counts.clear()
+
+
+# No spinner: `app.py` calls it around every page run, and the spinner adds an element to the page even on a hit
+@st.cache_resource(show_spinner=False)
+def get_rerun_timings() -> RerunTimings:
+	"""Returns the process-wide rerun durations."""
+	return RerunTimings()
+
+
+def count_queries() -> int:
+	"""The queries sent so far in the `request_scope` of the current run, zero outside of it."""
+	# Imported here, so that the tables can be timed without a database
+	from backend.database import get_request_scope
+
+	scope = get_request_scope()
+	return scope.queries if scope is not None else 0
+
+
+def is_fragment_rerun() -> bool:
+	"""Whether the script is running only some fragments, instead of the whole page."""
+	ctx = get_script_run_ctx()
+	return ctx is not None and bool(ctx.fragment_ids_this_run)
+
+
+@contextmanager
+def time_page_run(page: str, page_file: str) -> Iterator[None]:
+	"""
+	Times a full run of a page, even when it is stopped or redirected midway.
+	The page is remembered in the session, for the fragment reruns that follow.
+	Its queries are counted only inside a `request_scope`.
+	:param page: The title of the page
+	:param page_file: The file of the page in `PageNames`, the label of its metrics
+	"""
+	st.session_state[CURRENT_PAGE_KEY] = page
+	st.session_state[CURRENT_PAGE_FILE_KEY] = page_file
+	start = time.perf_counter()
+	start_queries = count_queries()
+	try:
+		yield
+	finally:
+		seconds = time.perf_counter() - start
+		get_rerun_timings().record(page, "full", seconds, count_queries() - start_queries)
+		PAGE_RERUN_SECONDS.labels(page_file, "full").observe(seconds)
+
+
+@contextmanager
+def time_fragment_rerun() -> Iterator[None]:
+	"""
+	Times a fragment when it reruns on its own, the full runs are already timed by `time_page_run`.
+	The fragment reruns do not run `app.py`, so they get their own `request_scope` here.
+	"""
+	if not is_fragment_rerun():
+		yield
+		return
+
+	from backend.database import request_scope
+
+	with request_scope():
+		start = time.perf_counter()
+		start_queries = count_queries()
+		try:
+			yield
+		finally:
+			seconds = time.perf_counter() - start
+			page = st.session_state.get(CURRENT_PAGE_KEY, "unknown")
+			get_rerun_timings().record(page, "fragment", seconds, count_queries() - start_queries)
+			PAGE_RERUN_SECONDS.labels(st.session_state.get(CURRENT_PAGE_FILE_KEY, "unknown"), "fragment").observe(seconds)
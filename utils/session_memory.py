@@ -0,0 +1,175 @@
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+
+import streamlit as st
+from streamlit.runtime.caching import get_data_cache_stats_provider, get_resource_cache_stats_provider
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.state import SafeSessionState
+
+from utils.metrics import ACTIVE_SESSIONS
+
+# The session_state keys that can be dropped from an idle session, because they are rebuilt when missing:
+# the streamlit-authenticator object (with the credentials of every user) and the search indexes of the tables
+EVICTABLE_KEYS = ["authenticator"]
+EVICTABLE_KEY_SUFFIXES = ["-search_index"]
+
+# How often the idle sessions are looked for, at most
+SWEEP_INTERVAL_SECONDS = 60
+
+
+def deep_size(value) -> int:
+	"""The approximate size in bytes of a value and of everything it references."""
+	# Imported here, it is slow to import and only the admins need it
+	from streamlit.vendor.pympler.asizeof import asizeof
+
+	try:
+		return asizeof(value)
+	except Exception:  # Some objects (e.g. locks of C extensions) cannot be measured
+		return 0
+
+
+def is_evictable_key(key: str) -> bool:
+	return key in EVICTABLE_KEYS or key.endswith(tuple(EVICTABLE_KEY_SUFFIXES))
+
+
+@dataclass
+class TrackedSession:
+	session_id: str
+	state: weakref.ref  # To the `SafeSessionState`, so that the closed sessions are not kept alive
+	last_active: float
+	evicted_keys: int = 0
+
+
+class SessionTracker:
+	def __init__(self):
+		"""
+		The browser sessions of this process, with the time of their last rerun,
+		to measure their memory and to drop the heavy state of the idle ones.
+		"""
+		self._lock = threading.Lock()
+		self._sessions: dict[str, TrackedSession] = {}
+		self._last_sweep = time.monotonic()
+
+	def touch(self):
+		"""Marks the session of the current run as active."""
+		ctx = get_script_run_ctx()
+		if ctx is None:
+			return
+
+		with self._lock:
+			tracked = self._sessions.get(ctx.session_id, None)
+			if tracked is None or tracked.state() is not ctx.session_state:
+				self._sessions[ctx.session_id] = TrackedSession(
+					session_id=ctx.session_id,
+					state=weakref.ref(ctx.session_state),
+					last_active=time.monotonic(),
+				)
+			else:
+				tracked.last_active = time.monotonic()
+
+	def _live_sessions(self) -> list[tuple[TrackedSession, SafeSessionState]]:
+		"""The tracked sessions that still exist, forgetting the closed ones."""
+		with self._lock:
+			live = []
+			for session_id, tracked in list(self._sessions.items()):
+				state = tracked.state()
+				if state is None:
+					del self._sessions[session_id]
+				else:
+					live.append((tracked, state))
+			return live
+
+	def sweep(self, idle_seconds: float, force: bool = False) -> int:
+		"""
+		Drops the evictable keys (see `EVICTABLE_KEYS`) of the sessions idle for more than `idle_seconds`.
+		They are rebuilt by their pages when the sessions come back.
+		:param force: Sweep even if the last sweep was less than `SWEEP_INTERVAL_SECONDS` ago
+		:return: The number of keys dropped
+		"""
+		now = time.monotonic()
+		with self._lock:
+			if not force and now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+				return 0
+			self._last_sweep = now
+
+		evicted = 0
+		for tracked, state in self._live_sessions():
+			if now - tracked.last_active < idle_seconds:
+				continue
+
+			for key in [key for key in state.filtered_state if is_evictable_key(key)]:
+				try:
+					del state[key]
+				except KeyError:  # Removed by the session itself in the meantime
+					continue
+				tracked.evicted_keys += 1
+				evicted += 1
+
+		return evicted
+
+	def count_live_sessions(self) -> int:
+		return len(self._live_sessions())
+
+	def session_reports(self) -> list[dict]:
+		"""A row for each live session, with its approximate size and its heaviest keys. Slow, for the admins only."""
+		now = time.monotonic()
+		rows = []
+		for tracked, state in self._live_sessions():
+			values = state.filtered_state
+			key_sizes = {key: deep_size(value) for key, value in values.items()}
+			heaviest = sorted(key_sizes.items(), key=lambda item: item[1], reverse=True)[:3]
+			rows.append({
+				"session": tracked.session_id[:8],
+				"user": values.get("username", None),
+				"idle_minutes": round((now - tracked.last_active) / 60, 1),
+				"keys": len(key_sizes),
+				"size_kb": round(sum(key_sizes.values()) / 1024, 1),
+				"heaviest_keys": ", ".join(f"{key} ({size / 1024:.1f} KB)" for key, size in heaviest),
+				"evicted_keys": tracked.evicted_keys,
+			})
+		return sorted(rows, key=lambda row: row["size_kb"], reverse=True)
+
+
+# No spinner: it is called by `app.py` before the pages, which must start with `st.set_page_config`
+@st.cache_resource(show_spinner=False)
+def get_session_tracker() -> SessionTracker:
+	"""Returns the process-wide session tracker."""
+	tracker = SessionTracker()
+	ACTIVE_SESSIONS.set_function(tracker.count_live_sessions)
+	return tracker
+
+
+def track_session():
+	"""
+	Marks the current session as active and, at most once a minute, evicts the heavy state of the idle sessions.
+	The idle time is `idle_session_eviction_minutes` of the secrets, the eviction is disabled if it is 0.
+	"""
+	tracker = get_session_tracker()
+	tracker.touch()
+
+	idle_minutes = float(st.secrets.get("idle_session_eviction_minutes", 30))
+	if idle_minutes > 0:
+		tracker.sweep(idle_minutes * 60)
+
+
+def session_state_report() -> list[dict]:
+	"""A row for each key of the current session, with its approximate size."""
+	rows = [
+		{"key": key, "type": type(value).__name__, "size_kb": round(deep_size(value) / 1024, 1), "evictable": is_evictable_key(key)}
+		for key, value in st.session_state.to_dict().items()
+	]
+	return sorted(rows, key=lambda row: row["size_kb"], reverse=True)
+
+
+def cache_report() -> list[dict]:
+	"""A row for each cached function (`st.cache_data` and `st.cache_resource`), with the size of all its entries."""
+	rows = []
+	for stat in get_data_cache_stats_provider().get_stats() + get_resource_cache_stats_provider().get_stats():
+		rows.append({
+			"cache": stat.category_name,
+			"function": stat.cache_name,
+			"size_kb": round(stat.byte_length / 1024, 1),
+		})
+	return sorted(rows, key=lambda row: row["size_kb"], reverse=True)
@@ -0,0 +1,314 @@
+import math
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Literal
+
+import paramiko
+import streamlit as st
+
+from utils.batch_exec import BatchTarget
+from utils.ssh_transport_pool import SSHTransportPool, get_ssh_transport_pool
+from utils.terminal_connection import get_ssh_timeouts
+
+# The largest payload of a single SFTP write, bigger writes are split by paramiko anyway
+SFTP_MAX_WRITE_SIZE = 32768
+
+
+class TransferSettings:
+	def __init__(self, ranges_per_file: int = 4, min_range_size: int = 8 * 1024 * 1024,
+				 chunk_size: int = SFTP_MAX_WRITE_SIZE, progress_interval: float = 0.25):
+		"""
+		How files are moved by the transfer engine.
+
+		:param ranges_per_file: The maximum number of ranges of a file moved at the same time, each on its own SFTP channel
+		:param min_range_size: Files are not split in ranges smaller than this many bytes
+		:param chunk_size: The size of each read or write request, many of them are in flight at the same time
+		:param progress_interval: Minimum seconds between two progress events of the same host
+		"""
+		self.ranges_per_file = max(1, ranges_per_file)
+		self.min_range_size = max(1, min_range_size)
+		self.chunk_size = max(1, min(chunk_size, SFTP_MAX_WRITE_SIZE))
+		self.progress_interval = progress_interval
+
+	def split(self, size: int, max_ranges: int = None) -> list[tuple[int, int]]:
+		"""
+		Splits a file of `size` bytes in contiguous `(offset, length)` ranges.
+		:param max_ranges: Lowers `ranges_per_file`, e.g. to fit the free channels of a connection
+		"""
+		if size == 0:
+			return [(0, 0)]
+
+		range_count = min(self.ranges_per_file, math.ceil(size / self.min_range_size))
+		if max_ranges is not None:
+			range_count = max(1, min(range_count, max_ranges))
+		range_size = math.ceil(size / range_count)
+		return [
+			(offset, min(range_size, size - offset))
+			for offset in range(0, size, range_size)
+		]
+
+	@staticmethod
+	def from_secrets() -> "TransferSettings":
+		return TransferSettings(
+			ranges_per_file=int(st.secrets.get("sftp_transfer_ranges_per_file", 4)),
+			min_range_size=int(st.secrets.get("sftp_transfer_min_range_mb", 8)) * 1024 * 1024,
+		)
+
+
+class TransferEvent:
+	def __init__(self, target: BatchTarget,
+				 kind: Literal["started", "progress", "finished", "error"],
+				 transferred: int = 0, total: int = 0, data: str = None):
+		"""
+		Something that happened on a host while transferring a file.
+		- "started": the connection is open and the transfer has begun
+		- "progress": `transferred` of `total` bytes have been sent (or received)
+		- "finished": the whole file has been acknowledged by the host and its size verified
+		- "error": the host failed, `data` contains the reason
+		"""
+		self.target = target
+		self.kind = kind
+		self.transferred = transferred
+		self.total = total
+		self.data = data
+		self.timestamp = time.monotonic()
+
+
+class ProgressReporter:
+	def __init__(self, target: BatchTarget, total: int, events: queue.Queue, interval: float):
+		"""Sums the bytes moved by the ranges of a host and puts throttled progress events on the queue."""
+		self.target = target
+		self.total = total
+		self.events = events
+		self.interval = interval
+		self.transferred = 0
+		self._lock = threading.Lock()
+		self._last_reported_at = 0.0
+
+	def add(self, size: int):
+		with self._lock:
+			self.transferred += size
+			now = time.monotonic()
+			if now - self._last_reported_at < self.interval:
+				return
+			self._last_reported_at = now
+			transferred = self.transferred
+
+		self.events.put(TransferEvent(self.target, "progress", transferred=transferred, total=self.total))
+
+
+################################
+#           RANGES             #
+################################
+
+def open_sftp_channel(transport: paramiko.Transport, ssh_timeouts: dict) -> paramiko.SFTPClient:
+	"""Opens a new SFTP channel on an existing connection, so that the ranges do not share a window."""
+	sftp = paramiko.SFTPClient.from_transport(transport)
+	sftp.get_channel().settimeout(ssh_timeouts.get("timeout", None))
+	return sftp
+
+
+def upload_range(transport: paramiko.Transport, ssh_timeouts: dict, data: memoryview, remote_path: str,
+				 offset: int, length: int, chunk_size: int, reporter: ProgressReporter):
+	"""
+	Writes `length` bytes starting at `offset` in an existing remote file.
+	The writes are pipelined: they are sent without waiting for each acknowledgement, which are collected on close.
+	"""
+	sftp = open_sftp_channel(transport, ssh_timeouts)
+	try:
+		with sftp.open(remote_path, "r+b", bufsize=0) as remote_file:
+			remote_file.set_pipelined(True)
+			remote_file.seek(offset)
+
+			end = offset + length
+			position = offset
+			while position < end:
+				size = min(chunk_size, end - position)
+				remote_file.write(data[position:position + size])
+				position += size
+				reporter.add(size)
+	finally:
+		sftp.close()
+
+
+def download_range(transport: paramiko.Transport, ssh_timeouts: dict, buffer: bytearray, remote_path: str,
+				   offset: int, length: int, chunk_size: int, reporter: ProgressReporter):
+	"""Reads `length` bytes starting at `offset` of a remote file, with all the read requests in flight at once."""
+	sftp = open_sftp_channel(transport, ssh_timeouts)
+	try:
+		with sftp.open(remote_path, "rb") as remote_file:
+			chunks = [
+				(position, min(chunk_size, offset + length - position))
+				for position in range(offset, offset + length, chunk_size)
+			]
+
+			position = offset
+			for chunk in remote_file.readv(chunks):
+				buffer[position:position + len(chunk)] = chunk
+				position += len(chunk)
+				reporter.add(len(chunk))
+	finally:
+		sftp.close()
+
+
+def run_ranges(ranges: list[tuple[int, int]], transfer_range):
+	"""Runs `transfer_range(offset, length)` on every range at the same time, raising the first failure."""
+	if len(ranges) == 1:
+		transfer_range(*ranges[0])
+		return
+
+	with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="sftp-range") as executor:
+		futures = [executor.submit(transfer_range, offset, length) for offset, length in ranges]
+		for future in futures:
+			future.result()
+
+
+################################
+#           TARGETS            #
+################################
+
+def upload_to_target(target: BatchTarget, data: memoryview, remote_path: str, settings: TransferSettings,
+					 ssh_timeouts: dict, pool: SSHTransportPool, events: queue.Queue):
+	"""Uploads a file to a single target, putting its events on the queue as they happen."""
+	# One channel for the creation and the final check, one for each range
+	ranges = settings.split(len(data), max_ranges=pool.max_channels_per_transport - 1)
+
+	try:
+		with target.lease_transport(pool, ssh_timeouts, channels=len(ranges) + 1) as transport:
+			reporter = ProgressReporter(target, len(data), events, settings.progress_interval)
+
+			# Create (or empty) the file once, so that every range can write into it
+			sftp = open_sftp_channel(transport, ssh_timeouts)
+			try:
+				with sftp.open(remote_path, "wb"):
+					pass
+				events.put(TransferEvent(target, "started", total=len(data)))
+
+				run_ranges(
+					ranges,
+					lambda offset, length: upload_range(
+						transport, ssh_timeouts, data, remote_path, offset, length, settings.chunk_size, reporter
+					)
+				)
+
+				remote_size = sftp.stat(remote_path).st_size
+				if remote_size != len(data):
+					raise IOError(f"The remote file has {remote_size} bytes instead of {len(data)}.")
+			finally:
+				sftp.close()
+
+		events.put(TransferEvent(target, "finished", transferred=len(data), total=len(data)))
+	except Exception as e:
+		events.put(TransferEvent(target, "error", data=str(e) or type(e).__name__))
+
+
+def push_file_to_targets(targets: list[BatchTarget], data: bytes, remote_path: str,
+						 settings: TransferSettings = None, max_workers: int = None,
+						 ssh_timeouts: dict = None, pool: SSHTransportPool = None) -> Iterator[TransferEvent]:
+	"""
+	Uploads the same file to many targets concurrently and yields their events as soon as they happen.
+	Every target ends with exactly one "finished" or "error" event.
+
+	:param targets: The targets to upload the file to
+	:param data: The content of the file
+	:param remote_path: Where the file is written on every target, an existing file is overwritten
+	:param settings: How the file is split and sent, read from the secrets if `None`
+	:param max_workers: How many hosts are processed at the same time
+	:param ssh_timeouts: The "timeout", "banner_timeout" and "auth_timeout" keyword arguments for paramiko
+	:param pool: The pool of SSH connections, the process-wide one if `None`
+	"""
+	if settings is None:
+		settings = TransferSettings.from_secrets()
+	if max_workers is None:
+		max_workers = int(st.secrets.get("sftp_transfer_max_workers", 20))
+
+	# Read in the script thread, the workers must not depend on the Streamlit context
+	if ssh_timeouts is None:
+		ssh_timeouts = get_ssh_timeouts()
+	if pool is None:
+		pool = get_ssh_transport_pool()
+	events = queue.Queue()
+	remaining = len(targets)
+
+	if remaining == 0:
+		return
+
+	# Shared by all the hosts and ranges without copies
+	data = memoryview(data)
+
+	executor = ThreadPoolExecutor(max_workers=min(max_workers, remaining), thread_name_prefix="sftp-push")
+	try:
+		for target in targets:
+			executor.submit(upload_to_target, target, data, remote_path, settings, ssh_timeouts, pool, events)
+
+		while remaining > 0:
+			event = events.get()
+			if event.kind in ("finished", "error"):
+				remaining -= 1
+			yield event
+	finally:
+		# If the page is left midway, the hosts not started yet are skipped
+		executor.shutdown(wait=False, cancel_futures=True)
+
+
+def download_from_target(target: BatchTarget, remote_path: str, settings: TransferSettings = None,
+						 on_progress=None, ssh_timeouts: dict = None, pool: SSHTransportPool = None) -> bytes:
+	"""
+	Downloads a file from a single target, splitting it in ranges like the uploads.
+
+	:param target: The target to download the file from
+	:param remote_path: The path of the file on the target
+	:param settings: How the file is split and read, read from the secrets if `None`
+	:param on_progress: Called with each `TransferEvent`, from the calling thread
+	:param ssh_timeouts: The "timeout", "banner_timeout" and "auth_timeout" keyword arguments for paramiko
+	:param pool: The pool of SSH connections, the process-wide one if `None`
+	:return: The content of the file
+	"""
+	if settings is None:
+		settings = TransferSettings.from_secrets()
+	if ssh_timeouts is None:
+		ssh_timeouts = get_ssh_timeouts()
+	if pool is None:
+		pool = get_ssh_transport_pool()
+
+	# One channel for the size, one for each range
+	max_ranges = min(settings.ranges_per_file, pool.max_channels_per_transport - 1)
+
+	with target.lease_transport(pool, ssh_timeouts, channels=max_ranges + 1) as transport:
+		sftp = open_sftp_channel(transport, ssh_timeouts)
+		try:
+			size = sftp.stat(remote_path).st_size
+		finally:
+			sftp.close()
+
+		events = queue.Queue()
+		reporter = ProgressReporter(target, size, events, settings.progress_interval)
+		buffer = bytearray(size)
+		errors = []
+
+		def run():
+			try:
+				run_ranges(
+					settings.split(size, max_ranges=max_ranges),
+					lambda offset, length: download_range(
+						transport, ssh_timeouts, buffer, remote_path, offset, length, settings.chunk_size, reporter
+					)
+				)
+			except Exception as e:
+				errors.append(e)
+			finally:
+				events.put(None)
+
+		threading.Thread(target=run, name="sftp-download", daemon=True).start()
+
+		# Report the progress from the calling thread
+		while (event := events.get()) is not None:
+			if on_progress is not None:
+				on_progress(event)
+
+		if errors:
+			raise errors[0]
+
+		return bytes(buffer)
@@ -0,0 +1,391 @@
+import hashlib
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import paramiko
+import streamlit as st
+
+from utils.terminal_connection import load_private_key
+
+logger = logging.getLogger("vm_lab.ssh_transport_pool")
+
+
+def open_ssh_client(hostname: str, port: int, username: str,
+					password: str = None, ssh_key: bytes = None, ssh_timeouts: dict = None) -> paramiko.SSHClient:
+	"""
+	Opens an authenticated SSH client, preferring the SSH key over the password.
+	:raises paramiko.ssh_exception.AuthenticationException: If the credentials are invalid.
+	:raises ValueError: If no SSH key or password is provided.
+	"""
+	ssh_client = paramiko.SSHClient()
+	ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+	try:
+		if ssh_key:
+			ssh_client.connect(
+				hostname=hostname,
+				port=port,
+				username=username,
+				pkey=load_private_key(ssh_key.decode("utf-8")),
+				**(ssh_timeouts or {})
+			)
+		elif password:
+			ssh_client.connect(
+				hostname=hostname,
+				port=port,
+				username=username,
+				password=password,
+				**(ssh_timeouts or {})
+			)
+		else:
+			raise ValueError("No SSH key or password provided.")
+
+		# Channels are opened and closed back to back on pooled connections: without this,
+		# Nagle's algorithm holds each small request until the previous one is acknowledged
+		ssh_client.get_transport().sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+	except Exception:
+		ssh_client.close()
+		raise
+
+	return ssh_client
+
+
+def build_transport_key(hostname: str, port: int, username: str,
+						password: str = None, ssh_key: bytes = None) -> tuple:
+	"""
+	Builds the pool key of a connection. The credentials are part of it (hashed), so that a connection
+	is never reused by someone who did not prove to know them.
+	"""
+	if ssh_key:
+		credential = b"key:" + ssh_key
+	else:
+		credential = b"password:" + (password or "").encode("utf-8")
+
+	return hostname, int(port), username, hashlib.sha256(credential).hexdigest()
+
+
+def fit_ssh_timeouts(ssh_timeouts: dict, seconds: float) -> dict:
+	"""
+	Shrinks the SSH timeouts, keeping their proportions, so that a whole handshake fits in the given seconds.
+	:raises TimeoutError: If there are no seconds left
+	"""
+	if seconds <= 0:
+		raise TimeoutError("There is no time left to connect.")
+
+	if not ssh_timeouts:
+		return {"timeout": seconds / 3, "banner_timeout": seconds / 3, "auth_timeout": seconds / 3}
+
+	total = sum(ssh_timeouts.values())
+	if total <= seconds:
+		return ssh_timeouts
+	return {name: value * seconds / total for name, value in ssh_timeouts.items()}
+
+
+class PooledTransport:
+	def __init__(self, key: tuple, client: paramiko.SSHClient):
+		"""
+		An authenticated SSH connection kept by the pool, on which many channels can be opened.
+		:param key: The pool key, see `build_transport_key`
+		:param client: The connected client
+		"""
+		self.key = key
+		self.client = client
+		self.channels = 0
+		self.created_at = time.monotonic()
+		self.last_used_at = self.created_at
+
+	@property
+	def transport(self) -> paramiko.Transport | None:
+		return self.client.get_transport()
+
+	def is_active(self) -> bool:
+		transport = self.transport
+		return transport is not None and transport.is_active() and transport.is_authenticated()
+
+
+class SSHTransportPool:
+	def __init__(self, max_channels_per_transport: int = 10, max_transports_per_host: int = 8,
+				 idle_timeout: float = 300, health_check_interval: float = 30):
+		"""
+		A process-wide pool of authenticated SSH connections, like OpenSSH's ControlMaster:
+		the probes, the terminals, the batch commands and the file transfers open their channels
+		on an existing connection to the same host and user instead of paying a new handshake every time.
+
+		:param max_channels_per_transport: Channels open at the same time on a single connection,
+		OpenSSH refuses more than `MaxSessions` (10 by default)
+		:param max_transports_per_host: Connections opened to the same host, user and credentials before
+		the next requests wait for a free channel
+		:param idle_timeout: Seconds a connection without open channels is kept before being closed
+		:param health_check_interval: Seconds between two checks of the idle connections, 0 disables them
+		"""
+		self.max_channels_per_transport = max(1, max_channels_per_transport)
+		self.max_transports_per_host = max(1, max_transports_per_host)
+		self.idle_timeout = idle_timeout
+		self.health_check_interval = health_check_interval
+
+		self._condition = threading.Condition()
+		self._transports: dict[tuple, list[PooledTransport]] = {}
+		self._connecting: dict[tuple, int] = {}
+		self._counters = {
+			"opened": 0,
+			"reused": 0,
+			"closed_idle": 0,
+			"closed_broken": 0,
+			"failed": 0,
+		}
+
+		self._health_thread = None
+		if health_check_interval > 0:
+			self._health_thread = threading.Thread(
+				target=self._health_check_loop,
+				name="ssh-transport-pool",
+				daemon=True
+			)
+			self._health_thread.start()
+
+	################################
+	#           LEASES             #
+	################################
+
+	def acquire(self, hostname: str, port: int, username: str,
+				password: str = None, ssh_key: bytes = None, ssh_timeouts: dict = None,
+				channels: int = 1, deadline: float = None) -> PooledTransport:
+		"""
+		Reserves channels on a connection to a host, opening a new connection if none has enough free channels.
+		Every call must be paired with a `release` of the same channels, `lease` does it automatically.
+
+		:param channels: How many channels the caller is going to open at the same time
+		:param deadline: The `time.monotonic()` by which the wait for a connection and the connection itself must end
+		:raises paramiko.ssh_exception.AuthenticationException: If the credentials are invalid.
+		:raises ValueError: If no SSH key or password is provided.
+		:raises TimeoutError: If every connection to the host stayed busy for the whole connect timeout,
+		or if the deadline has passed.
+		"""
+		if ssh_timeouts is None:
+			ssh_timeouts = {}
+
+		key = build_transport_key(hostname, port, username, password, ssh_key)
+		channels = min(channels, self.max_channels_per_transport)
+		wait_deadline = time.monotonic() + sum(ssh_timeouts.values()) if ssh_timeouts else None
+		if deadline is not None:
+			wait_deadline = deadline if wait_deadline is None else min(wait_deadline, deadline)
+		broken = []
+		timed_out = False
+
+		with self._condition:
+			while True:
+				pooled_list = self._transports.setdefault(key, [])
+
+				# Drop the connections closed by the host
+				for pooled in [pooled for pooled in pooled_list if not pooled.is_active()]:
+					pooled_list.remove(pooled)
+					broken.append(pooled)
+
+				candidates = [
+					pooled for pooled in pooled_list
+					if pooled.channels + channels <= self.max_channels_per_transport
+				]
+				if candidates:
+					pooled = min(candidates, key=lambda candidate: candidate.channels)
+					pooled.channels += channels
+					pooled.last_used_at = time.monotonic()
+					self._counters["reused"] += 1
+					break
+
+				# One connection at a time is opened to a host, the other requests wait to share it
+				if self._connecting.get(key, 0) == 0 and len(pooled_list) < self.max_transports_per_host:
+					self._connecting[key] = self._connecting.get(key, 0) + 1
+					pooled = None
+					break
+
+				remaining = wait_deadline - time.monotonic() if wait_deadline is not None else None
+				if remaining is not None and remaining <= 0:
+					self._forget_if_unused(key)
+					timed_out = True
+					pooled = None
+					break
+				self._condition.wait(remaining)
+
+			self._counters["closed_broken"] += len(broken)
+
+		for broken_pooled in broken:
+			broken_pooled.client.close()
+
+		if timed_out:
+			raise TimeoutError(f"Every SSH connection to {hostname}:{port} is busy.")
+
+		if pooled is not None:
+			return pooled
+
+		# Connect outside the lock, the other hosts must not wait for this one
+		try:
+			if deadline is not None:
+				ssh_timeouts = fit_ssh_timeouts(ssh_timeouts, deadline - time.monotonic())
+			client = open_ssh_client(hostname, port, username, password, ssh_key, ssh_timeouts)
+		except BaseException:
+			with self._condition:
+				self._connecting[key] -= 1
+				self._counters["failed"] += 1
+				self._forget_if_unused(key)
+				self._condition.notify_all()
+			raise
+
+		pooled = PooledTransport(key, client)
+		pooled.channels = channels
+		with self._condition:
+			self._connecting[key] -= 1
+			self._transports.setdefault(key, []).append(pooled)
+			self._counters["opened"] += 1
+			# The requests waiting for this host can use the free channels of the new connection
+			self._condition.notify_all()
+
+		return pooled
+
+	def release(self, pooled: PooledTransport, channels: int = 1):
+		"""Gives back channels reserved with `acquire`. A connection closed meanwhile is removed from the pool."""
+		channels = min(channels, self.max_channels_per_transport)
+		close = False
+
+		with self._condition:
+			pooled.channels = max(0, pooled.channels - channels)
+			pooled.last_used_at = time.monotonic()
+
+			if not pooled.is_active():
+				close = self._remove(pooled)
+				if close:
+					self._counters["closed_broken"] += 1
+
+			self._condition.notify_all()
+
+		if close:
+			pooled.client.close()
+
+	@contextmanager
+	def lease(self, hostname: str, port: int, username: str,
+			  password: str = None, ssh_key: bytes = None, ssh_timeouts: dict = None,
+			  channels: int = 1, deadline: float = None) -> Iterator[paramiko.Transport]:
+		"""
+		Reserves channels on a connection to a host for the duration of the block (see `acquire`).
+		The channels opened in the block must be closed before leaving it.
+
+		Example:
+		```
+		with pool.lease(hostname, port, username, password) as transport:
+			channel = transport.open_session()
+		```
+		"""
+		pooled = self.acquire(hostname, port, username, password, ssh_key, ssh_timeouts, channels, deadline)
+		try:
+			yield pooled.transport
+		finally:
+			self.release(pooled, channels)
+
+	################################
+	#         MAINTENANCE          #
+	################################
+
+	def _remove(self, pooled: PooledTransport) -> bool:
+		"""Removes a connection from the pool, the lock must be held. Returns whether it was still in the pool."""
+		pooled_list = self._transports.get(pooled.key, [])
+		if pooled not in pooled_list:
+			return False
+
+		pooled_list.remove(pooled)
+		self._forget_if_unused(pooled.key)
+		return True
+
+	def _forget_if_unused(self, key: tuple):
+		"""Drops the entries of a host without connections, the lock must be held."""
+		if len(self._transports.get(key, [])) == 0 and self._connecting.get(key, 0) == 0:
+			self._transports.pop(key, None)
+			self._connecting.pop(key, None)
+
+	def evict_idle(self):
+		"""
+		Closes the connections without open channels that have been idle for too long or have been closed by the host.
+		The other idle connections are sent an SSH_MSG_IGNORE, so that a dead peer is noticed before it is reused.
+		"""
+		now = time.monotonic()
+		to_close = []
+		to_check = []
+
+		with self._condition:
+			for pooled_list in list(self._transports.values()):
+				for pooled in list(pooled_list):
+					if pooled.channels > 0:
+						continue
+					if not pooled.is_active():
+						self._remove(pooled)
+						self._counters["closed_broken"] += 1
+						to_close.append(pooled)
+					elif now - pooled.last_used_at > self.idle_timeout:
+						self._remove(pooled)
+						self._counters["closed_idle"] += 1
+						to_close.append(pooled)
+					else:
+						to_check.append(pooled)
+
+		for pooled in to_check:
+			try:
+				pooled.transport.send_ignore()
+			except Exception:
+				with self._condition:
+					if self._remove(pooled):
+						self._counters["closed_broken"] += 1
+						to_close.append(pooled)
+
+		for pooled in to_close:
+			pooled.client.close()
+
+	def close_all(self):
+		"""Closes every connection, the ones in use included."""
+		with self._condition:
+			pooled_lists = list(self._transports.values())
+			self._transports.clear()
+			self._condition.notify_all()
+
+		for pooled_list in pooled_lists:
+			for pooled in pooled_list:
+				pooled.client.close()
+
+	def stats(self) -> dict:
+		"""Returns a snapshot of the pool counters, for monitoring."""
+		with self._condition:
+			transports = [pooled for pooled_list in self._transports.values() for pooled in pooled_list]
+			return {
+				**self._counters,
+				"hosts": len(self._transports),
+				"transports": len(transports),
+				"channels_in_use": sum(pooled.channels for pooled in transports),
+				"idle_transports": sum(1 for pooled in transports if pooled.channels == 0),
+				"max_channels_per_transport": self.max_channels_per_transport,
+				"max_transports_per_host": self.max_transports_per_host,
+			}
+
+	def _health_check_loop(self):
+		while True:
+			time.sleep(self.health_check_interval)
+			try:
+				self.evict_idle()
+			except Exception:
+				logger.exception("Health check of the SSH transport pool failed")
+
+
+@st.cache_resource
+def get_ssh_transport_pool() -> SSHTransportPool:
+	"""Returns the process-wide pool of SSH connections."""
+	return SSHTransportPool(
+		max_channels_per_transport=int(st.secrets.get("ssh_pool_max_channels_per_transport", 10)),
+		max_transports_per_host=int(st.secrets.get("ssh_pool_max_transports_per_host", 8)),
+		idle_timeout=float(st.secrets.get("ssh_pool_idle_timeout", 300)),
+		health_check_interval=float(st.secrets.get("ssh_pool_health_check_interval", 30)),
+	)
+
+
+def get_ssh_transport_pool_stats() -> dict:
+	"""Returns the counters of the process-wide pool of SSH connections, for monitoring."""
+	return get_ssh_transport_pool().stats()
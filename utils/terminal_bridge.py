@@ -0,0 +1,375 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+import streamlit as st
+import tornado.netutil
+import tornado.web
+import tornado.websocket
+from tornado.httpserver import HTTPServer
+
+from utils.ssh_transport_pool import PooledTransport, SSHTransportPool, get_ssh_transport_pool
+from utils.terminal_connection import get_ssh_timeouts
+
+# How long the input can wait for the SSH window to open, and how often it is checked meanwhile
+INPUT_SEND_TIMEOUT = 30
+INPUT_POLL_INTERVAL = 0.01
+
+
+class BridgeConnection:
+	def __init__(self, hostname: str, port: int, username: str,
+				 password: str = None, ssh_key: bytes = None, lifetime: float = 1800):
+		"""
+		The credentials of a terminal served by the built-in bridge.
+		Like a `connection_uuid` of the SSH module, it can be opened again until it stays unused for its lifetime.
+		:param lifetime: How many seconds the connection can stay unused before it is forgotten
+		"""
+		self.hostname = hostname
+		self.port = port
+		self.username = username
+		self.password = password
+		self.ssh_key = ssh_key
+		self.lifetime = lifetime
+		self.last_used_at = time.monotonic()
+		self.open_websockets = 0
+
+	def is_stale(self, now: float = None) -> bool:
+		"""A connection is stale when no terminal is open on it and it has not been used for its lifetime."""
+		if now is None:
+			now = time.monotonic()
+		return self.open_websockets == 0 and now - self.last_used_at > self.lifetime
+
+
+class TerminalWebSocketHandler(tornado.websocket.WebSocketHandler):
+	"""
+	Streams a PTY between a browser and a VM.
+
+	- Client to server: JSON text messages, `{"input": "..."}` for keystrokes, `{"resize": [cols, rows]}` for the size.
+	- Server to client: binary messages with the raw terminal output.
+	"""
+
+	def initialize(self, bridge):
+		self.bridge: TerminalBridge = bridge
+		self.connection: BridgeConnection | None = None
+		self.pooled_transport: PooledTransport | None = None
+		self.channel: paramiko.Channel | None = None
+		self.output_task: asyncio.Task | None = None
+
+	def check_origin(self, origin):
+		return self.bridge.check_origin(origin)
+
+	async def open(self):
+		self.connection = self.bridge.use_connection(self.get_argument("connection", ""))
+		if self.connection is None:
+			self.close(code=4404, reason="Unknown or expired connection.")
+			return
+
+		self.connection.open_websockets += 1
+		cols = int(self.get_argument("cols", "80"))
+		rows = int(self.get_argument("rows", "24"))
+
+		loop = asyncio.get_running_loop()
+		try:
+			self.pooled_transport, self.channel = await loop.run_in_executor(
+				self.bridge.executor, self.bridge.open_shell, self.connection, cols, rows
+			)
+		except Exception as e:
+			self.close(code=4500, reason=f"Could not connect: {e}"[:120])
+			return
+
+		self.output_task = asyncio.ensure_future(self._pump_output())
+
+	async def _wait_readable(self, fd: int):
+		"""Waits until the channel has data, without keeping the reader registered while the output is sent."""
+		loop = asyncio.get_running_loop()
+		readable = loop.create_future()
+
+		def on_readable():
+			loop.remove_reader(fd)
+			if not readable.done():
+				readable.set_result(None)
+
+		loop.add_reader(fd, on_readable)
+		try:
+			await readable
+		finally:
+			loop.remove_reader(fd)
+
+	async def _pump_output(self):
+		"""
+		Forwards the terminal output to the browser.
+		Each frame is awaited until tornado has flushed it, and nothing more is read from the channel meanwhile:
+		a slow browser makes the SSH window fill up, which in turn pauses the remote process.
+		"""
+		channel = self.channel
+		fd = channel.fileno()
+		max_frame_size = self.bridge.max_frame_size
+
+		try:
+			while True:
+				await self._wait_readable(fd)
+
+				chunks = []
+				size = 0
+				while channel.recv_ready() and size < max_frame_size:
+					chunk = channel.recv(max_frame_size - size)
+					if not chunk:
+						break
+					chunks.append(chunk)
+					size += len(chunk)
+
+				if chunks:
+					await self.write_message(b"".join(chunks), binary=True)
+					self.connection.last_used_at = time.monotonic()
+
+				if not channel.recv_ready() and (channel.closed or channel.eof_received):
+					break
+		except tornado.websocket.WebSocketClosedError:
+			pass
+		finally:
+			self.close(code=1000, reason="The terminal has been closed.")
+
+	async def _send_input(self, data: bytes):
+		"""
+		Sends the input to the non-blocking channel, waiting on the event loop while the SSH window is full.
+		Tornado reads the next message of the browser only after this one, so the input is paused and not buffered.
+		:raises TimeoutError: If the window stays full for `INPUT_SEND_TIMEOUT` seconds
+		:raises EOFError: If the channel is closed before the input is sent
+		"""
+		channel = self.channel
+		deadline = time.monotonic() + INPUT_SEND_TIMEOUT
+		while data:
+			if channel.closed:
+				raise EOFError("The channel has been closed.")
+			if channel.send_ready():
+				data = data[channel.send(data):]
+			elif time.monotonic() > deadline:
+				raise TimeoutError(f"The SSH window stayed full for {INPUT_SEND_TIMEOUT} seconds.")
+			else:
+				await asyncio.sleep(INPUT_POLL_INTERVAL)
+
+	async def on_message(self, message):
+		if self.channel is None:
+			return
+
+		try:
+			payload = json.loads(message)
+		except (TypeError, ValueError):
+			return
+
+		if "input" in payload:
+			data = payload["input"].encode("utf-8")
+			self.connection.last_used_at = time.monotonic()
+
+			try:
+				await self._send_input(data)
+			except (OSError, EOFError):
+				# The window stayed full, or the channel has been closed meanwhile
+				self.close(code=1011, reason="The terminal does not accept input anymore.")
+		elif "resize" in payload:
+			cols, rows = payload["resize"]
+			self.channel.resize_pty(width=int(cols), height=int(rows))
+
+	def on_close(self):
+		if self.connection is not None:
+			self.connection.open_websockets = max(0, self.connection.open_websockets - 1)
+			self.connection.last_used_at = time.monotonic()
+
+		if self.output_task is not None:
+			self.output_task.cancel()
+
+		if self.pooled_transport is not None:
+			try:
+				self.bridge.executor.submit(self.bridge.close_shell, self.pooled_transport, self.channel)
+			except RuntimeError:
+				# The executor has been shut down with the interpreter
+				self.bridge.close_shell(self.pooled_transport, self.channel)
+			self.pooled_transport = None
+
+
+class TerminalBridge:
+	def __init__(self, host: str = "0.0.0.0", port: int = 8765, public_url: str = None,
+				 allowed_origins: list[str] = None, connection_lifetime: float = 1800,
+				 ssh_timeouts: dict = None, transport_pool: SSHTransportPool = None,
+				 max_workers: int = 32, max_frame_size: int = 64 * 1024):
+		"""
+		An asyncio WebSocket server that bridges browser terminals to the VMs through SSH,
+		replacing the external SSH module when `terminal_backend = "builtin"`.
+
+		:param host: The address to listen on
+		:param port: The port to listen on, 0 chooses a free one
+		:param public_url: The WebSocket URL reachable by the browsers (e.g. "ws://localhost:8765")
+		:param allowed_origins: The origins accepted for the WebSocket, all of them if `None`
+		:param connection_lifetime: How many seconds a connection can stay unused before it is forgotten
+		:param ssh_timeouts: The "timeout", "banner_timeout" and "auth_timeout" keyword arguments for paramiko
+		:param transport_pool: The pool of SSH connections the shells are opened on, a new one if `None`
+		:param max_workers: The number of threads used for the blocking SSH handshakes
+		:param max_frame_size: The maximum number of bytes sent to the browser in a single frame
+		"""
+		self.host = host
+		self.port = port
+		self.public_url = public_url
+		self.allowed_origins = allowed_origins
+		self.connection_lifetime = connection_lifetime
+		self.ssh_timeouts = ssh_timeouts or {}
+		self.transport_pool = transport_pool or SSHTransportPool()
+		self.max_frame_size = max_frame_size
+		self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="terminal-bridge")
+
+		self._lock = threading.Lock()
+		self._connections: dict[str, BridgeConnection] = {}
+		self._loop: asyncio.AbstractEventLoop | None = None
+		self._server: HTTPServer | None = None
+
+	################################
+	#           SERVER             #
+	################################
+
+	def start(self) -> "TerminalBridge":
+		"""Starts the server on its own event loop in a daemon thread and waits until it is listening."""
+		started = threading.Event()
+		errors = []
+
+		def run():
+			loop = asyncio.new_event_loop()
+			asyncio.set_event_loop(loop)
+			try:
+				sockets = tornado.netutil.bind_sockets(self.port, address=self.host)
+				application = tornado.web.Application(
+					[(r"/ws", TerminalWebSocketHandler, {"bridge": self})],
+					websocket_ping_interval=20,
+				)
+				self._server = HTTPServer(application)
+				self._server.add_sockets(sockets)
+				self.port = sockets[0].getsockname()[1]
+				self._loop = loop
+			except Exception as e:
+				errors.append(e)
+				started.set()
+				return
+
+			started.set()
+			loop.run_forever()
+
+		threading.Thread(target=run, name="terminal-bridge", daemon=True).start()
+		started.wait()
+
+		if errors:
+			raise errors[0]
+		return self
+
+	def stop(self):
+		"""Stops the server and its event loop."""
+		if self._loop is None:
+			return
+
+		loop = self._loop
+		self._loop = None
+
+		def shutdown():
+			self._server.stop()
+			loop.stop()
+
+		loop.call_soon_threadsafe(shutdown)
+
+	def check_origin(self, origin: str) -> bool:
+		if self.allowed_origins is None:
+			return True
+		return origin in self.allowed_origins
+
+	################################
+	#         CONNECTIONS          #
+	################################
+
+	def register_connection(self, hostname: str, port: int, username: str,
+							password: str = None, ssh_key: bytes = None) -> str:
+		"""
+		Stores the credentials of a new terminal.
+		:return: The id of the connection, to pass to `build_url`
+		"""
+		self.evict_stale()
+		connection_id = str(uuid.uuid4())
+		with self._lock:
+			self._connections[connection_id] = BridgeConnection(
+				hostname, port, username, password, ssh_key, self.connection_lifetime
+			)
+		return connection_id
+
+	def use_connection(self, connection_id: str) -> BridgeConnection | None:
+		"""Returns a connection and marks it as used, or `None` if it is unknown or stale."""
+		self.evict_stale()
+		with self._lock:
+			connection = self._connections.get(connection_id, None)
+			if connection is not None:
+				connection.last_used_at = time.monotonic()
+			return connection
+
+	def has_connection(self, connection_id: str) -> bool:
+		"""Checks whether a connection is still known by the bridge, the equivalent of the modules' liveness check."""
+		return self.use_connection(connection_id) is not None
+
+	def evict_stale(self):
+		"""Forgets the connections, and their credentials, that have not been used for their lifetime."""
+		now = time.monotonic()
+		with self._lock:
+			stale_ids = [key for key, connection in self._connections.items() if connection.is_stale(now)]
+			for key in stale_ids:
+				self._connections.pop(key)
+
+	def build_url(self, connection_id: str) -> str:
+		"""Builds the WebSocket URL of a connection for the browser."""
+		public_url = self.public_url or f"ws://localhost:{self.port}"
+		return f"{public_url.rstrip('/')}/ws?connection={connection_id}"
+
+	def open_shell(self, connection: BridgeConnection, cols: int, rows: int):
+		"""
+		Opens an interactive PTY on a pooled SSH connection. Blocking, runs on the executor.
+		:return: The pooled connection, to give back with `close_shell`, and the shell channel
+		"""
+		pooled = self.transport_pool.acquire(
+			connection.hostname, connection.port, connection.username,
+			connection.password, connection.ssh_key, self.ssh_timeouts
+		)
+
+		try:
+			channel = pooled.transport.open_session(timeout=self.ssh_timeouts.get("timeout", None))
+			channel.get_pty(term="xterm-256color", width=cols, height=rows)
+			channel.invoke_shell()
+			channel.setblocking(False)
+		except Exception:
+			self.transport_pool.release(pooled)
+			raise
+
+		return pooled, channel
+
+	def close_shell(self, pooled: PooledTransport, channel: paramiko.Channel):
+		"""Closes a shell opened with `open_shell`, keeping its SSH connection in the pool."""
+		try:
+			channel.close()
+		finally:
+			self.transport_pool.release(pooled)
+
+
+def is_builtin_terminal_enabled() -> bool:
+	"""Checks whether the terminals are served by the built-in bridge instead of the SSH module."""
+	return st.secrets.get("terminal_backend", "modules") == "builtin"
+
+
+@st.cache_resource
+def get_terminal_bridge() -> TerminalBridge:
+	"""Returns the process-wide built-in terminal bridge, starting it the first time."""
+	allowed_origins = st.secrets.get("terminal_bridge_allowed_origins", None)
+
+	return TerminalBridge(
+		host=st.secrets.get("terminal_bridge_host", "0.0.0.0"),
+		port=int(st.secrets.get("terminal_bridge_port", 8765)),
+		public_url=st.secrets.get("terminal_bridge_public_url", None),
+		allowed_origins=list(allowed_origins) if allowed_origins is not None else None,
+		connection_lifetime=float(st.secrets.get("module_session_lifetime_minutes", 30)) * 60,
+		ssh_timeouts=get_ssh_timeouts(),
+		transport_pool=get_ssh_transport_pool(),
+	).start()
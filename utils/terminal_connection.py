@@ -1,25 +1,34 @@
 import io
-import paramiko
 import requests
 import streamlit as st
 from typing import Literal
 
+from exceptions import ModuleResponseError
+from utils.module_pool import ModuleEndpoint, get_module_pool
+from utils.module_sessions import get_module_session_registry
+from utils.metrics import CONNECT_STAGE_SECONDS, MODULE_HTTP_ERRORS
+from utils.probe_executor import get_probe_executor
+
+# Module instance key of the connections served by the built-in terminal bridge
+BUILTIN_ENDPOINT_KEY = "builtin"
+
 def build_module_url(connection_type: Literal["ssh", "sftp"],
-					 request_type: Literal["credentials", "connection"],
-					 connection_id = None):
-	"""Builds a string to use as URL for the connection with an ID."""
+					 request_type: Literal["credentials", "connection", "liveness"],
+					 connection_id = None,
+					 endpoint: ModuleEndpoint = None):
+	"""
+	Builds a string to use as URL for the connection with an ID.
+
+	:param endpoint: The module instance to build the URL for, the first configured instance if `None`
+	"""
+	if endpoint is None:
+		endpoint = get_module_pool(connection_type).endpoints[0]
+
 	url_format: str = st.secrets[f'{connection_type}_{request_type}_request_format']
 
-	if connection_type == "ssh":
-		url_format = (url_format
-					  .replace("$SSH_URL", st.secrets["ssh_module_url"])
-					  .replace("$SSH_PORT", st.secrets["ssh_module_port"]))
-	else:
-		url_format = (url_format
-					  .replace("$SFTP_URL", st.secrets["sftp_module_url"])
-					  .replace("$SFTP_PORT", st.secrets["sftp_module_port"]))
+	url_format = endpoint.format_url(url_format)
 
-	if request_type == "connection" and connection_id:
+	if request_type in ("connection", "liveness") and connection_id:
 		return url_format.replace("$CONNECTION_ID", connection_id)
 	else:
 		return url_format
@@ -29,6 +38,9 @@ def load_private_key(key_str):
 	"""
 	Automatically identifies the type of ssh key.
 	"""
+	# Imported on the first use, it is slow to import and most pages never need it
+	import paramiko
+
 	key_file = io.StringIO(key_str)
 	for key_class in (paramiko.RSAKey, paramiko.DSSKey, paramiko.ECDSAKey, paramiko.Ed25519Key):
 		try:
@@ -38,49 +50,71 @@ def load_private_key(key_str):
 	raise ValueError("Key format not valid (RSA, DSS, ECDSA, ED25519).")
 
 
+def get_ssh_timeouts() -> dict:
+	"""
+	Reads the SSH timeouts (in seconds) from the secrets, falling back to the defaults.
+	:return: A dict with the "timeout", "banner_timeout" and "auth_timeout" keyword arguments for paramiko.
+	"""
+	return {
+		"timeout": float(st.secrets.get("ssh_connect_timeout", 10)),
+		"banner_timeout": float(st.secrets.get("ssh_banner_timeout", 10)),
+		"auth_timeout": float(st.secrets.get("ssh_auth_timeout", 10)),
+	}
+
+
+def connect_with_paramiko(hostname: str, port: int, username: str,
+						  password: str = None, ssh_key: bytes = None, pool=None):
+	"""
+	Makes a connection to the target host to test if the connection and credentials are working.
+	The authenticated connection is kept in the SSH transport pool, so that the next operations on the VM reuse it,
+	and a channel is opened on it to make sure the host is still answering.
+	Blocks the calling thread, use `test_connection_with_paramiko` from the Streamlit script.
+	:param pool: The `SSHTransportPool` to use, the process-wide one if `None`
+	:raises paramiko.ssh_exception.AuthenticationException: If the credentials are invalid.
+	:raises ValueError: If no SSH key or password is provided.
+	"""
+	if pool is None:
+		from utils.ssh_transport_pool import get_ssh_transport_pool
+		pool = get_ssh_transport_pool()
+
+	ssh_timeouts = get_ssh_timeouts()
+	with pool.lease(hostname, port, username, password, ssh_key, ssh_timeouts) as transport:
+		transport.open_session(timeout=ssh_timeouts["timeout"]).close()
+
+
 def test_connection_with_paramiko(hostname: str, port: int, username: str,
 								  password: str = None, ssh_key: bytes = None):
 	"""
-	Makes a connection to the target host to test if the connection and credentials are working.
+	Tests the connection and credentials on the shared SSH probe executor.
+	The wait is bounded by the sum of the connect, banner and auth timeouts.
 	:raises paramiko.ssh_exception.AuthenticationException: If the credentials are invalid.
 	:raises ValueError: If no SSH key or password is provided.
+	:raises TimeoutError: If the remote server did not answer in time.
+	:raises ProbeExecutorSaturatedError: If too many probes are already in progress.
 	"""
-	ssh_client = paramiko.SSHClient()
-	ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+	from utils.ssh_transport_pool import get_ssh_transport_pool
 
-	try:
-		if ssh_key:
-			# Prioritize SSH key
-			private_key = load_private_key(ssh_key.decode("utf-8"))
-			ssh_client.connect(
-				hostname=hostname,
-				port=port,
-				username=username,
-				pkey=private_key
-			)
-		elif password:
-			ssh_client.connect(
-				hostname=hostname,
-				port=port,
-				username=username,
-				password=password
-			)
-		else:
-			raise ValueError("No SSH key or password provided.")
-	except Exception as e:
-		# Throw the Exception
-		raise e
-	finally:
-		# Close the client in all cases
-		ssh_client.close()
+	with CONNECT_STAGE_SECONDS.labels("ssh_probe").time():
+		return get_probe_executor().run(
+			connect_with_paramiko,
+			hostname=hostname,
+			port=port,
+			username=username,
+			password=password,
+			ssh_key=ssh_key,
+			pool=get_ssh_transport_pool(),
+			timeout=sum(get_ssh_timeouts().values()),
+		)
 
 
 def send_credentials_to_external_module(module_type: Literal["ssh", "sftp"],
 										hostname: str, port: int, username: str,
-										password: str = None, ssh_key: bytes = None):
+										password: str = None, ssh_key: bytes = None,
+										endpoint: ModuleEndpoint = None):
 	"""
 	Tests the SSH connection using provided credentials and returns the url to the browser terminal.
 
+	:param endpoint: The module instance to send the credentials to, the first configured instance if `None`
 	:return: The json response as a dict, can contain "url" or "error"
 	:raises AuthenticationException: If the credentials are incorrect
 	:raises Exception: Other connection issues
@@ -88,9 +122,12 @@ def send_credentials_to_external_module(module_type: Literal["ssh", "sftp"],
 	module_url = build_module_url(
 		connection_type=module_type,
 		request_type="credentials",
+		endpoint=endpoint,
 	)
 
 	module_response = None
+	# An instance that never answers must not block the script thread
+	timeout = float(st.secrets.get("module_request_timeout", 10))
 
 	# Make the correct request body
 	if ssh_key:
@@ -98,6 +135,7 @@ def send_credentials_to_external_module(module_type: Literal["ssh", "sftp"],
 			# Send a request to alfresco-ssh
 			module_response = requests.post(
 				url=module_url,
+				timeout=timeout,
 				data={
 					"hostname": hostname,
 					"username": username,
@@ -111,6 +149,7 @@ def send_credentials_to_external_module(module_type: Literal["ssh", "sftp"],
 			# Send a request to alfresco-sftp
 			module_response = requests.post(
 				url=module_url,
+				timeout=timeout,
 				json={
 					"name": f"{username}@{hostname}:{port}",
 					"host": hostname,
@@ -124,6 +163,7 @@ def send_credentials_to_external_module(module_type: Literal["ssh", "sftp"],
 			# Send a request to alfresco-ssh
 			module_response = requests.post(
 				url=module_url,
+				timeout=timeout,
 				json={
 					"hostname": hostname,
 					"username": username,
@@ -135,6 +175,7 @@ def send_credentials_to_external_module(module_type: Literal["ssh", "sftp"],
 			# Send a request to alfresco-sftp
 			module_response = requests.post(
 				url=module_url,
+				timeout=timeout,
 				json={
 					"name": f"{username}@{hostname}:{port}",
 					"host": hostname,
@@ -150,3 +191,129 @@ def send_credentials_to_external_module(module_type: Literal["ssh", "sftp"],
 		return module_response.json()
 	else:
 		raise Exception(f"No request was sent to the {module_type} module.")
+
+
+def request_module_connection(module_type: Literal["ssh", "sftp"], vm_id: int,
+							  hostname: str, port: int, username: str,
+							  password: str = None, ssh_key: bytes = None) -> tuple[str, ModuleEndpoint]:
+	"""
+	Sends the credentials to an instance of a module chosen by the module pool and returns the id of the new connection.
+	An instance that cannot be reached is drained from the pool and the next one is tried.
+
+	:param vm_id: The id of the VM, used to route the connection
+	:return: The `connection_uuid` returned by the module and the instance that has created it
+	:raises ModuleResponseError: If the module answered with an error
+	:raises requests.exceptions.ConnectionError: If no instance of the module could be reached
+	:raises requests.exceptions.Timeout: If no instance of the module could be reached and the last one did not answer in time
+	"""
+	pool = get_module_pool(module_type)
+	active_connections = get_module_session_registry().count_connections(module_type)
+	failed_keys = set()
+
+	while True:
+		endpoint = pool.choose(vm_id, active_connections, exclude_keys=failed_keys)
+
+		try:
+			with CONNECT_STAGE_SECONDS.labels(f"{module_type}_module").time():
+				module_response = send_credentials_to_external_module(
+					module_type=module_type,
+					hostname=hostname,
+					port=port,
+					username=username,
+					password=password,
+					ssh_key=ssh_key,
+					endpoint=endpoint
+				)
+		except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+			# A connect timeout is both, it is counted as unreachable
+			reason = "unreachable" if isinstance(e, requests.exceptions.ConnectionError) else "timeout"
+			MODULE_HTTP_ERRORS.labels(module_type, reason).inc()
+			pool.mark_unhealthy(endpoint)
+			failed_keys.add(endpoint.key)
+			if len(failed_keys) >= len(pool.endpoints):
+				raise
+		else:
+			break
+
+	if not ("success" in module_response and module_response["success"]):
+		MODULE_HTTP_ERRORS.labels(module_type, "error_response").inc()
+		raise ModuleResponseError(
+			module_name=module_type.upper(),
+			message=module_response.get("error", "Unknown error.")
+		)
+
+	return module_response["connection_uuid"], endpoint
+
+
+def build_connection_url(module_type: Literal["ssh", "sftp"], connection_id: str, endpoint_key: str = None) -> str:
+	"""
+	Builds the URL to embed in the terminal page for a connection,
+	on the module instance that has opened it or on the built-in terminal bridge.
+	"""
+	if endpoint_key == BUILTIN_ENDPOINT_KEY:
+		# Imported here because the bridge depends on this module
+		from utils.terminal_bridge import get_terminal_bridge
+		return get_terminal_bridge().build_url(connection_id)
+
+	endpoint = get_module_pool(module_type).get(endpoint_key) if endpoint_key is not None else None
+
+	return build_module_url(
+		connection_type=module_type,
+		request_type="connection",
+		connection_id=connection_id,
+		endpoint=endpoint
+	)
+
+
+def is_liveness_check_enabled(module_type: Literal["ssh", "sftp"]) -> bool:
+	"""
+	Whether the connections of a module can be checked, and so reused.
+	The page of a connection cannot be used for the check, since it is served even for the expired connections.
+	"""
+	return bool(st.secrets.get(f'{module_type}_liveness_request_format', ""))
+
+
+def is_module_connection_alive(module_type: Literal["ssh", "sftp"], connection_id: str,
+							   endpoint_key: str = None) -> bool:
+	"""
+	Cheaply checks whether a connection previously opened on a module is still alive,
+	with a short timeout so that an unreachable module does not block the page.
+
+	:param endpoint_key: The key of the module instance that has opened the connection
+	:return: `True` if the module answered successfully for the connection,
+	`False` otherwise or if the module has no liveness request
+	"""
+	if endpoint_key == BUILTIN_ENDPOINT_KEY:
+		# Imported here because the bridge depends on this module
+		from utils.terminal_bridge import get_terminal_bridge
+		return get_terminal_bridge().has_connection(connection_id)
+
+	if not is_liveness_check_enabled(module_type):
+		return False
+
+	if endpoint_key is None:
+		endpoint = None
+	else:
+		endpoint = get_module_pool(module_type).get(endpoint_key)
+		if endpoint is None:
+			# The instance has been removed from the configuration
+			return False
+
+	liveness_url = build_module_url(
+		connection_type=module_type,
+		request_type="liveness",
+		connection_id=connection_id,
+		endpoint=endpoint
+	)
+
+	try:
+		response = requests.get(
+			url=liveness_url,
+			timeout=float(st.secrets.get("module_liveness_timeout", 2)),
+			allow_redirects=False
+		)
+	except requests.exceptions.RequestException:
+		MODULE_HTTP_ERRORS.labels(module_type, "liveness_unreachable").inc()
+		return False
+
+	return response.ok
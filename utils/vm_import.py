@@ -0,0 +1,516 @@
+import csv
+import io
+import json
+import posixpath
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import IO, Iterator, Literal, Callable
+
+import streamlit as st
+import yaml
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from backend.database import get_db
+from backend.models import User, VirtualMachine
+from backend.role import Role
+from exceptions import ProbeExecutorSaturatedError
+from utils.probe_executor import get_probe_executor
+from utils.ssh_transport_pool import get_ssh_transport_pool
+from utils.terminal_connection import connect_with_paramiko
+
+VM_IMPORT_COLUMNS = ["name", "host", "port", "username", "password", "ssh_key_file", "shared", "assigned_to"]
+
+# Same limits as the columns of the virtual_machines table
+MAX_TEXT_LENGTH = 50
+MAX_ENCRYPTED_PASSWORD_LENGTH = 128
+MAX_SSH_KEY_SIZE = 64 * 1024
+
+# The bytes that are not valid UTF-8, kept as lone surrogates by the "surrogateescape" error handler
+UNDECODABLE_BYTES = re.compile("[\udc80-\udcff]")
+INVALID_UTF8_ERROR = "The record is not valid UTF-8."
+
+TRUE_VALUES = {"true", "yes", "y", "1"}
+FALSE_VALUES = {"false", "no", "n", "0"}
+
+# Seconds between two attempts when the SSH probe executor is saturated by the probes of the other users
+PROBE_RETRY_INTERVAL = 0.1
+
+
+class ImportRow:
+	def __init__(self, row: int, name: str, host: str, port: int, username: str,
+				 password: str = None, ssh_key: bytes = None, shared: bool = True, assigned_to: str = None):
+		"""
+		A validated VM of an import file, still with its plain credentials.
+		:param row: The position of the VM in the file, starting from 1
+		"""
+		self.row = row
+		self.name = name
+		self.host = host
+		self.port = port
+		self.username = username
+		self.password = password
+		self.ssh_key = ssh_key
+		self.shared = shared
+		self.assigned_to = assigned_to
+
+		self.encrypted_password: str | None = None
+		self.encrypted_ssh_key: bytes | None = None
+
+	def to_insert_values(self, user_id: int) -> dict:
+		"""The values of the row for `insert(VirtualMachine)`, the credentials must be encrypted already."""
+		return {
+			"name": self.name,
+			"host": self.host,
+			"port": self.port,
+			"username": self.username,
+			"password": self.encrypted_password,
+			"ssh_key": self.encrypted_ssh_key,
+			"shared": self.shared,
+			"assigned_to": self.assigned_to,
+			"user_id": user_id,
+		}
+
+
+class ImportRowError:
+	def __init__(self, row: int, name: str | None, message: str):
+		"""A VM of an import file that has not been imported."""
+		self.row = row
+		self.name = name
+		self.message = message
+
+
+class ImportReport:
+	def __init__(self):
+		"""The outcome of an import: how many VMs have been added and why the others have not."""
+		self.imported = 0
+		self.errors: list[ImportRowError] = []
+
+	def add_error(self, row: int, name: str | None, message: str):
+		self.errors.append(ImportRowError(row, name, message))
+
+	def errors_csv(self) -> str:
+		"""The errors as a CSV file, to fix the rows and import them again."""
+		output = io.StringIO()
+		writer = csv.writer(output)
+		writer.writerow(["row", "name", "error"])
+		for error in sorted(self.errors, key=lambda e: e.row):
+			writer.writerow([error.row, error.name or "", error.message])
+		return output.getvalue()
+
+
+################################
+#           PARSING            #
+################################
+
+def detect_import_format(file_name: str) -> Literal["csv", "yaml", "jsonl"]:
+	"""Guesses the format of an import file from its extension."""
+	extension = posixpath.splitext(file_name.lower())[1]
+	if extension == ".csv":
+		return "csv"
+	if extension in (".yaml", ".yml"):
+		return "yaml"
+	if extension in (".jsonl", ".ndjson"):
+		return "jsonl"
+	raise ValueError(f"Unsupported file type `{extension}`, use CSV, YAML or JSON Lines.")
+
+
+def has_undecodable_bytes(record: dict) -> bool:
+	"""Whether a record read with the "surrogateescape" error handler contains bytes that are not valid UTF-8."""
+	return any(
+		isinstance(value, str) and UNDECODABLE_BYTES.search(value)
+		for item in record.items() for value in item
+	)
+
+
+def iter_import_records(data: IO[bytes],
+						file_format: Literal["csv", "yaml", "jsonl"]) -> Iterator[tuple[int, dict | ValueError]]:
+	"""
+	Reads the records of an import file one at a time, without loading the whole file.
+	A record that can not be read is yielded as a `ValueError`, so that the next ones are still imported.
+	When the rest of the file can not be read at all (a YAML syntax error), the error is yielded as the next record
+	and the reading stops there, the records before it are still imported.
+
+	- CSV: a header with the column names, then a VM for each line
+	- JSON Lines: a JSON object for each line
+	- YAML: a list of objects, a `vms` key with a list of objects, or one object for each document
+
+	:return: The position of each record (starting from 1) and the record
+	:raises ValueError: If the header of a CSV file can not be read
+	"""
+	# The invalid bytes are kept and reported with their record, instead of failing the rest of the file
+	text = io.TextIOWrapper(data, encoding="utf-8-sig", errors="surrogateescape",
+							newline="" if file_format == "csv" else None)
+
+	if file_format == "csv":
+		reader = csv.DictReader(text)
+		try:
+			fieldnames = reader.fieldnames
+		except csv.Error as e:
+			raise ValueError(f"The header can not be read: {e}.")
+		if fieldnames is not None and UNDECODABLE_BYTES.search("".join(fieldnames)):
+			raise ValueError("The header is not valid UTF-8.")
+
+		row = 0
+		while True:
+			try:
+				record = next(reader)
+			except StopIteration:
+				return
+			except csv.Error as e:
+				# The reader starts again from the next line
+				row += 1
+				yield row, ValueError(f"Invalid CSV: {e}.")
+				continue
+
+			row += 1
+			if None in record:
+				yield row, ValueError("The line has more values than the header.")
+			elif has_undecodable_bytes(record):
+				yield row, ValueError(INVALID_UTF8_ERROR)
+			else:
+				yield row, record
+
+	elif file_format == "jsonl":
+		row = 0
+		for line in text:
+			if not line.strip():
+				continue
+			row += 1
+			if UNDECODABLE_BYTES.search(line):
+				yield row, ValueError(INVALID_UTF8_ERROR)
+				continue
+			try:
+				record = json.loads(line)
+			except json.JSONDecodeError as e:
+				yield row, ValueError(f"Invalid JSON: {e.msg}.")
+				continue
+			yield row, record if isinstance(record, dict) else ValueError("The line is not a JSON object.")
+
+	elif file_format == "yaml":
+		row = 0
+		documents = yaml.safe_load_all(text)
+		while True:
+			try:
+				document = next(documents)
+			except StopIteration:
+				return
+			except yaml.YAMLError as e:
+				# A YAML stream can not be resumed after a syntax error (the invalid bytes are one too)
+				yield row + 1, ValueError(f"Invalid YAML, the rest of the file has been skipped: {e}")
+				return
+
+			if isinstance(document, dict) and isinstance(document.get("vms", None), list):
+				document = document["vms"]
+			for record in document if isinstance(document, list) else [document]:
+				if record is None:
+					continue
+				row += 1
+				yield row, record if isinstance(record, dict) else ValueError("The item is not a mapping.")
+
+	else:
+		raise ValueError(f"Unsupported import format `{file_format}`.")
+
+
+def read_key_file(key_archive: zipfile.ZipFile | None, key_file: str) -> bytes:
+	"""Reads an SSH key from the archive, by its path or just its file name."""
+	if key_archive is None:
+		raise ValueError(f"The key file `{key_file}` is referenced, but no key archive has been uploaded.")
+
+	names = key_archive.namelist()
+	if key_file in names:
+		member = key_file
+	else:
+		matches = [name for name in names if posixpath.basename(name) == posixpath.basename(key_file)]
+		if len(matches) != 1:
+			raise ValueError(f"The key file `{key_file}` is {'ambiguous' if matches else 'not'} in the archive.")
+		member = matches[0]
+
+	if key_archive.getinfo(member).file_size > MAX_SSH_KEY_SIZE:
+		raise ValueError(f"The key file `{key_file}` is too big.")
+
+	return key_archive.read(member)
+
+
+def parse_import_record(row: int, record: dict, key_archive: zipfile.ZipFile | None,
+						assignable_users: set[str] | None) -> ImportRow:
+	"""
+	Validates a record of an import file.
+	:param assignable_users: The users VMs can be assigned to, `None` if the importer can not assign VMs
+	:raises ValueError: If the record is not valid, with the reason
+	"""
+	# The values are left as they are, passwords may start or end with spaces
+	record = {str(key).strip().lower(): value for key, value in record.items()}
+
+	def text_field(field: str, required: bool) -> str | None:
+		value = record.get(field, None)
+		if isinstance(value, str):
+			value = value.strip()
+		if value is None or value == "":
+			if required:
+				raise ValueError(f"The field `{field}` is required.")
+			return None
+		value = str(value)
+		if len(value) > MAX_TEXT_LENGTH:
+			raise ValueError(f"The field `{field}` is longer than {MAX_TEXT_LENGTH} characters.")
+		return value
+
+	name = text_field("name", required=True)
+	host = text_field("host", required=True)
+	username = text_field("username", required=True)
+	assigned_to = text_field("assigned_to", required=False)
+
+	port = record.get("port", None)
+	if port is None or str(port).strip() == "":
+		port = 22
+	try:
+		port = int(str(port).strip())
+	except (TypeError, ValueError):
+		raise ValueError(f"The port `{port}` is not a number.")
+	if not 1 <= port <= 65535:
+		raise ValueError(f"The port `{port}` is out of range.")
+
+	shared = record.get("shared", None)
+	if shared is None or str(shared).strip() == "":
+		shared = True
+	elif not isinstance(shared, bool):
+		if str(shared).strip().lower() in TRUE_VALUES:
+			shared = True
+		elif str(shared).strip().lower() in FALSE_VALUES:
+			shared = False
+		else:
+			raise ValueError(f"The field `shared` must be true or false, not `{shared}`.")
+
+	password = record.get("password", None)
+	password = str(password) if password not in (None, "") else None
+
+	ssh_key = None
+	if str(record.get("ssh_key_file", None) or "").strip():
+		ssh_key = read_key_file(key_archive, str(record["ssh_key_file"]).strip())
+	elif record.get("ssh_key", None):
+		# Inline keys, handy in YAML with a block scalar
+		ssh_key = str(record["ssh_key"]).encode("utf-8")
+
+	if assigned_to is not None:
+		if assignable_users is None:
+			raise ValueError("You can not assign VMs to other users.")
+		if assigned_to not in assignable_users:
+			raise ValueError(f"The user `{assigned_to}` does not exist or can not be assigned VMs.")
+		shared = True  # Like in the assign VM form
+
+	return ImportRow(row, name, host, port, username, password, ssh_key, shared, assigned_to)
+
+
+################################
+#     ENCRYPTION AND PROBES    #
+################################
+
+def encrypt_import_row(import_row: ImportRow) -> ImportRow:
+	"""Encrypts the credentials of a row, like the add VM form does. Runs on the worker pool."""
+	if import_row.password:
+		import_row.encrypted_password = VirtualMachine.encrypt_password(import_row.password)
+		if len(import_row.encrypted_password) > MAX_ENCRYPTED_PASSWORD_LENGTH:
+			raise ValueError("The password is too long to be stored.")
+
+	if import_row.ssh_key:
+		import_row.encrypted_ssh_key = VirtualMachine.encrypt_key(import_row.ssh_key)
+
+	return import_row
+
+
+def probe_import_row(import_row: ImportRow, pool) -> ImportRow:
+	"""Tests the connection to the VM of a row with its credentials. Runs on the SSH probe executor."""
+	if not import_row.password and not import_row.ssh_key:
+		raise ValueError("The connection can not be tested without a password or an SSH key.")
+
+	connect_with_paramiko(
+		import_row.host, import_row.port, import_row.username,
+		import_row.password, import_row.ssh_key, pool=pool
+	)
+	return import_row
+
+
+def run_on_rows(rows: list[ImportRow], function: Callable, max_workers: int, report: ImportReport,
+				on_progress: Callable = None, stage: str = None) -> list[ImportRow]:
+	"""
+	Runs a function on every row concurrently, keeping the rows that succeeded (in their original order)
+	and reporting the others.
+	"""
+	if len(rows) == 0:
+		return []
+
+	succeeded = {}
+	with ThreadPoolExecutor(max_workers=min(max_workers, len(rows)), thread_name_prefix="vm-import") as executor:
+		futures = {executor.submit(function, import_row): import_row for import_row in rows}
+		for done, future in enumerate(as_completed(futures), start=1):
+			import_row = futures[future]
+			try:
+				succeeded[import_row.row] = future.result()
+			except Exception as e:
+				report.add_error(import_row.row, import_row.name, str(e) or type(e).__name__)
+
+			if on_progress is not None:
+				on_progress(stage, done, len(rows))
+
+	return [import_row for import_row in rows if import_row.row in succeeded]
+
+
+def probe_rows(rows: list[ImportRow], pool, max_in_flight: int, report: ImportReport,
+			   on_progress: Callable = None) -> list[ImportRow]:
+	"""
+	Tests the connection of every row on the shared SSH probe executor, like every other SSH probe,
+	keeping the rows that succeeded (in their original order) and reporting the others.
+	At most `max_in_flight` probes of the import are in the executor at a time, so that the connection tests
+	of the other users still find a free place in it. When they saturate it, the import waits instead of failing.
+	"""
+	executor = get_probe_executor()
+	max_in_flight = max(1, min(max_in_flight, executor.max_workers))
+	pending = deque(rows)
+	futures = {}
+	succeeded = {}
+	done = 0
+
+	while pending or futures:
+		while pending and len(futures) < max_in_flight:
+			try:
+				future = executor.submit(probe_import_row, pending[0], pool)
+			except ProbeExecutorSaturatedError:
+				break
+			futures[future] = pending.popleft()
+
+		if not futures:
+			# The executor is full of the probes of the other users
+			time.sleep(PROBE_RETRY_INTERVAL)
+			continue
+
+		finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+		for future in finished:
+			import_row = futures.pop(future)
+			try:
+				succeeded[import_row.row] = future.result()
+			except Exception as e:
+				report.add_error(import_row.row, import_row.name, str(e) or type(e).__name__)
+
+			done += 1
+			if on_progress is not None:
+				on_progress("probe", done, len(rows))
+
+	return [import_row for import_row in rows if import_row.row in succeeded]
+
+
+################################
+#            INSERT            #
+################################
+
+def insert_import_rows(rows: list[ImportRow], user_id: int, batch_size: int, report: ImportReport,
+					   on_progress: Callable = None) -> int:
+	"""
+	Inserts the rows in a single transaction, with a multi-row INSERT for each batch.
+	Each batch runs in a savepoint: if it fails, its rows are inserted one by one to report only the bad ones.
+	:return: The number of inserted VMs
+	"""
+	inserted = 0
+
+	with get_db() as db:
+		try:
+			for start in range(0, len(rows), batch_size):
+				batch = rows[start:start + batch_size]
+
+				try:
+					with db.begin_nested():
+						db.execute(insert(VirtualMachine), [import_row.to_insert_values(user_id) for import_row in batch])
+					inserted += len(batch)
+				except SQLAlchemyError:
+					for import_row in batch:
+						try:
+							with db.begin_nested():
+								db.execute(insert(VirtualMachine), [import_row.to_insert_values(user_id)])
+							inserted += 1
+						except SQLAlchemyError as e:
+							report.add_error(import_row.row, import_row.name, f"Database error: {getattr(e, 'orig', None) or e}")
+
+				if on_progress is not None:
+					on_progress("insert", min(start + batch_size, len(rows)), len(rows))
+
+			db.commit()
+		except Exception:
+			db.rollback()
+			raise
+
+	return inserted
+
+
+def import_vms(data: IO[bytes], file_name: str, owner_username: str, owner_role: Role,
+			   key_archive: IO[bytes] = None, probe: bool = False,
+			   on_progress: Callable[[str, int, int], None] = None) -> ImportReport:
+	"""
+	Imports many VMs at once from a CSV, YAML or JSON Lines file (see `VM_IMPORT_COLUMNS`).
+	The VMs that are not valid, or fail the connection test, are reported without stopping the others.
+
+	:param data: The import file
+	:param file_name: The name of the import file, its extension tells the format
+	:param owner_username: The user that will own the VMs
+	:param owner_role: The role of the owner, only admins and managers can assign VMs
+	:param key_archive: A zip archive with the SSH keys referenced by the `ssh_key_file` column
+	:param probe: Whether to test the connection to each VM before importing it
+	:param on_progress: Called with the stage ("parse", "encrypt", "probe" or "insert"), the done and the total rows
+	(0 while parsing, since the total is not known yet)
+	:raises ValueError: If the file can not be imported at all
+	"""
+	encrypt_workers = int(st.secrets.get("vm_import_encrypt_workers", 4))
+	probe_workers = int(st.secrets.get("vm_import_probe_workers", 32))
+	batch_size = int(st.secrets.get("vm_import_batch_size", 500))
+
+	file_format = detect_import_format(file_name)
+	report = ImportReport()
+
+	with get_db() as db:
+		user_id = db.query(User.id).filter(User.username == owner_username).scalar()
+		if user_id is None:
+			raise ValueError(f"The user `{owner_username}` does not exist.")
+
+		assignable_users = None
+		if owner_role in (Role.ADMIN, Role.MANAGER):
+			# Same users as the assign VM form
+			excluded_roles = [Role.NEW_USER.value, Role.ADMIN.value, Role.MANAGER.value]
+			assignable_users = {
+				username for (username,) in db.query(User.username).filter(User.role.notin_(excluded_roles))
+			}
+
+	try:
+		archive = zipfile.ZipFile(key_archive) if key_archive is not None else None
+	except zipfile.BadZipFile:
+		raise ValueError("The key archive is not a valid zip file.")
+
+	# Parse
+	rows = []
+	try:
+		for row, record in iter_import_records(data, file_format):
+			if isinstance(record, ValueError):
+				report.add_error(row, None, str(record))
+				continue
+
+			try:
+				rows.append(parse_import_record(row, record, archive, assignable_users))
+			except ValueError as e:
+				report.add_error(row, record.get("name", None), str(e))
+
+			if on_progress is not None and row % 100 == 0:
+				on_progress("parse", row, 0)
+	finally:
+		if archive is not None:
+			archive.close()
+
+	# Encrypt and test
+	rows = run_on_rows(rows, encrypt_import_row, encrypt_workers, report, on_progress, "encrypt")
+
+	if probe:
+		pool = get_ssh_transport_pool()
+		rows = probe_rows(rows, pool, probe_workers, report, on_progress)
+
+	# Insert
+	report.imported = insert_import_rows(rows, user_id, batch_size, report, on_progress)
+	return report